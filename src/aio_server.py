@@ -0,0 +1,303 @@
+import signal
+import asyncio
+import logging
+import grpc
+
+import image_pb2, image_pb2_grpc
+import utils.stream_utils as stream_utils
+import utils.admission as admission
+import utils.cancellation as cancellation
+import utils.scheduler as scheduler
+
+class AsyncImageServiceServicer(image_pb2_grpc.ImageServiceServicer):
+    '''
+    Provides methods that implement functionality of image_pb2_grpc.ImageServiceServicer on a grpc.aio server.
+
+    Requests are received and responses are sent on the asyncio event loop, while pixel work is run by an
+    ImageServiceServicer in a separate executor. Slow uploads and downloads only hold the event loop between
+    messages, so the number of open connections is independent of the number of requests being computed.
+    Invalid requests are aborted with an INVALID_ARGUMENT status code, and requests rejected by admission control
+    with a RESOURCE_EXHAUSTED status code. Requests wait for memory, and for a compute slot of the scheduler,
+    in the executor, never on the event loop. Images held in shared memory are opened in the executor too,
+    see ImageServiceServicer.run_local.
+    Each request is watched by a RequestMonitor registered on its context, so work running in the executor stops
+    at the next row band once the client cancels or the deadline passes, even though the executor thread
+    itself cannot be interrupted.
+
+    ...
+
+    Attributes
+    ----------
+    servicer : ImageServiceServicer
+        Servicer whose methods perform the pixel work of each request.
+    executor : concurrent.futures.Executor
+        Executor that the pixel work of each request is run in.
+
+    Methods
+    -------
+    RotateImage(request, context):
+        Rotates and returns Image.
+    MeanFilter(request, context):
+        Applies mean filter to and returns Image.
+    MeanFilterRadius(request, context):
+        Applies mean filter of the requested radius to and returns Image.
+    Convolve(request, context):
+        Convolves Image with the requested kernel, and returns the result.
+    ProcessImage(request, context):
+        Applies list of operations to Image in a fused pipeline, and returns the result.
+    RotateImageStream(request_iterator, context):
+        Rotates Image received as chunked stream, and returns it as chunked stream.
+    MeanFilterStream(request_iterator, context):
+        Applies mean filter to Image received as chunked stream, and returns it as chunked stream.
+    RotateImageBands(request, context):
+        Rotates Image, and streams back each row band of the result as soon as it is computed.
+    MeanFilterBands(request, context):
+        Applies mean filter to Image, and streams back each row band of the result as soon as it is computed.
+    BatchProcess(request, context):
+        Applies operations to a batch of Images concurrently, and streams back a result per Image.
+    '''
+
+    def __init__(self, servicer, executor):
+        self.servicer = servicer
+        self.executor = executor
+
+    async def run(self, function, *args):
+        '''
+        Runs function with args in the executor, and returns its result without blocking the event loop.
+        '''
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def acquire_memory(self, cost):
+        '''
+        Acquires cost bytes of the admission budget in the executor without blocking the event loop.
+
+        If the request is cancelled while it waits, the memory is released as soon as the wait in the executor ends,
+        since the executor thread cannot be interrupted and would otherwise acquire memory that is never released.
+        '''
+
+        def release(future):
+            if not future.cancelled() and future.exception() is None:
+                self.servicer.admission.release(cost)
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.servicer.admission.acquire, cost)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(release)
+            raise
+
+    async def abort(self, context, ex):
+        '''
+        Logs error and aborts the request with the status code of ex, see admission.get_status.
+        '''
+        code, message = admission.get_status(ex)
+        logging.error(message)
+        await context.abort(code, message)
+
+    async def run_unary(self, context, function, *args):
+        '''
+        Runs function with args in the executor, and returns its result.
+
+        If function raises one of admission.REQUEST_ERRORS, the request is aborted with its status code.
+        '''
+        try:
+            return await self.run(function, *args)
+        except admission.REQUEST_ERRORS as ex:
+            await self.abort(context, ex)
+
+    async def run_generator(self, context, generator):
+        '''
+        Async generator that computes each item of a generator in the executor, and yields it on the event loop.
+
+        If generator raises one of admission.REQUEST_ERRORS, the request is aborted with its status code.
+        The generator is closed when the request ends, so the memory it holds against the admission budget is released,
+        unless it is still running in the executor, in which case it is released when the generator is garbage collected.
+        '''
+        try:
+            while True:
+                response = await self.run(next, generator, None)
+                if response is None:
+                    break
+                yield response
+        except admission.REQUEST_ERRORS as ex:
+            await self.abort(context, ex)
+        finally:
+            if not generator.gi_running:
+                generator.close()
+
+    async def process_stream(self, processor_class, stage_type, request_iterator, context):
+        '''
+        Async generator that passes the row bands of a chunked image stream to a stream processor as they arrive,
+        and yields the ImageChunks it returns.
+
+        Chunks are received on the event loop, and only the processing of each row band is run in the executor.
+        If the header or any row band is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        The working memory estimated from the header is acquired from the admission budget in the executor before
+        the processor is created, and released when the stream ends, see acquire_memory.
+        The processor stops before the next row band, or before the end of the stream is processed, once the client
+        cancels or the deadline passes.
+        '''
+        monitor = cancellation.monitor_async_context(context)
+        header = None
+        processor = None
+        next_row = 0
+        cost = 0
+
+        try:
+            async for chunk in request_iterator:
+                if processor is None:
+                    header = stream_utils.get_header(chunk)
+                    if self.servicer.admission is not None:
+                        estimate = admission.estimate_stream_memory(header, stage_type)
+                        await self.acquire_memory(estimate)
+                        cost = estimate
+                    processor = processor_class(header, monitor.check)
+                    for response in processor.start():
+                        yield response
+                else:
+                    band = stream_utils.get_row_band(chunk, header, next_row)
+                    for response in await self.run(processor.process, next_row, band):
+                        yield response
+                    next_row += band.shape[0]
+
+            if processor is None:
+                stream_utils.get_header(None)
+            if next_row != header.height:
+                raise ValueError('Image stream ended before all rows were received')
+
+            for response in await self.run(processor.finish):
+                yield response
+        except admission.REQUEST_ERRORS as ex:
+            await self.abort(context, ex)
+        finally:
+            if cost:
+                self.servicer.admission.release(cost)
+
+    async def RotateImage(self, request, context):
+        '''
+        Rotates and returns Image, running the rotation in the executor.
+        '''
+        monitor = cancellation.monitor_async_context(context)
+        priority = scheduler.get_context_priority(context)
+        return await self.run_unary(context, self.servicer.run_local, context.peer(), request.image, lambda image: self.servicer.run_profiled(
+            'RotateImage', image, self.servicer.rotate_image, image, request.rotation, monitor, priority))
+
+    async def MeanFilter(self, request, context):
+        '''
+        Applies mean filter and returns Image, running the filter in the executor.
+        '''
+        monitor = cancellation.monitor_async_context(context)
+        priority = scheduler.get_context_priority(context)
+        return await self.run_unary(context, self.servicer.run_local, context.peer(), request, lambda image: self.servicer.run_profiled(
+            'MeanFilter', image, self.servicer.mean_filter, image, 1, monitor, priority))
+
+    async def MeanFilterRadius(self, request, context):
+        '''
+        Applies mean filter of the requested radius and returns Image, running the filter in the executor.
+        '''
+        monitor = cancellation.monitor_async_context(context)
+        priority = scheduler.get_context_priority(context)
+        return await self.run_unary(context, self.servicer.run_local, context.peer(), request.image, lambda image: self.servicer.run_profiled(
+            'MeanFilterRadius', image, self.servicer.mean_filter, image, request.radius or 1, monitor, priority))
+
+    async def Convolve(self, request, context):
+        '''
+        Convolves Image with the requested kernel and returns the result, running the convolution in the executor.
+        '''
+        operations = [image_pb2.Operation(type=image_pb2.Operation.Type.CONVOLVE, kernel=request.kernel)]
+        monitor = cancellation.monitor_async_context(context)
+        priority = scheduler.get_context_priority(context)
+        return await self.run_unary(context, self.servicer.run_local, context.peer(), request.image,
+                                    lambda image: self.servicer.apply_operations(image, operations, monitor, priority))
+
+    async def ProcessImage(self, request, context):
+        '''
+        Applies list of operations to Image in order and returns the result, running the pipeline in the executor.
+        '''
+        monitor = cancellation.monitor_async_context(context)
+        priority = scheduler.get_context_priority(context)
+        return await self.run_unary(context, self.servicer.run_local, context.peer(), request.image,
+                                    lambda image: self.servicer.apply_operations(image, request.operations, monitor, priority))
+
+    async def RotateImageStream(self, request_iterator, context):
+        '''
+        Rotates Image received as a header followed by row bands, and yields it back in the same format.
+        '''
+        async for response in self.process_stream(stream_utils.RotateStreamProcessor, image_pb2.Operation.Type.ROTATE, request_iterator, context):
+            yield response
+
+    async def MeanFilterStream(self, request_iterator, context):
+        '''
+        Applies mean filter to Image received as a header followed by row bands, and yields it back in the same format.
+        '''
+        async for response in self.process_stream(stream_utils.MeanFilterStreamProcessor, image_pb2.Operation.Type.MEAN_FILTER, request_iterator, context):
+            yield response
+
+    async def RotateImageBands(self, request, context):
+        '''
+        Rotates Image, and yields the header of the result followed by its row bands as each band is computed.
+        '''
+        generator = self.servicer.rotate_image_bands(request.image, request.rotation, cancellation.monitor_async_context(context))
+        async for response in self.run_generator(context, generator):
+            yield response
+
+    async def MeanFilterBands(self, request, context):
+        '''
+        Applies mean filter of the requested radius to Image, and yields the header of the result followed by
+        its row bands as each band is computed.
+        '''
+        generator = self.servicer.mean_filter_bands(request.image, request.radius or 1, cancellation.monitor_async_context(context))
+        async for response in self.run_generator(context, generator):
+            yield response
+
+    async def BatchProcess(self, request, context):
+        '''
+        Applies the operations of each BatchItem to its Image, and yields a BatchResult per item in completion order.
+
+        Items are run concurrently in the executor, and items that have not finished are cancelled
+        if the client disconnects, stopping at their next row band if they are already running.
+        '''
+        monitor = cancellation.monitor_async_context(context)
+        priority = scheduler.get_context_priority(context)
+        tasks = [asyncio.ensure_future(self.run(self.servicer.process_batch_item, index, item, monitor, priority))
+                 for index, item in enumerate(request.items)]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+async def serve_async(address, servicer, executor, interceptors=(), compression=None, options=(), drain_seconds=None,
+                      local_address=None):
+    '''
+    Runs a grpc.aio server at address, and at local_address if given, until it is terminated.
+
+    With drain_seconds, SIGTERM stops the server after letting requests in flight finish for up to that many seconds.
+
+        Parameters:
+            address (str): Address formed by host and port to listen on
+            servicer (ImageServiceServicer): Servicer that performs the pixel work of each request
+            executor (concurrent.futures.Executor): Executor that the pixel work of each request is run in
+            interceptors (list): grpc.aio.ServerInterceptors that every request passes through
+            compression (grpc.Compression): Optional channel-level compression of responses
+            options (list): Channel arguments of the server, as (key, value) pairs
+            drain_seconds (float): Seconds requests in flight are given to finish after SIGTERM, or None
+            local_address (str): Optional 'unix:' address of a Unix domain socket to listen on as well
+        Returns:
+            None
+    '''
+    server = grpc.aio.server(interceptors=interceptors, options=options, compression=compression)
+    image_pb2_grpc.add_ImageServiceServicer_to_server(
+        AsyncImageServiceServicer(servicer, executor), server
+    )
+    server.add_insecure_port(address)
+    if local_address is not None:
+        server.add_insecure_port(local_address)
+    await server.start()
+    if drain_seconds is not None:
+        stopping = []
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: stopping.append(asyncio.ensure_future(server.stop(drain_seconds))))
+    await server.wait_for_termination()
@@ -0,0 +1,121 @@
+import sys
+import logging
+
+import image_pb2
+from server import ImageServiceServicer
+import utils.argument_parser as argument_parser
+import utils.image_utils as image_utils
+import utils.stream_utils as stream_utils
+import utils.benchmark_utils as benchmark_utils
+
+# Max image size of operations that loop over pixels in Python, which take minutes and gigabytes of memory
+# on the largest images - lifted with --no-size-limits
+SIZE_LIMITS = {'get_pixels_buffer': 1024}
+
+def get_operation(name, servicer, image):
+    '''
+    Returns function with no arguments that runs the named operation on Image in-process
+
+    RotateImage and MeanFilter call the servicer methods directly, without a network connection. Images larger than
+    the max gRPC message size are sent through RotateImageStream and MeanFilterStream instead, as client.py does,
+    with the request chunks prepared up front and the response chunks reassembled into an Image.
+
+        Parameters:
+            name (str): Name of the operation, one of benchmark_utils.OPERATIONS
+            servicer (ImageServiceServicer): Servicer to call
+            image (Image): gRPC Image object to run the operation on
+        Returns:
+            (function): Function that runs the operation once
+    '''
+    is_streamed = len(image.data) > image_utils.MAX_IMAGE_SIZE
+
+    if name == 'RotateImage' and is_streamed:
+        chunks = list(stream_utils.image_to_chunks(image, image_pb2.ImageRotateRequest.Rotation.NINETY_DEG))
+        return lambda: stream_utils.chunks_to_image(servicer.RotateImageStream(iter(chunks), None))
+    elif name == 'RotateImage':
+        request = image_pb2.ImageRotateRequest(rotation=image_pb2.ImageRotateRequest.Rotation.NINETY_DEG, image=image)
+        return lambda: servicer.RotateImage(request, None)
+    elif name == 'MeanFilter' and is_streamed:
+        chunks = list(stream_utils.image_to_chunks(image))
+        return lambda: stream_utils.chunks_to_image(servicer.MeanFilterStream(iter(chunks), None))
+    elif name == 'MeanFilter':
+        return lambda: servicer.MeanFilter(image, None)
+    elif name == 'get_pixels_buffer':
+        img = image_utils.image_to_pil_image(image)
+        return lambda: image_utils.get_pixels_buffer(img)
+    else:
+        return lambda: image_utils.image_to_pil_image(image)
+
+def run_benchmarks(operations, sizes, modes, repeats, max_seconds, measure_memory=True, size_limits=SIZE_LIMITS):
+    '''
+    Runs each operation on a random image of each size and mode, and returns the results
+
+        Parameters:
+            operations (list): Names of the operations to run
+            sizes (list): Widths and heights in pixels of the square test images
+            modes (list): Image modes to run, from 'L', 'RGB', and 'RGBA'
+            repeats (int): Max number of timed calls per case
+            max_seconds (float): Time budget in seconds of the timed calls of each case
+            measure_memory (bool): True to record the peak memory of each case
+            size_limits (dict): Max image size of each operation - larger cases are skipped
+        Returns:
+            (dict): Dictionary of environment and results, in the format written by benchmark_utils.save_results
+    '''
+    servicer = ImageServiceServicer()
+    results = []
+
+    for size in sizes:
+        for mode in modes:
+            image = benchmark_utils.make_test_image(size, mode)
+            for name in operations:
+                if size > size_limits.get(name, size):
+                    continue
+                result = benchmark_utils.measure(get_operation(name, servicer, image), repeats, max_seconds, measure_memory)
+                result.update({'operation': name, 'mode': mode, 'size': size})
+                results.append(result)
+                print_result(result)
+
+    return {'environment': benchmark_utils.get_environment(), 'results': results}
+
+def print_result(result):
+    '''
+    Prints one line summarising a benchmark result
+    '''
+    peak = 'n/a' if result['peak_bytes'] is None else '{:.1f} MiB'.format(result['peak_bytes'] / 1048576)
+    print('{:<36} median {:>10.3f} ms   p95 {:>10.3f} ms   peak {:>12}   runs {}'.format(
+        benchmark_utils.get_case_name(result), result['median'] * 1000, result['p95'] * 1000, peak, result['runs']))
+
+def run():
+    '''
+    Runs benchmark.py.
+
+    Parses arguments passed into benchmark.py. If --sizes, --repeats, --max-seconds, or --threshold is invalid,
+    ArgumentParser.error() is triggered and program exits.
+    Runs the selected operations in-process on random images of each size and mode, prints the median and p95 time
+    and peak memory of each case, and writes the results to --output as JSON.
+    If --baseline is given, the results are compared with the baseline results, and the program exits with an error
+    if the median time of any case is more than --threshold slower.
+    '''
+    args_parser = argument_parser.get_benchmark_args_parser()
+    args = args_parser.parse_args()
+
+    if any(size <= 0 for size in args.sizes):
+        args_parser.error("Invalid sizes - use positive integer values")
+    if args.repeats <= 0 or args.max_seconds <= 0:
+        args_parser.error("Invalid repeats or max seconds - use positive values")
+    if args.threshold < 0:
+        args_parser.error("Invalid threshold " + str(args.threshold) + " - use a non-negative value")
+
+    results = run_benchmarks(args.operations, args.sizes, args.modes, args.repeats, args.max_seconds,
+                             measure_memory=not args.no_memory, size_limits={} if args.no_size_limits else SIZE_LIMITS)
+    benchmark_utils.save_results(results, args.output)
+
+    if args.baseline is not None:
+        regressions = benchmark_utils.compare_results(results, benchmark_utils.load_results(args.baseline), args.threshold)
+        for name, before, after in regressions:
+            logging.error('Regression in {} - median {:.3f} ms, baseline {:.3f} ms'.format(name, after * 1000, before * 1000))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import logging
+import threading
+from concurrent import futures
+import grpc
+
+import image_pb2_grpc
+import client
+import interceptors
+import utils.argument_parser as argument_parser
+import utils.image_utils as image_utils
+import utils.codec as codec
+import utils.bulk_utils as bulk_utils
+
+def process_file(stub, input_path, output_path, args, rpc_slots, journal, error_report):
+    '''
+    Loads, processes, and saves one file, and records it in the journal or the error report
+
+    The file is loaded and its result is saved on the calling worker thread, and only the RPC holds one of the
+    rpc_slots, so other files are loaded and saved while RPCs are in flight. Results are written to a temporary file
+    in the output directory and renamed into place, so an interrupted run never leaves a partial output file.
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            input_path (str): Path of the input file
+            output_path (str): Path to write the result to
+            args (argparse.Namespace): Arguments of bulk_client.py
+            rpc_slots (threading.Semaphore): Semaphore bounding the number of RPCs in flight
+            journal (LineWriter): Journal that completed input paths are appended to
+            error_report (LineWriter): Error report that failures are appended to
+        Returns:
+            (bool): True if the file was processed, False if it failed
+    '''
+    stage = 'load'
+    try:
+        image = client.load_image(input_path, codec.get_file_encoding(output_path), args.quality, args.encoded)
+
+        stage = 'rpc'
+        with rpc_slots:
+            image = client.process(stub, image, args.rotate, args.mean, args.radius)
+
+        stage = 'save'
+        directory, name = os.path.split(output_path)
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, '.partial-' + name)
+        image_utils.save_image(image, temp_path)
+        os.replace(temp_path, output_path)
+    except grpc.RpcError as ex:
+        error_report.write(bulk_utils.format_error(input_path, stage, ex.code().name, ex.details() or ''))
+        return False
+    except (ValueError, OSError) as ex:
+        error_report.write(bulk_utils.format_error(input_path, stage, type(ex).__name__, str(ex)))
+        return False
+
+    journal.write(input_path)
+    return True
+
+def run_bulk(stub, inputs, args, journal, error_report):
+    '''
+    Processes every input file, and returns the number that were processed and that failed
+
+    Files are processed by args.concurrency + args.workers worker threads, with at most args.concurrency RPCs in flight.
+    Only a bounded number of files are queued at a time, so memory use does not grow with the number of inputs.
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            inputs (list): List of (input path, output path) tuples
+            args (argparse.Namespace): Arguments of bulk_client.py
+            journal (LineWriter): Journal that completed input paths are appended to
+            error_report (LineWriter): Error report that failures are appended to
+        Returns:
+            (tuple): (processed, failed) counts
+    '''
+    rpc_slots = threading.Semaphore(args.concurrency)
+    num_threads = args.concurrency + args.workers
+    processed = failed = 0
+
+    with futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending = set()
+        for input_path, output_path in inputs:
+            if len(pending) >= 2 * num_threads:
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                processed += sum(future.result() for future in done)
+                failed += sum(not future.result() for future in done)
+            pending.add(executor.submit(process_file, stub, input_path, output_path, args, rpc_slots, journal, error_report))
+
+        for future in futures.as_completed(pending):
+            processed += future.result()
+            failed += not future.result()
+
+    return processed, failed
+
+def run():
+    '''
+    Runs bulk_client.py.
+
+    Parses and validates arguments passed into bulk_client.py. If arguments are invalid, ArgumentParser.error() is triggered.
+    Collects the image files in the --input directory or glob pattern, or listed in --manifest, and applies --mean
+    and/or --rotate to each over one channel, writing the results to --output-dir with the same relative paths.
+    Completed inputs are appended to a journal in --output-dir, and with --resume, inputs already in the journal
+    are skipped. Failed inputs are appended to an error report in --output-dir as JSON lines of the input path,
+    stage, status code, and error message, and the program exits with an error if any input failed.
+    With --priority, requests are sent with that priority class in their metadata, e.g. low for background jobs.
+    '''
+    args_parser = argument_parser.get_bulk_args_parser()
+    args = args_parser.parse_args()
+
+    if args.rotate is None and args.mean is False:
+        args_parser.error("Cannot omit both --rotate and --mean flags - at least one must be present")
+    if not args.port.isdigit() or int(args.port) > 65535:
+        args_parser.error("Invalid port number " + args.port + " - use a positive integer value less than 65535")
+    if args.radius < 1 or args.radius > 15:
+        args_parser.error("Invalid radius " + str(args.radius) + " - use an integer value from 1 to 15")
+    if args.quality < 0 or args.quality > 100:
+        args_parser.error("Invalid quality " + str(args.quality) + " - use an integer value from 0 to 100")
+    if args.concurrency <= 0 or args.workers < 0:
+        args_parser.error("Invalid concurrency or workers - use a positive concurrency and non-negative workers")
+
+    extension = '.' + args.format if args.format is not None else None
+    if args.manifest is not None:
+        try:
+            inputs = bulk_utils.read_manifest(args.manifest, args.output_dir, extension)
+        except (ValueError, OSError) as ex:
+            args_parser.error("Invalid manifest - " + str(ex))
+    else:
+        inputs = bulk_utils.find_inputs(args.input, args.output_dir, extension)
+    if not inputs:
+        args_parser.error("No .png, .jpg, .jpeg, or .webp files found")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    journal_path = os.path.join(args.output_dir, bulk_utils.JOURNAL_NAME)
+    error_path = os.path.join(args.output_dir, bulk_utils.ERROR_REPORT_NAME)
+    if args.resume:
+        done = bulk_utils.read_journal(journal_path)
+        remaining = [(input_path, output_path) for input_path, output_path in inputs if input_path not in done]
+    else:
+        remaining = inputs
+        for path in [journal_path, error_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    channel = grpc.insecure_channel(args.host + ':' + args.port, compression=codec.CHANNEL_COMPRESSION[args.compression])
+    try:
+        grpc.channel_ready_future(channel).result(timeout=10)
+    except grpc.FutureTimeoutError:
+        logging.error("Failed to connect to remote host: Connection refused - incorrect address")
+        sys.exit(1)
+
+    journal = bulk_utils.LineWriter(journal_path)
+    error_report = bulk_utils.LineWriter(error_path)
+    started = time.perf_counter()
+    try:
+        stub_channel = channel
+        if args.priority is not None:
+            stub_channel = grpc.intercept_channel(channel, interceptors.PriorityInterceptor(args.priority))
+        processed, failed = run_bulk(image_pb2_grpc.ImageServiceStub(stub_channel), remaining, args, journal, error_report)
+    finally:
+        journal.close()
+        error_report.close()
+        channel.close()
+    elapsed = time.perf_counter() - started
+
+    print('Processed {} files, skipped {} already done, {} failed in {:.1f} s ({:.1f} files/s)'.format(
+        processed, len(inputs) - len(remaining), failed, elapsed, processed / elapsed if elapsed else 0.0))
+    if failed:
+        logging.error(str(failed) + ' files failed - see ' + error_path)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
@@ -1,12 +1,17 @@
+import os
 import sys
 import logging
 import grpc
 from PIL import Image
 
 import image_pb2, image_pb2_grpc
+import interceptors
 
 import utils.argument_parser as argument_parser
 import utils.image_utils as image_utils
+import utils.stream_utils as stream_utils
+import utils.codec as codec
+import utils.local_transport as local_transport
 
 def rotate_image(stub, image, rotation):
     '''
@@ -22,18 +27,237 @@ def rotate_image(stub, image, rotation):
     image_rotate_request = image_pb2.ImageRotateRequest(rotation=rotation, image=image)
     return stub.RotateImage(image_rotate_request)
 
-def mean_filter(stub, image):
+def mean_filter(stub, image, radius=1):
     '''
-    Makes call to MeanFilter method in ImageService server, and returns value from this endpoint
+    Makes call to MeanFilter method in ImageService server, or to MeanFilterRadius if radius is not 1,
+    and returns value from this endpoint
 
         Parameters:
             stub (ImageServiceStub): Stub for connecting to grpc ImageService server
             image (Image): Image object representing image of which to apply mean filter
+            radius (int): Number of neighbors either side of each pixel to average over
         Returns:
             (Image): Image object of mean filtered image argument
     '''
-    return stub.MeanFilter(image)
+    if radius == 1:
+        return stub.MeanFilter(image)
+    return stub.MeanFilterRadius(image_pb2.MeanFilterRequest(image=image, radius=radius))
 
+def convolve(stub, image, kernel):
+    '''
+    Makes call to Convolve method in ImageService server, and returns value from this endpoint
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to convolve
+            kernel (Kernel): Kernel object describing a named or explicit kernel
+        Returns:
+            (Image): Image object of convolved image
+    '''
+    return stub.Convolve(image_pb2.ConvolveRequest(image=image, kernel=kernel))
+
+def rotate_image_stream(stub, image, rotation):
+    '''
+    Makes call to RotateImageStream method in ImageService server, sending and receiving Image as chunked streams
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to rotate, which may be larger than the max gRPC message size
+            rotation (str): ImageRotateRequest.Rotation Enum string representing rotation type
+        Returns:
+            (Image): Image of rotated image
+    '''
+    return stream_utils.chunks_to_image(stub.RotateImageStream(stream_utils.image_to_chunks(image, rotation)))
+
+def mean_filter_stream(stub, image):
+    '''
+    Makes call to MeanFilterStream method in ImageService server, sending and receiving Image as chunked streams
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to mean filter, which may be larger than the max gRPC message size
+        Returns:
+            (Image): Image object of mean filtered image argument
+    '''
+    return stream_utils.chunks_to_image(stub.MeanFilterStream(stream_utils.image_to_chunks(image)))
+
+def rotate_image_bands(stub, image, rotation):
+    '''
+    Makes call to RotateImageBands method in ImageService server, and returns iterator of the response as it arrives
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to rotate
+            rotation (str): ImageRotateRequest.Rotation Enum string representing rotation type
+        Returns:
+            (iterator): Iterator of ImageChunks holding the header of the rotated image followed by its row bands,
+                        which can be assembled with stream_utils.chunks_to_image
+    '''
+    return stub.RotateImageBands(image_pb2.ImageRotateRequest(rotation=rotation, image=image))
+
+def mean_filter_bands(stub, image, radius=1):
+    '''
+    Makes call to MeanFilterBands method in ImageService server, and returns iterator of the response as it arrives
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to mean filter
+            radius (int): Number of neighbors either side of each pixel to average over
+        Returns:
+            (iterator): Iterator of ImageChunks holding the header of the filtered image followed by its row bands,
+                        which can be assembled with stream_utils.chunks_to_image
+    '''
+    return stub.MeanFilterBands(image_pb2.MeanFilterRequest(image=image, radius=radius))
+
+def process_image(stub, image, operations):
+    '''
+    Makes call to ProcessImage method in ImageService server, and returns value from this endpoint
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to process
+            operations (list): List of Operation objects to apply to image in order
+        Returns:
+            (Image): Image object of processed image
+    '''
+    return stub.ProcessImage(image_pb2.ProcessImageRequest(image=image, operations=operations))
+
+def get_operations(rotation, mean, radius=1):
+    '''
+    Returns list of Operation objects applying the mean filter and then the rotation, in the order client.py applies them
+
+        Parameters:
+            rotation (str): ImageRotateRequest.Rotation Enum string representing rotation type, or None to skip rotation
+            mean (bool): True to apply mean filter
+            radius (int): Number of neighbors either side of each pixel the mean filter averages over
+        Returns:
+            operations (list): List of Operation objects
+    '''
+    operations = []
+    if mean:
+        operations.append(image_pb2.Operation(type=image_pb2.Operation.Type.MEAN_FILTER, radius=radius))
+    if rotation is not None:
+        operations.append(image_pb2.Operation(type=image_pb2.Operation.Type.ROTATE, rotation=rotation))
+    return operations
+
+def batch_process(stub, items):
+    '''
+    Makes call to BatchProcess method in ImageService server, and returns iterator of results as they complete
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            items (list): List of (image, operations) tuples, where image is an Image object
+                          and operations is a list of Operation objects to apply to it in order
+        Returns:
+            (iterator): Iterator of BatchResult objects in completion order, with index set to the item's position in items
+    '''
+    batch_items = [image_pb2.BatchItem(image=image, operations=operations) for image, operations in items]
+    return stub.BatchProcess(image_pb2.BatchRequest(items=batch_items))
+
+def process_unary(stub, image, rotation, mean, radius=1):
+    '''
+    Applies mean filter and/or rotation to Image with unary calls, and returns the result
+
+    When both are requested, both are applied in a single call to the ProcessImage endpoint.
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to process
+            rotation (str): ImageRotateRequest.Rotation Enum string, or None to skip rotation
+            mean (bool): True to apply mean filter
+            radius (int): Number of neighbors either side of each pixel the mean filter averages over
+        Returns:
+            (Image): Image object of processed image
+    '''
+    if mean and rotation in image_pb2.ImageRotateRequest.Rotation.keys():
+        return process_image(stub, image, get_operations(rotation, mean, radius))
+    elif mean:
+        return mean_filter(stub, image, radius)
+    return rotate_image(stub, image, rotation)
+
+def is_streamed(image):
+    '''
+    Returns True if Image is sent to the chunked streaming endpoints by process, that is if it is a raw image larger
+    than stream_utils.STREAM_THRESHOLD bytes.
+
+        Parameters:
+            image (Image): Image object to process, as returned by load_image
+        Returns:
+            (bool): True if image is streamed
+    '''
+    return image.encoding == image_pb2.Image.Encoding.RAW and len(image.data) > stream_utils.STREAM_THRESHOLD
+
+def process(stub, image, rotation, mean, radius=1):
+    '''
+    Applies mean filter and/or rotation to Image, and returns the result
+
+    Raw images larger than stream_utils.STREAM_THRESHOLD bytes are sent to the chunked streaming endpoints,
+    which only support a mean filter radius of 1, and other images are sent with process_unary.
+    Raises ValueError if a streamed image is mean filtered with a radius other than 1.
+
+        Parameters:
+            stub (ImageServiceStub): Stub for connecting to grpc ImageService server
+            image (Image): Image object to process, as returned by load_image
+            rotation (str): ImageRotateRequest.Rotation Enum string, or None to skip rotation
+            mean (bool): True to apply mean filter
+            radius (int): Number of neighbors either side of each pixel the mean filter averages over
+        Returns:
+            (Image): Image object of processed image
+    '''
+    if not is_streamed(image):
+        return process_unary(stub, image, rotation, mean, radius)
+
+    if mean and radius != 1:
+        raise ValueError('images larger than the max message size only support radius 1')
+    if mean:
+        image = mean_filter_stream(stub, image)
+    if rotation in image_pb2.ImageRotateRequest.Rotation.keys():
+        image = rotate_image_stream(stub, image, rotation)
+    return image
+
+def process_shared(stub, image, rotation, mean, radius=1):
+    '''
+    Applies mean filter and/or rotation to Image with unary calls over the server's Unix domain socket, and returns the result
+
+    The data of Image is sent in a shared memory segment instead of in the request, and the result is read from
+    the segment the response refers to, which is unlinked once it has been read. Images are not limited by the max
+    message size, since no Image data is sent in messages.
+
+        Parameters:
+            stub (ImageServiceStub): Stub connected to the Unix domain socket of the ImageService server
+            image (Image): Image object to process, as returned by load_image
+            rotation (str): ImageRotateRequest.Rotation Enum string, or None to skip rotation
+            mean (bool): True to apply mean filter
+            radius (int): Number of neighbors either side of each pixel the mean filter averages over
+        Returns:
+            (Image): Image object of processed image
+    '''
+    with local_transport.share_image(image) as shared:
+        return local_transport.read_image(process_unary(stub, shared, rotation, mean, radius))
+
+def load_image(path, response_encoding=image_pb2.Image.Encoding.RAW, response_quality=0, encoded=False):
+    '''
+    Returns Image to send for an image file
+
+    With encoded set, files up to the max message size are sent as-is, and request their result in response_encoding
+    at response_quality. Other files are decoded, and converted to 'L', 'RGB', or 'RGBA' pixels.
+
+        Parameters:
+            path (str): Path of a PNG, JPEG, or WebP file
+            response_encoding (Image.Encoding): Encoding to request the result of an encoded file in
+            response_quality (int): JPEG or WebP quality to request the result of an encoded file in, or 0 for the default
+            encoded (bool): True to send the file without decoding it
+        Returns:
+            (Image): Image object of the file
+    '''
+    if encoded and os.path.getsize(path) <= image_utils.MAX_IMAGE_SIZE:
+        return codec.file_to_image(path, response_encoding, response_quality)
+
+    with Image.open(path) as img:
+        mode = codec.get_decoded_mode(img)
+        if img.mode != mode:
+            img = img.convert(mode)
+        return image_pb2.Image(color=mode != 'L', data=img.tobytes(), width=img.width, height=img.height)
 
 def run():
     '''
@@ -42,37 +266,69 @@ def run():
     Parses and validates arguments passed into client.py. If arguments are invalid, ArgumentParser.error() is triggered.
     Arguments are invalid if:
         - Both --rotate and --mean flags are omitted.
-        - --input or --output arguments are not valid .png, .jpg, or .jpeg file paths.
-        - --port is an invalid port number.
+        - --input or --output arguments are not valid .png, .jpg, .jpeg, or .webp file paths.
+        - --port is an invalid port number, or --host or --port is omitted without --unix-socket.
+        - --radius is outside 1 to 15, or is not 1 for an image sent to the streaming endpoints.
+        - --quality is outside 0 to 100.
     Connects client ImageServiceStub to ImageService service if host and port form correct address, otherwise exits and logs error.
     If connection is made, Image is created from input image, endpoints are called on this Image, and result is saved to output path.
+    If the server rejects the request, the status code and error message are logged, and the program exits with an error.
+    If the image cannot be processed otherwise, for instance a shared memory result is invalid, the error message is
+    logged and the program exits with an error.
+    When both --mean and --rotate are present, both are applied in a single call to the ProcessImage endpoint.
+    Images larger than stream_utils.STREAM_THRESHOLD bytes are sent to the chunked streaming endpoints instead.
+    With --encoded, the input file is sent as-is and the result is returned encoded in the format of the output path,
+    at --quality, and written to the output path without decoding it. Files larger than the max message size are
+    sent as pixels instead.
+    With --compression, requests are compressed at the gRPC channel level with gzip or deflate.
+    With --priority, requests are sent with that priority class in their metadata, see utils/scheduler.py.
+    With --unix-socket, the client connects to the server's Unix domain socket instead of --host and --port,
+    and the input and result are passed in shared memory, see process_shared.
     '''
     args_parser = argument_parser.get_client_args_parser()
     args = args_parser.parse_args()
 
     if args.rotate is None and args.mean is False:
         args_parser.error("Cannot omit both --rotate and --mean flags - at least one must be present")
-    if not args.input.lower().endswith(('.png', '.jpg', '.jpeg')):
-        args_parser.error("Invalid input - image file must have extension .png, .jpg, or .jpeg")
-    if not args.output.lower().endswith(('.png', '.jpg', '.jpeg')):
-        args_parser.error("Invalid output - file path must have extension .png, .jpg, or .jpeg")
-    if not args.port.isdigit() or int(args.port) > 65535:
+    if codec.get_file_encoding(args.input) is None:
+        args_parser.error("Invalid input - image file must have extension .png, .jpg, .jpeg, or .webp")
+    if codec.get_file_encoding(args.output) is None:
+        args_parser.error("Invalid output - file path must have extension .png, .jpg, .jpeg, or .webp")
+    if args.unix_socket is None and (args.host is None or args.port is None):
+        args_parser.error("--host and --port are required unless --unix-socket is given")
+    if args.port is not None and (not args.port.isdigit() or int(args.port) > 65535):
         args_parser.error("Invalid port number " + args.port + " - use a positive integer value less than 65535")
+    if args.radius < 1 or args.radius > 15:
+        args_parser.error("Invalid radius " + str(args.radius) + " - use an integer value from 1 to 15")
+    if args.quality < 0 or args.quality > 100:
+        args_parser.error("Invalid quality " + str(args.quality) + " - use an integer value from 0 to 100")
 
     try:
-        with grpc.insecure_channel(args.host + ':' + args.port) as channel:
+        target = 'unix:' + args.unix_socket if args.unix_socket is not None else args.host + ':' + args.port
+        with grpc.insecure_channel(target, compression=codec.CHANNEL_COMPRESSION[args.compression]) as channel:
+            if args.priority is not None:
+                channel = grpc.intercept_channel(channel, interceptors.PriorityInterceptor(args.priority))
             stub = image_pb2_grpc.ImageServiceStub(channel)
 
-            img = Image.open(args.input)
-            image = image_utils.pil_image_to_image(img)
+            image = load_image(args.input, codec.get_file_encoding(args.output), args.quality, args.encoded)
+            if args.unix_socket is None and args.mean and args.radius != 1 and is_streamed(image):
+                args_parser.error("Invalid radius - images larger than the max message size only support --radius 1")
+            try:
+                if args.unix_socket is not None:
+                    image = process_shared(stub, image, args.rotate, args.mean, args.radius)
+                else:
+                    image = process(stub, image, args.rotate, args.mean, args.radius)
+            except ValueError as ex:
+                logging.error("Failed to process image - " + str(ex))
+                sys.exit(1)
 
-            if args.mean:
-                image = mean_filter(stub, image)
-            
-            if args.rotate in image_pb2.ImageRotateRequest.Rotation.keys():
-                image = rotate_image(stub, image, args.rotate)
-        
             image_utils.save_image(image, args.output)
+    except grpc.RpcError as ex:
+        if ex.code() == grpc.StatusCode.UNAVAILABLE:
+            logging.error("Failed to connect to remote host: Connection refused - incorrect address")
+        else:
+            logging.error("Request failed with " + ex.code().name + " - " + str(ex.details()))
+        sys.exit(1)
     except Exception:
         logging.error("Failed to connect to remote host: Connection refused - incorrect address")
         sys.exit(1)
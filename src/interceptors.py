@@ -0,0 +1,240 @@
+import time
+import collections
+import grpc
+
+import utils.scheduler as scheduler
+
+class MetricsRecorder:
+    '''
+    Records the latency, status code, message sizes, and in-flight count of RPCs in a ServerMetrics.
+
+    Shared by MetricsInterceptor and AsyncMetricsInterceptor.
+
+    ...
+
+    Attributes
+    ----------
+    metrics : ServerMetrics
+        Metrics that RPCs are recorded in.
+
+    Methods
+    -------
+    start(method):
+        Records the start of an RPC, and returns its start time.
+    finish(method, started, context, code=None):
+        Records the end of an RPC.
+    '''
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def start(self, method):
+        '''
+        Records the start of an RPC of method, and returns its start time.
+        '''
+        self.metrics.in_flight.inc(method)
+        return time.perf_counter()
+
+    def finish(self, method, started, context, code=None):
+        '''
+        Records the end of an RPC of method that started at started.
+
+        The status code is the one set on context by abort() or set_code(), or code if none was set.
+        '''
+        self.metrics.rpc_duration.observe(time.perf_counter() - started, method)
+        self.metrics.in_flight.dec(method)
+        status = context.code()
+        self.metrics.rpcs.inc(method, status.name if status is not None else code)
+
+    def count_received(self, method, request):
+        '''
+        Records the serialized size of a request message.
+        '''
+        self.metrics.received_bytes.inc(method, amount=request.ByteSize())
+
+    def count_sent(self, method, response):
+        '''
+        Records the serialized size of a response message.
+        '''
+        self.metrics.sent_bytes.inc(method, amount=response.ByteSize())
+
+def get_method_name(handler_call_details):
+    '''
+    Returns the method name of an RPC, e.g. 'RotateImage' for '/ImageService/RotateImage'.
+    '''
+    return handler_call_details.method.rsplit('/', 1)[-1]
+
+def get_handler_factory(handler):
+    '''
+    Returns the grpc function that creates an RpcMethodHandler of the same kind as handler.
+    '''
+    if handler.request_streaming and handler.response_streaming:
+        return grpc.stream_stream_rpc_method_handler
+    elif handler.request_streaming:
+        return grpc.stream_unary_rpc_method_handler
+    elif handler.response_streaming:
+        return grpc.unary_stream_rpc_method_handler
+    return grpc.unary_unary_rpc_method_handler
+
+def get_behavior(handler):
+    '''
+    Returns the function of handler that handles the RPC.
+    '''
+    return handler.stream_stream or handler.stream_unary or handler.unary_stream or handler.unary_unary
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    '''
+    Server interceptor that records the latency, status code, message sizes, and in-flight count of every RPC.
+
+    Errors are counted by the status code set on the context by abort() or set_code(). Handlers that raise
+    without setting one are counted as UNKNOWN, and response streams closed early by the client as CANCELLED.
+    '''
+
+    def __init__(self, metrics):
+        self.recorder = MetricsRecorder(metrics)
+
+    def count_requests(self, method, request_iterator):
+        for request in request_iterator:
+            self.recorder.count_received(method, request)
+            yield request
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        method = get_method_name(handler_call_details)
+        behavior = get_behavior(handler)
+        recorder = self.recorder
+
+        def get_request(request, context):
+            if handler.request_streaming:
+                return self.count_requests(method, request)
+            recorder.count_received(method, request)
+            return request
+
+        def unary_response(request, context):
+            started = recorder.start(method)
+            code = 'UNKNOWN'
+            try:
+                response = behavior(get_request(request, context), context)
+                recorder.count_sent(method, response)
+                code = 'OK'
+                return response
+            finally:
+                recorder.finish(method, started, context, code)
+
+        def stream_response(request, context):
+            started = recorder.start(method)
+            code = 'UNKNOWN'
+            try:
+                for response in behavior(get_request(request, context), context):
+                    recorder.count_sent(method, response)
+                    yield response
+                code = 'OK'
+            except GeneratorExit:
+                code = 'CANCELLED'
+                raise
+            finally:
+                recorder.finish(method, started, context, code)
+
+        return get_handler_factory(handler)(
+            stream_response if handler.response_streaming else unary_response,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    '''
+    grpc.aio server interceptor that records the same metrics as MetricsInterceptor.
+    '''
+
+    def __init__(self, metrics):
+        self.recorder = MetricsRecorder(metrics)
+
+    async def count_requests(self, method, request_iterator):
+        async for request in request_iterator:
+            self.recorder.count_received(method, request)
+            yield request
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        method = get_method_name(handler_call_details)
+        behavior = get_behavior(handler)
+        recorder = self.recorder
+
+        def get_request(request, context):
+            if handler.request_streaming:
+                return self.count_requests(method, request)
+            recorder.count_received(method, request)
+            return request
+
+        async def unary_response(request, context):
+            started = recorder.start(method)
+            code = 'UNKNOWN'
+            try:
+                response = await behavior(get_request(request, context), context)
+                recorder.count_sent(method, response)
+                code = 'OK'
+                return response
+            finally:
+                recorder.finish(method, started, context, code)
+
+        async def stream_response(request, context):
+            started = recorder.start(method)
+            code = 'UNKNOWN'
+            try:
+                async for response in behavior(get_request(request, context), context):
+                    recorder.count_sent(method, response)
+                    yield response
+                code = 'OK'
+            except GeneratorExit:
+                code = 'CANCELLED'
+                raise
+            finally:
+                recorder.finish(method, started, context, code)
+
+        return get_handler_factory(handler)(
+            stream_response if handler.response_streaming else unary_response,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+class ClientCallDetails(collections.namedtuple('ClientCallDetails', ('method', 'timeout', 'metadata', 'credentials', 'wait_for_ready', 'compression')),
+                        grpc.ClientCallDetails):
+    '''
+    Details of an outgoing RPC, passed on by client interceptors that change them.
+    '''
+
+class PriorityInterceptor(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor,
+                          grpc.StreamUnaryClientInterceptor, grpc.StreamStreamClientInterceptor):
+    '''
+    Client interceptor that sets the priority class of every RPC on a channel in its metadata,
+    which servers with a PriorityScheduler schedule the RPC by.
+    '''
+
+    def __init__(self, priority):
+        self.priority = priority
+
+    def add_priority(self, client_call_details):
+        '''
+        Returns ClientCallDetails with the priority metadata added.
+        '''
+        metadata = list(client_call_details.metadata or []) + [(scheduler.PRIORITY_METADATA_KEY, self.priority)]
+        return ClientCallDetails(client_call_details.method, client_call_details.timeout, metadata, client_call_details.credentials,
+                                 client_call_details.wait_for_ready, client_call_details.compression)
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        return continuation(self.add_priority(client_call_details), request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        return continuation(self.add_priority(client_call_details), request)
+
+    def intercept_stream_unary(self, continuation, client_call_details, request_iterator):
+        return continuation(self.add_priority(client_call_details), request_iterator)
+
+    def intercept_stream_stream(self, continuation, client_call_details, request_iterator):
+        return continuation(self.add_priority(client_call_details), request_iterator)
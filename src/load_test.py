@@ -0,0 +1,166 @@
+import sys
+import json
+import time
+import random
+import logging
+from concurrent import futures
+import grpc
+
+import image_pb2_grpc
+import client
+import utils.argument_parser as argument_parser
+import utils.image_utils as image_utils
+import utils.benchmark_utils as benchmark_utils
+import utils.load_utils as load_utils
+
+# Client helper that sends each operation of a load test
+OPERATIONS = {
+    'rotate': lambda stub, image: client.rotate_image(stub, image, 'NINETY_DEG'),
+    'mean': client.mean_filter,
+    'process': lambda stub, image: client.process_image(stub, image, client.get_operations('NINETY_DEG', True)),
+}
+
+def send_request(stub, operation, image, scheduled, recorder):
+    '''
+    Sends one request with a client helper, and records its latency measured from its scheduled send time
+
+    Measuring from the scheduled time rather than the time the request was actually sent means time spent waiting
+    for a free worker or channel counts towards latency, so queueing is not hidden by coordinated omission.
+    '''
+    try:
+        OPERATIONS[operation](stub, image)
+    except grpc.RpcError as ex:
+        recorder.record_error(operation, ex.code().name)
+        return
+    recorder.record(operation, time.perf_counter() - scheduled)
+
+def run_load(stubs, mix, images, offsets, concurrency, seed=0):
+    '''
+    Drives an open-loop load against the server, and returns the recorded latencies and the length of the run
+
+    Each request is sent at its offset from the start of the run, whether or not earlier requests have completed.
+    Operations are picked from mix in proportion to their weights, and images are picked uniformly from images.
+    Requests are sent from a pool of concurrency threads, spread round-robin over stubs.
+
+        Parameters:
+            stubs (list): List of ImageServiceStubs, each on its own persistent channel
+            mix (list): List of (operation, weight) tuples
+            images (list): List of Image objects to send
+            offsets (list): Sorted send times in seconds, as returned by load_utils.get_arrival_offsets
+            concurrency (int): Max number of requests in flight
+            seed (int): Seed of the operation and image choices
+        Returns:
+            (tuple): (recorder, elapsed) where recorder is a LatencyRecorder and elapsed is the length of the run in seconds
+    '''
+    rng = random.Random(seed)
+    operations = rng.choices([name for name, _ in mix], weights=[weight for _, weight in mix], k=len(offsets))
+    recorder = load_utils.LatencyRecorder()
+
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        for index, (offset, operation) in enumerate(zip(offsets, operations)):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send_request, stubs[index % len(stubs)], operation, rng.choice(images), scheduled, recorder)
+    elapsed = time.perf_counter() - start
+
+    return recorder, elapsed
+
+def get_report(recorder, elapsed, offered_rate):
+    '''
+    Returns dictionary of throughput, latency percentiles, histograms, and errors of a load test run
+    '''
+    latencies = recorder.get_all_latencies()
+    return {
+        'offered_rate': offered_rate,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'elapsed': elapsed,
+        'overall': load_utils.summarize(latencies),
+        'operations': {name: load_utils.summarize(values) for name, values in recorder.latencies.items()},
+        'histogram': load_utils.get_histogram(latencies),
+        'errors': [{'operation': operation, 'code': code, 'count': count} for (operation, code), count in recorder.errors.items()],
+    }
+
+def print_report(report):
+    '''
+    Prints throughput, latency percentiles, latency histogram, and errors of a load test run
+    '''
+    print('Offered {:.1f} req/s, completed {:.1f} req/s over {:.1f} s'.format(
+        report['offered_rate'], report['throughput'], report['elapsed']))
+
+    for name, summary in [('overall', report['overall'])] + sorted(report['operations'].items()):
+        if not summary['count']:
+            print('{:<10} no successful requests'.format(name))
+            continue
+        percentiles = '   '.join('p{} {:>9.2f} ms'.format(percent, summary['p' + str(percent)] * 1000)
+                                 for percent in load_utils.PERCENTILES)
+        print('{:<10} n {:<8} {}   max {:>9.2f} ms'.format(name, summary['count'], percentiles, summary['max'] * 1000))
+
+    total = sum(count for _, count in report['histogram'])
+    for bound, count in report['histogram']:
+        print('  <= {:>9.2f} ms {:>8} {}'.format(bound * 1000, count, '#' * round(40 * count / total)))
+
+    for error in report['errors']:
+        print('{} failed with {}: {}'.format(error['operation'], error['code'], error['count']))
+
+def run():
+    '''
+    Runs load_test.py.
+
+    Parses and validates arguments passed into load_test.py. If arguments are invalid, ArgumentParser.error() is triggered.
+    Opens --channels persistent channels to the server at host and port, and exits and logs error if it cannot connect.
+    Sends --rate requests per second for --duration seconds, picking operations by the weights of --mix and random
+    images of the --sizes and --modes, and prints the throughput and latency percentiles and histogram of the run.
+    If --output is given, the report is also written to it as JSON.
+    '''
+    args_parser = argument_parser.get_load_test_args_parser()
+    args = args_parser.parse_args()
+
+    if not args.port.isdigit() or int(args.port) > 65535:
+        args_parser.error("Invalid port number " + args.port + " - use a positive integer value less than 65535")
+    if args.rate <= 0 or args.duration <= 0:
+        args_parser.error("Invalid rate or duration - use positive values")
+    if args.channels <= 0 or args.concurrency <= 0:
+        args_parser.error("Invalid channels or concurrency - use positive integer values")
+    try:
+        mix = load_utils.parse_mix(args.mix)
+    except ValueError as ex:
+        args_parser.error("Invalid mix - " + str(ex))
+    for name, _ in mix:
+        if name not in OPERATIONS:
+            args_parser.error("Invalid mix - operation " + name + " is not one of " + ', '.join(OPERATIONS))
+    for size in args.sizes:
+        for mode in args.modes:
+            if size <= 0 or size * size * benchmark_utils.MODE_BANDS[mode] > image_utils.MAX_IMAGE_SIZE:
+                args_parser.error("Invalid size " + str(size) + " - " + mode + " images must be at most "
+                                  + str(image_utils.MAX_IMAGE_SIZE) + " bytes")
+
+    images = [benchmark_utils.make_test_image(size, mode, seed=index)
+              for index, (size, mode) in enumerate((size, mode) for size in args.sizes for mode in args.modes)]
+    offsets = load_utils.get_arrival_offsets(args.rate, args.duration, args.arrivals, args.seed)
+
+    channels = [grpc.insecure_channel(args.host + ':' + args.port) for _ in range(args.channels)]
+    try:
+        for channel in channels:
+            grpc.channel_ready_future(channel).result(timeout=10)
+    except grpc.FutureTimeoutError:
+        logging.error("Failed to connect to remote host: Connection refused - incorrect address")
+        sys.exit(1)
+
+    try:
+        stubs = [image_pb2_grpc.ImageServiceStub(channel) for channel in channels]
+        recorder, elapsed = run_load(stubs, mix, images, offsets, args.concurrency, args.seed)
+    finally:
+        for channel in channels:
+            channel.close()
+
+    report = get_report(recorder, elapsed, args.rate)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == '__main__':
+    run()
@@ -1,138 +1,924 @@
-import sys
+import time
+import signal
+import contextlib
 import logging
+import asyncio
 from concurrent import futures
 import grpc
 
 import image_pb2, image_pb2_grpc
+import aio_server
+import interceptors
 import utils.argument_parser as argument_parser
 import utils.image_utils as image_utils
+import utils.image_ops as image_ops
+import utils.stream_utils as stream_utils
+import utils.pipeline as pipeline
+import utils.compute_backend as compute_backend
+import utils.result_cache as result_cache
+import utils.single_flight as single_flight
+import utils.metrics as metrics
+import utils.profiler as profiler
+import utils.codec as codec
+import utils.admission as admission
+import utils.cancellation as cancellation
+import utils.scheduler as scheduler
+import utils.micro_batch as micro_batch
+import utils.prefork as prefork
+import utils.local_transport as local_transport
+
+# Default min number of pixels in an image before MeanFilter splits it into row bands filtered in parallel
+PARALLEL_THRESHOLD = 1048576
 
 class ImageServiceServicer(image_pb2_grpc.ImageServiceServicer):
     '''
     Provides methods that implement functionality of image_pb2_grpc.ImageServiceServicer.
 
+    Invalid requests are aborted with an INVALID_ARGUMENT status code, and requests rejected by admission control
+    with a RESOURCE_EXHAUSTED status code. With a scheduler, unary and batch requests wait for a compute slot in order
+    of the priority class set in their metadata, then deadline, then estimated cost. Requests whose client has gone,
+    or whose deadline has passed or cannot be met, stop at the next row band and are aborted with CANCELLED
+    or DEADLINE_EXCEEDED.
+    With a segment store, unary requests received over a Unix domain socket may refer to their Image data in a shared
+    memory segment, which is processed in place, and their result is returned in a new segment leased to the client.
+
     ...
 
+    Attributes
+    ----------
+    parallelism : int
+        Max number of row bands a single MeanFilter request is split into and filtered in parallel.
+    parallel_threshold : int
+        Min number of pixels in an image before MeanFilter splits it into row bands.
+    batch_workers : int
+        Number of BatchProcess items processed concurrently.
+    compute_backend : ProcessPoolBackend
+        Optional pool of worker processes that large images are processed in.
+    result_cache : ResultCache
+        Optional cache of results, keyed by the content hash of the request.
+    single_flight : SingleFlight
+        Optional coalescer that lets concurrent requests with the same content hash share one computation.
+    metrics : ServerMetrics
+        Optional metrics that the time spent in each stage of a request is recorded in.
+    profiler : RequestProfiler
+        Optional profiler that captures profiles of RotateImage and MeanFilter requests on demand.
+    admission : AdmissionController
+        Optional admission controller that each request acquires its estimated working memory from before it is processed.
+    scheduler : PriorityScheduler
+        Optional scheduler that unary and batch requests wait for a compute slot from before they are processed.
+    micro_batcher : MicroBatcher
+        Optional batcher that concurrent small requests with the same shape and stages are run together in.
+    segments : SegmentStore
+        Optional store of shared memory segments that the results of requests referring to shared memory are leased in.
+
     Methods
     -------
     RotateImage(request, context):
         Rotates and returns Image.
     MeanFilter(request, context):
         Applies mean filter to and returns Image.
+    MeanFilterRadius(request, context):
+        Applies mean filter of the requested radius to and returns Image.
+    Convolve(request, context):
+        Convolves Image with the requested kernel, and returns the result.
+    ProcessImage(request, context):
+        Applies list of operations to Image in a fused pipeline, and returns the result.
+    RotateImageStream(request_iterator, context):
+        Rotates Image received as chunked stream, and returns it as chunked stream.
+    MeanFilterStream(request_iterator, context):
+        Applies mean filter to Image received as chunked stream, and returns it as chunked stream.
+    RotateImageBands(request, context):
+        Rotates Image, and streams back each row band of the result as soon as it is computed.
+    MeanFilterBands(request, context):
+        Applies mean filter to Image, and streams back each row band of the result as soon as it is computed.
+    BatchProcess(request, context):
+        Applies operations to a batch of Images concurrently, and streams back a result per Image.
     '''
 
-    def RotateImage(self, request, context):
+    def __init__(self, parallelism=1, parallel_threshold=PARALLEL_THRESHOLD, batch_workers=4, compute_backend=None, result_cache=None, single_flight=None, metrics=None, profiler=None, admission=None, scheduler=None, micro_batcher=None, segments=None):
+        self.parallelism = parallelism
+        self.parallel_threshold = parallel_threshold
+        self.mean_filter_executor = futures.ThreadPoolExecutor(max_workers=parallelism) if parallelism > 1 else None
+        self.batch_workers = batch_workers
+        self.batch_executor = futures.ThreadPoolExecutor(max_workers=batch_workers)
+        self.compute_backend = compute_backend
+        self.result_cache = result_cache
+        self.single_flight = single_flight
+        self.metrics = metrics
+        self.profiler = profiler
+        self.admission = admission
+        self.scheduler = scheduler
+        self.micro_batcher = micro_batcher
+        self.segments = segments
+
+    def observe_stage(self, stage, started):
         '''
-        Rotates and returns Image.
+        Records the time since started spent in a stage of a request, if metrics are configured.
+        '''
+        if self.metrics is not None:
+            self.metrics.observe_stage(stage, time.perf_counter() - started)
 
-        If Image is invalid, function exits and logs error.
-        Provides server-side validation of rotation string, if invalid, function exits and logs error.
-        Performs image rotation by copying individual pixels to new Image template.
-        Returns rotated Image.
+    def admit(self, estimate, *args):
+        '''
+        Returns context manager that holds the working memory estimated by estimate(*args) against the admission budget
+        while its block runs, or that does nothing if admission control is not configured.
+
+        Raises ResourceExhaustedError if the request is rejected, and ValueError if it is too invalid to estimate.
+        '''
+        if self.admission is None:
+            return contextlib.nullcontext()
+        return self.admission.admit(estimate(*args))
+
+    def schedule(self, priority, monitor, image, stage_types):
+        '''
+        Returns context manager that holds a compute slot of the scheduler while its block runs, or that does nothing
+        if the scheduler is not configured.
+
+        Requests wait for a slot in order of priority class, then the deadline of monitor, then the estimated seconds
+        of applying stages of stage_types to Image. Raises ValueError if priority is not valid.
+        Requests stop waiting, and raise CancelledError or DeadlineExceededError, once monitor stops them.
+        '''
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        cost = cancellation.estimate_seconds(admission.get_raw_size(image), stage_types)
+        if monitor is None:
+            return self.scheduler.slot(priority, cost=cost)
+        return self.scheduler.slot(priority, monitor.deadline, cost, monitor.check)
+
+    def check_priority(self, priority):
+        '''
+        Raises ValueError if a scheduler is configured and priority is not valid, so invalid priorities are rejected
+        even by requests that are answered without waiting for a compute slot.
+        '''
+        if self.scheduler is not None:
+            scheduler.validate_priority(priority)
+
+    def abort(self, context, ex):
+        '''
+        Logs error and aborts the request with the status code of ex, see admission.get_status.
+        '''
+        code, message = admission.get_status(ex)
+        logging.error(message)
+        context.abort(code, message)
+
+    def run_local(self, peer, image, function):
+        '''
+        Runs function on a request Image, and returns the result Image it returns.
+
+        If Image refers to a shared memory segment, function is run on a read-only view of the data in the segment
+        instead, and the result is returned in a new segment leased to the client, which the returned Image refers to.
+        Results computed straight into a segment are returned as they are, see get_output_store, and other results
+        are copied into one.
+        Raises ValueError if Image refers to shared memory but no segment store is configured, the request was not
+        received from peer over a Unix domain socket, or the segment cannot be opened.
         '''
+        if not local_transport.is_shared(image):
+            return function(image)
+        if self.segments is None or not local_transport.is_local_peer(peer):
+            raise ValueError('shared memory is only accepted on requests received over the Unix domain socket')
 
-        if image_utils.is_valid_image(request.image):
+        with local_transport.open_image(image, self.segments) as shared:
+            result = function(shared)
+            if local_transport.is_shared(result):
+                return result
+            started = time.perf_counter()
+            result = self.segments.share(result)
+            self.observe_stage('share', started)
+            return result
 
-            if request.rotation in image_pb2.ImageRotateRequest.Rotation.values():
-        
-                if request.rotation == image_pb2.ImageRotateRequest.Rotation.NONE:
-                    return request.image
-                else:
+    def run_profiled(self, method, image, function, *args):
+        '''
+        Runs function with args and returns its result, capturing a profile of it if the profiler is armed.
+        '''
+        if self.profiler is None or not self.profiler.armed:
+            return function(*args)
+        return self.profiler.run(method, image, function, *args)
 
-                    img = image_utils.image_to_pil_image(request.image)
+    def get_output_store(self, image):
+        '''
+        Returns the SegmentStore that the result of running stages on raw Image can be computed straight into, or None.
 
-                    width = request.image.width
-                    height = request.image.height
-                    if request.rotation in [image_pb2.ImageRotateRequest.Rotation.NINETY_DEG, image_pb2.ImageRotateRequest.Rotation.TWO_SEVENTY_DEG]:
-                        width = request.image.height
-                        height = request.image.width
+        Only requests whose Image is held in shared memory and that want a raw response are computed into a segment,
+        and only when results are not cached or shared between requests, which need a copy of their own.
+        '''
+        if not isinstance(image, local_transport.SharedImage) or image.response_encoding != image_pb2.Image.Encoding.RAW:
+            return None
+        if self.result_cache is not None or self.single_flight is not None:
+            return None
+        return image.store
 
-                    new_img = image_utils.get_new_pil_image_template(request.image.data, width, height)
+    def compute_stages(self, image, stages, check=None):
+        '''
+        Computes the result of running planned stages on Image.
 
-                    for x in range(request.image.width):
-                        for y in range(request.image.height):
-                            pixel_to_move = img.getpixel((x,y))
+        Images of at least compute_backend.inline_threshold pixels are sent to the compute backend's worker processes,
+        when a compute backend is configured. Other images are processed inline on the calling thread, where small images
+        are run in a stack with concurrent requests of the same shape and stages when a micro-batcher is configured,
+        and mean filter stages on images of at least parallel_threshold pixels are split into row bands that are
+        filtered in parallel. Images held in shared memory that are processed inline and not micro-batched have their
+        result computed straight into a response segment, see get_output_store.
+        If check is given, it is called before each row band processed inline, before an image joins a micro-batch,
+        and before an image is sent to the compute backend, and can raise to stop early.
+        The time spent in the decode, compute, and encode stages is recorded in metrics.
+        '''
 
-                            if request.rotation == image_pb2.ImageRotateRequest.Rotation.NINETY_DEG:
-                                new_img.putpixel((width-y-1, x), pixel_to_move)
-                            elif request.rotation == image_pb2.ImageRotateRequest.Rotation.ONE_EIGHTY_DEG:
-                                new_img.putpixel((width-x-1, height-y-1), pixel_to_move)
-                            elif request.rotation == image_pb2.ImageRotateRequest.Rotation.TWO_SEVENTY_DEG:
-                                new_img.putpixel((y, height-x-1), pixel_to_move)
-                    
-                    data = new_img.tobytes()
+        started = time.perf_counter()
+        pixels = image_ops.image_to_array(image)
+        num_pixels = image.width * image.height
+        self.observe_stage('decode', started)
 
-                    return image_pb2.Image(color=request.image.color, data=data, width=width, height=height)
+        started = time.perf_counter()
+        if self.compute_backend is not None and num_pixels >= self.compute_backend.inline_threshold:
+            if check is not None:
+                check()
+            data, shape = self.compute_backend.run(pixels, stages)
+            self.observe_stage('compute', started)
+            started = time.perf_counter()
+        else:
+            store = self.get_output_store(image)
+            executor, parallelism = (self.mean_filter_executor, self.parallelism) if num_pixels >= self.parallel_threshold else (None, 1)
+            if store is not None:
+                result = store.compute(pipeline.get_output_shape(pixels.shape, stages), image.color,
+                                       lambda out: pipeline.run_stages(pixels, stages, executor, parallelism, check, out))
+                self.observe_stage('compute', started)
+                return result
+            if self.micro_batcher is not None and self.micro_batcher.accepts(pixels, stages):
+                if check is not None:
+                    check()
+                pixels = self.micro_batcher.run(pixels, stages)
             else:
-                logging.error('Invalid message - rotation string is not valid')
-                sys.exit(1)
+                pixels = pipeline.run_stages(pixels, stages, executor, parallelism, check)
+            self.observe_stage('compute', started)
+            started = time.perf_counter()
+            data, shape = pixels.tobytes(), pixels.shape
+
+        result = image_pb2.Image(color=image.color, data=data, width=shape[1], height=shape[0])
+        self.observe_stage('encode', started)
+        return result
+
+    def compute_scheduled(self, image, stages, check=None, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Computes the result of running planned stages on raw Image, holding a compute slot at priority while it runs
+        if a scheduler is configured. See compute_stages.
+
+        The working memory of the request has already been admitted by the caller, so slots are never held
+        by requests waiting for memory.
+        '''
+        stage_types = [stage[0] for stage in stages]
+        with self.schedule(priority, monitor, image, stage_types):
+            return self.compute_stages(image, stages, check)
+
+    def run_stages(self, image, stages, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Runs planned stages on raw Image and returns the result.
+
+        If a result cache is configured, results are looked up by the content hash of Image and stages first,
+        and stored in the cache after they are computed.
+        If request coalescing is configured, concurrent requests with the same content hash share one computation.
+        Only requests that compute their result wait for a compute slot, so cache hits and requests waiting for
+        a shared computation do not hold one. See compute_scheduled.
+        If monitor is given, computation stops early when its request is cancelled or passes its deadline.
+        A shared computation only stops once no other request is waiting for it, and requests whose shared
+        computation was stopped by another request compute it again.
+        The time spent hashing and looking up the request is recorded in metrics as the cache stage.
+        '''
+
+        check = monitor.check if monitor is not None else None
+        if self.result_cache is None and self.single_flight is None:
+            return self.compute_scheduled(image, stages, check, monitor, priority)
+
+        started = time.perf_counter()
+        key = result_cache.make_key(image, stages)
+        if self.result_cache is not None:
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                self.observe_stage('cache', started)
+                return cached
+        self.observe_stage('cache', started)
+
+        if self.single_flight is not None:
+            result = self.run_shared(key, image, stages, monitor, priority)
         else:
-            logging.error('Invalid message - does not represent a valid image')
-            sys.exit(1)
+            result = self.compute_scheduled(image, stages, check, monitor, priority)
+
+        if self.result_cache is not None:
+            self.result_cache.put(key, result)
+        return result
+
+    def run_shared(self, key, image, stages, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Computes the result of running planned stages on Image, sharing one computation between concurrent requests
+        with the same key. See run_stages for when a shared computation stops early.
+
+        Requests waiting for the shared computation stop waiting as soon as monitor stops them,
+        and are then no longer counted as waiting for it.
+        '''
+
+        def check():
+            if self.single_flight.get_waiters(key) == 0:
+                monitor.check()
+
+        leader_check = check if monitor is not None else None
+        waiter_check = monitor.check if monitor is not None else None
+        while True:
+            try:
+                return self.single_flight.do(key, self.compute_scheduled, image, stages, leader_check, monitor, priority,
+                                             check=waiter_check)
+            except cancellation.RequestStoppedError:
+                if monitor is not None:
+                    monitor.check()
+
+    def check_deadline(self, monitor, image, stage_types):
+        '''
+        Raises DeadlineExceededError if applying stages of stage_types to a request Image cannot finish before
+        the deadline of monitor, or CancelledError if its request has been cancelled. Does nothing if monitor is None.
+        '''
+        if monitor is not None:
+            monitor.check_cost(cancellation.estimate_seconds(admission.get_raw_size(image), stage_types))
+
+    def decode_image(self, image):
+        '''
+        Returns Image holding the raw pixels of a request Image, decoding them first if it holds an encoded file.
+
+        Raises ValueError if Image.encoding is invalid, or Image.data is not a file of that encoding.
+        The time spent decoding files is recorded in metrics as the decode_file stage.
+        '''
+
+        if image.encoding == image_pb2.Image.Encoding.RAW:
+            return image
+        if image.encoding not in codec.FORMATS:
+            raise ValueError('encoding is not valid')
+
+        started = time.perf_counter()
+        raw = codec.decode_image(image)
+        self.observe_stage('decode_file', started)
+        return raw
+
+    def validate_image(self, image, raw, streamed=False):
+        '''
+        Raises ValueError if the raw pixels of a request Image, or the encoding it requests its response in, are invalid.
+
+        Raw requests are limited to the max message size. Encoded requests may decode to up to codec.MAX_DECODED_SIZE
+        bytes, as long as their response is encoded too, since a raw response must still fit in one message.
+        Streamed responses are sent as raw row bands of any size, so they must not request an encoded response.
+        Images held in shared memory are not sent in messages, so their raw data and responses may be up to
+        codec.MAX_DECODED_SIZE bytes.
+        '''
+        if streamed and image.response_encoding != image_pb2.Image.Encoding.RAW:
+            raise ValueError('streamed responses can only be RAW')
+
+        shared = isinstance(image, local_transport.SharedImage)
+        max_size = image_utils.MAX_IMAGE_SIZE if image.encoding == image_pb2.Image.Encoding.RAW and not shared else codec.MAX_DECODED_SIZE
+        if not image_utils.is_valid_image(raw, max_size):
+            raise ValueError('does not represent a valid image')
+        if image.response_encoding != image_pb2.Image.Encoding.RAW and image.response_encoding not in codec.FORMATS:
+            raise ValueError('response encoding is not valid')
+        if image.response_quality < 0 or image.response_quality > 100:
+            raise ValueError('response quality is not valid')
+        if not streamed and not shared and image.response_encoding == image_pb2.Image.Encoding.RAW and len(raw.data) > image_utils.MAX_IMAGE_SIZE:
+            raise ValueError('raw response would be larger than the max message size - request an encoded response')
+
+    def encode_image(self, image, result):
+        '''
+        Returns raw result Image in the encoding requested by the request Image.
+
+        The time spent encoding files is recorded in metrics as the encode_file stage.
+        '''
+
+        if image.response_encoding == image_pb2.Image.Encoding.RAW:
+            return result
+
+        started = time.perf_counter()
+        encoded = codec.encode_image(result, image.response_encoding, image.response_quality)
+        self.observe_stage('encode_file', started)
+        return encoded
+
+    def rotate_image(self, image, rotation, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Rotates and returns Image.
+
+        Raises ValueError if Image or rotation is invalid.
+        If monitor is given, raises DeadlineExceededError up front if the rotation cannot finish before its deadline,
+        and stops early if its request is cancelled or passes its deadline.
+        Waits for a compute slot at priority if a scheduler is configured and the result has to be computed.
+        Performs image rotation by copying a rotated view of Image.data into a single output buffer in cache-sized tiles.
+        Encoded Images are decoded first, and the result is returned in the encoding Image requests.
+        Returns rotated Image.
+        '''
+
+        stage_types = [image_pb2.Operation.Type.ROTATE]
+        self.check_deadline(monitor, image, stage_types)
+        self.check_priority(priority)
+        with self.admit(admission.estimate_memory, image, stage_types):
+            raw = self.decode_image(image)
+            started = time.perf_counter()
+            self.validate_image(image, raw)
+            if rotation not in image_pb2.ImageRotateRequest.Rotation.values():
+                raise ValueError('rotation string is not valid')
+            self.observe_stage('validate', started)
+
+            if rotation == image_pb2.ImageRotateRequest.Rotation.NONE:
+                return self.encode_image(image, raw)
+
+            return self.encode_image(image, self.run_stages(raw, [(image_pb2.Operation.Type.ROTATE, rotation, 0)], monitor, priority))
+
+    def mean_filter(self, image, radius=1, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Applies mean filter over the neighbors within radius rows and columns of each pixel, and returns Image.
+
+        Raises ValueError if Image or radius is invalid.
+        If monitor is given, raises DeadlineExceededError up front if the filter cannot finish before its deadline,
+        and stops early if its request is cancelled or passes its deadline.
+        Waits for a compute slot at priority if a scheduler is configured and the result has to be computed.
+        Applies mean filter to a numpy view of Image.data, accounting for whether image is single channel greyscale,
+        3 channel 'RGB', or 4 channel 'RGBA'.
+        Encoded Images are decoded first, and the result is returned in the encoding Image requests.
+        Returns mean filtered Image.
+        '''
+
+        stage_types = [image_pb2.Operation.Type.MEAN_FILTER]
+        self.check_deadline(monitor, image, stage_types)
+        self.check_priority(priority)
+        with self.admit(admission.estimate_memory, image, stage_types):
+            raw = self.decode_image(image)
+            started = time.perf_counter()
+            self.validate_image(image, raw)
+            if radius < 1 or radius > pipeline.MAX_RADIUS:
+                raise ValueError('radius is not valid')
+            self.observe_stage('validate', started)
+
+            return self.encode_image(image, self.run_stages(raw, [(image_pb2.Operation.Type.MEAN_FILTER, 0, radius)], monitor, priority))
+
+    def estimate_band_memory(self, image, stage_type):
+        '''
+        Returns estimated working memory in bytes of a request Image whose result is streamed back in row bands.
+        '''
+        return admission.estimate_band_memory(admission.get_raw_size(image), stage_type, stream_utils.BAND_SIZE)
+
+    def rotate_image_bands(self, image, rotation, monitor=None):
+        '''
+        Generator that rotates Image, and yields the header and row bands of the result as ImageChunks.
+
+        Raises ValueError if Image or rotation is invalid, when the first ImageChunk is requested.
+        If monitor is given, stops before the next band if its request is cancelled or passes its deadline.
+        Each output row band is rotated from the matching source columns and sent before the next band is computed,
+        so the full rotated image is never held in memory. The result cache is not used.
+        '''
+
+        self.check_deadline(monitor, image, [image_pb2.Operation.Type.ROTATE])
+        with self.admit(self.estimate_band_memory, image, image_pb2.Operation.Type.ROTATE):
+            raw = self.decode_image(image)
+            started = time.perf_counter()
+            self.validate_image(image, raw, streamed=True)
+            if rotation not in image_pb2.ImageRotateRequest.Rotation.values():
+                raise ValueError('rotation string is not valid')
+            self.observe_stage('validate', started)
+
+            check = monitor.check if monitor is not None else None
+            yield from stream_utils.rotate_bands(image_ops.image_to_array(raw), raw.color, rotation, check=check)
+
+    def mean_filter_bands(self, image, radius=1, monitor=None):
+        '''
+        Generator that applies mean filter to Image, and yields the header and row bands of the result as ImageChunks.
+
+        Raises ValueError if Image or radius is invalid, when the first ImageChunk is requested.
+        If monitor is given, stops before the next band if its request is cancelled or passes its deadline.
+        Each output row band is filtered from its source rows and their halo, and sent before the next band is computed,
+        so the full filtered image is never held in memory. The result cache is not used.
+        '''
+
+        self.check_deadline(monitor, image, [image_pb2.Operation.Type.MEAN_FILTER])
+        with self.admit(self.estimate_band_memory, image, image_pb2.Operation.Type.MEAN_FILTER):
+            raw = self.decode_image(image)
+            started = time.perf_counter()
+            self.validate_image(image, raw, streamed=True)
+            if radius < 1 or radius > pipeline.MAX_RADIUS:
+                raise ValueError('radius is not valid')
+            self.observe_stage('validate', started)
+
+            check = monitor.check if monitor is not None else None
+            yield from stream_utils.mean_filter_bands(image_ops.image_to_array(raw), raw.color, radius, check=check)
+
+    def apply_operations(self, image, operations, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Applies each Operation to Image in order and returns the result.
+
+        Raises ValueError if Image or any Operation is invalid.
+        Operations are planned into fused stages by pipeline.plan_operations, so consecutive rotations are applied
+        as one, and rotations are written straight to their final position by the mean filter pass before them.
+        Image.data is only converted to and from a pixel array once, however many operations are applied.
+        Encoded Images are decoded first, and the result is returned in the encoding Image requests.
+        If monitor is given, raises DeadlineExceededError up front if the operations cannot finish before its deadline,
+        and stops early if its request is cancelled or passes its deadline.
+        Waits for a compute slot at priority if a scheduler is configured and the result has to be computed.
+        '''
+
+        stage_types = [operation.type for operation in operations]
+        self.check_deadline(monitor, image, stage_types)
+        self.check_priority(priority)
+        with self.admit(admission.estimate_memory, image, stage_types):
+            raw = self.decode_image(image)
+            started = time.perf_counter()
+            self.validate_image(image, raw)
+
+            stages = pipeline.plan_operations(operations)
+            self.observe_stage('validate', started)
+            if not stages:
+                return self.encode_image(image, raw)
+
+            return self.encode_image(image, self.run_stages(raw, stages, monitor, priority))
+
+    def RotateImage(self, request, context):
+        '''
+        Rotates and returns Image.
+
+        If Image is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        Provides server-side validation of rotation string, if invalid, the request is aborted the same way.
+        See rotate_image for how the rotation is performed, and for when the request is stopped early.
+        See run_local for Images held in shared memory.
+        Returns rotated Image.
+        '''
+
+        try:
+            monitor = cancellation.monitor_context(context)
+            priority = scheduler.get_context_priority(context)
+            return self.run_local(local_transport.get_peer(context), request.image, lambda image: self.run_profiled(
+                'RotateImage', image, self.rotate_image, image, request.rotation, monitor, priority))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
 
     def MeanFilter(self, request, context):
         '''
         Applies mean filter and returns Image.
 
-        If Image is invalid, function exits and logs error.
-        Applies mean filter, accounting for whether image is single channel greyscale, 3 channel 'RGB', or 4 channel 'RGBA'.
+        If Image is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        See mean_filter for how the filter is applied, and for when the request is stopped early.
+        See run_local for Images held in shared memory.
         Returns mean filtered Image.
         '''
 
-        if image_utils.is_valid_image(request):
+        try:
+            monitor = cancellation.monitor_context(context)
+            priority = scheduler.get_context_priority(context)
+            return self.run_local(local_transport.get_peer(context), request, lambda image: self.run_profiled(
+                'MeanFilter', image, self.mean_filter, image, 1, monitor, priority))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
+
+    def MeanFilterRadius(self, request, context):
+        '''
+        Applies mean filter over the neighbourhood of the requested radius and returns Image.
 
-            img = image_utils.image_to_pil_image(request)
-            pixels = image_utils.get_pixels_buffer(img)
+        If Image or radius is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        A radius of 0 is treated as the default radius of 1.
+        See run_local for Images held in shared memory.
+        Returns mean filtered Image.
+        '''
 
-            for x in range(request.width):
-                for y in range(request.height):
+        try:
+            monitor = cancellation.monitor_context(context)
+            priority = scheduler.get_context_priority(context)
+            return self.run_local(local_transport.get_peer(context), request.image, lambda image: self.run_profiled(
+                'MeanFilterRadius', image, self.mean_filter, image, request.radius or 1, monitor, priority))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
 
-                    neighbors = image_utils.get_pixel_neighbors(x, y, request.width, request.height)
-                    neighbors.append((x,y))
-                    neighbors = [pixels[x][y] for (x,y) in neighbors]
+    def Convolve(self, request, context):
+        '''
+        Convolves Image with the requested kernel, and returns the result.
 
-                    if request.color:
-                        r = sum([rgb[0] for rgb in neighbors]) // len(neighbors)
-                        g = sum([rgb[1] for rgb in neighbors]) // len(neighbors)
-                        b = sum([rgb[2] for rgb in neighbors]) // len(neighbors)
+        If Image or Kernel is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        The convolution is planned as a single CONVOLVE operation, see apply_operations.
+        See run_local for Images held in shared memory.
+        Returns convolved Image.
+        '''
 
-                        if "A" in img.getbands():
-                            a = sum([a for r,g,b,a in neighbors]) // len(neighbors)
-                            img.putpixel((x,y), (r,g,b,a))
-                        else:
-                            img.putpixel((x,y), (r,g,b))
-                    else:
-                        l = sum([l for l in neighbors]) // len(neighbors)
+        try:
+            operations = [image_pb2.Operation(type=image_pb2.Operation.Type.CONVOLVE, kernel=request.kernel)]
+            monitor = cancellation.monitor_context(context)
+            priority = scheduler.get_context_priority(context)
+            return self.run_local(local_transport.get_peer(context), request.image,
+                                  lambda image: self.apply_operations(image, operations, monitor, priority))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
 
-                        img.putpixel((x,y), l)
+    def ProcessImage(self, request, context):
+        '''
+        Applies list of operations to Image in order, and returns the result.
 
-            data = img.tobytes()
+        If Image or any Operation is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        See apply_operations for how operations are fused, and run_local for Images held in shared memory.
+        Returns processed Image.
+        '''
 
-            return image_pb2.Image(color=request.color, data=data, width=request.width, height=request.height)
-        else:
-            logging.error('Invalid message - does not represent a valid image')
-            sys.exit(1)
+        try:
+            monitor = cancellation.monitor_context(context)
+            priority = scheduler.get_context_priority(context)
+            return self.run_local(local_transport.get_peer(context), request.image,
+                                  lambda image: self.apply_operations(image, request.operations, monitor, priority))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
+
+    def process_stream(self, processor_class, stage_type, request_iterator, monitor=None):
+        '''
+        Generator that passes the row bands of a chunked image stream to a stream processor as they arrive,
+        and yields the ImageChunks it returns.
+
+        Raises ValueError if the header or any row band is invalid.
+        If monitor is given, stops before the next row band, or before the end of the stream is processed,
+        if its request is cancelled or passes its deadline.
+        The working memory of the stream is estimated from its header and the Operation.Type of the stage
+        the processor applies, and held against the admission budget until the stream ends.
+        '''
+
+        header = stream_utils.read_header(request_iterator)
+        with self.admit(admission.estimate_stream_memory, header, stage_type):
+            processor = processor_class(header, monitor.check if monitor is not None else None)
+
+            yield from processor.start()
+            for row_start, band in stream_utils.read_row_bands(request_iterator, header):
+                yield from processor.process(row_start, band)
+            yield from processor.finish()
+
+    def RotateImageStream(self, request_iterator, context):
+        '''
+        Rotates Image received as a header followed by row bands, and yields it back in the same format.
+
+        If header, rotation, or any row band is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        Each row band is written to its rotated position in the output buffer as soon as it arrives.
+        Yields header of rotated Image, followed by its row bands.
+        '''
+
+        try:
+            yield from self.process_stream(stream_utils.RotateStreamProcessor, image_pb2.Operation.Type.ROTATE, request_iterator,
+                                           cancellation.monitor_context(context))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
+
+    def MeanFilterStream(self, request_iterator, context):
+        '''
+        Applies mean filter to Image received as a header followed by row bands, and yields it back in the same format.
+
+        If header or any row band is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        Output rows are filtered and yielded as soon as the row below them has arrived,
+        so filtering overlaps with the rest of the upload.
+        Yields header of mean filtered Image, followed by its row bands.
+        '''
+
+        try:
+            yield from self.process_stream(stream_utils.MeanFilterStreamProcessor, image_pb2.Operation.Type.MEAN_FILTER, request_iterator,
+                                           cancellation.monitor_context(context))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
+
+    def RotateImageBands(self, request, context):
+        '''
+        Rotates Image, and yields the header of the result followed by its row bands as each band is computed.
+
+        If Image or rotation is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        See rotate_image_bands for how the bands are computed.
+        '''
+
+        try:
+            yield from self.rotate_image_bands(request.image, request.rotation, cancellation.monitor_context(context))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
+
+    def MeanFilterBands(self, request, context):
+        '''
+        Applies mean filter of the requested radius to Image, and yields the header of the result followed by
+        its row bands as each band is computed.
+
+        If Image or radius is invalid, the request is aborted with an INVALID_ARGUMENT status code.
+        A radius of 0 is treated as the default radius of 1.
+        See mean_filter_bands for how the bands are computed.
+        '''
+
+        try:
+            yield from self.mean_filter_bands(request.image, request.radius or 1, cancellation.monitor_context(context))
+        except admission.REQUEST_ERRORS as ex:
+            self.abort(context, ex)
+
+    def process_batch_item(self, index, item, monitor=None, priority=scheduler.DEFAULT_PRIORITY):
+        '''
+        Applies the operations of a BatchItem to its Image, and returns a BatchResult.
+
+        Invalid items return a BatchResult with an INVALID_ARGUMENT status code and error message, and items rejected
+        by admission control or stopped by monitor return one with the status code given by admission.get_status.
+        Each item waits for its own compute slot at priority if a scheduler is configured.
+        Unexpected errors are logged and return a BatchResult with an INTERNAL status code.
+        '''
+
+        try:
+            image = self.apply_operations(item.image, item.operations, monitor, priority)
+        except admission.REQUEST_ERRORS as ex:
+            code, message = admission.get_status(ex)
+            return image_pb2.BatchResult(index=index, status_code=code.value[0], error=message)
+        except Exception as ex:
+            logging.exception('Failed to process batch item ' + str(index))
+            return image_pb2.BatchResult(index=index, status_code=grpc.StatusCode.INTERNAL.value[0], error=str(ex))
+        return image_pb2.BatchResult(index=index, image=image)
+
+    def BatchProcess(self, request, context):
+        '''
+        Applies the operations of each BatchItem to its Image, and yields a BatchResult per item.
+
+        Items are processed concurrently in the batch executor, and results are yielded in completion order.
+        See process_batch_item for how invalid items are reported without affecting the other items of the batch.
+        Items that have not started are cancelled if the client disconnects, and items being processed stop
+        at their next row band.
+        '''
+
+        monitor = cancellation.monitor_context(context)
+        priority = scheduler.get_context_priority(context)
+        pending = [self.batch_executor.submit(self.process_batch_item, index, item, monitor, priority)
+                   for index, item in enumerate(request.items)]
+
+        try:
+            for future in futures.as_completed(pending):
+                yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
 
 def serve():
     '''
     Runs server.py.
 
-    Parses arguments passed into server.py. If --port is invalid, ArgumentParser.error() is triggered and program exits.
+    Parses arguments passed into server.py. If --port, --parallelism, --compute-workers, --process-workers,
+    --handler-threads, or a cache size is invalid, ArgumentParser.error() is triggered and program exits.
     Creates grpc server, adds ImageServiceServicer to server, and starts server at address formed by host and port arguments.
+    With --scheduler priority, requests are handled by a pool of --handler-threads threads, and unary and batch requests
+    wait for one of --compute-workers compute slots in order of priority class, deadline, and estimated cost,
+    rising one priority class for every --aging-seconds they wait. With --scheduler fifo, requests are handled
+    by a pool of --compute-workers threads in arrival order.
+    With --mode asyncio, requests are received and sent on an asyncio event loop, and pixel work is run in that pool
+    of threads instead.
+    With --process-workers greater than 0, images of at least --inline-threshold pixels are processed in a pool
+    of worker processes instead.
+    With --cache-bytes greater than 0, results are cached in memory up to that many bytes, and in --cache-dir
+    up to --cache-disk-bytes bytes if given.
+    With --coalesce, concurrent identical requests share one computation.
+    With --micro-batch greater than 0, concurrent requests for images of at most --micro-batch-pixels pixels with the
+    same shape and rotate or mean filter stages are run in stacks of up to --micro-batch requests, collected for up to
+    --micro-batch-wait seconds.
+    With --compression, responses are compressed at the gRPC channel level with gzip or deflate.
+    With --memory-budget greater than 0, each request waits until its estimated working memory fits in that many bytes
+    shared by all requests being processed. Requests are rejected with RESOURCE_EXHAUSTED if more than
+    --admission-queue requests are waiting, or if they wait longer than --admission-timeout seconds.
+    With --metrics-port greater than 0, RPC, stage, and queue metrics are recorded and served in Prometheus
+    text format at http://<--metrics-host>:<--metrics-port>/metrics.
+    With --profile-requests or --profile-seconds, the next RotateImage and MeanFilter requests are profiled from startup,
+    and sending the server SIGUSR1 profiles the next requests again, see utils/profiler.py. Profiles are written
+    to --profile-dir in the format of --profile-mode.
+    With --workers greater than 1, a supervisor runs that many worker processes that each run the server above
+    on the same address with SO_REUSEPORT, restarts workers that exit, and serves the metrics of all workers added
+    together. SIGTERM stops the server after letting requests in flight finish for up to --drain-seconds.
+    With --unix-socket, the server also listens on that Unix domain socket, where unary requests may refer to their
+    Image data in a shared memory segment, and their results are leased to the client in a new segment for
+    --shm-lease seconds, see utils/local_transport.py. It cannot be combined with --workers greater than 1.
     '''
     args_parser = argument_parser.get_server_args_parser()
     args = args_parser.parse_args()
 
     if not args.port.isdigit() or int(args.port) > 65535:
         args_parser.error("Invalid port number " + args.port + " - use a positive integer value less than 65535")
-    
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    image_pb2_grpc.add_ImageServiceServicer_to_server(
-        ImageServiceServicer(), server
-    )
-    server.add_insecure_port(args.host + ':' + args.port)
-    server.start()
-    server.wait_for_termination()
+    if args.parallelism <= 0:
+        args_parser.error("Invalid parallelism " + str(args.parallelism) + " - use a positive integer value")
+    if args.compute_workers <= 0:
+        args_parser.error("Invalid compute workers " + str(args.compute_workers) + " - use a positive integer value")
+    if args.process_workers < 0:
+        args_parser.error("Invalid process workers " + str(args.process_workers) + " - use a non-negative integer value")
+    if args.cache_bytes < 0 or args.cache_disk_bytes < 0:
+        args_parser.error("Invalid cache size - use a non-negative integer value")
+    if (args.profile_requests is not None and args.profile_requests <= 0) or (args.profile_seconds is not None and args.profile_seconds <= 0):
+        args_parser.error("Invalid profile requests or seconds - use positive values")
+    if args.profile_interval <= 0:
+        args_parser.error("Invalid profile interval " + str(args.profile_interval) + " - use a positive value")
+    if args.metrics_port < 0 or args.metrics_port > 65535:
+        args_parser.error("Invalid metrics port " + str(args.metrics_port) + " - use a non-negative integer value less than 65535")
+    if args.memory_budget < 0 or args.admission_queue < 0 or args.admission_timeout < 0:
+        args_parser.error("Invalid memory budget, admission queue, or admission timeout - use non-negative values")
+    if args.handler_threads <= 0 or args.aging_seconds <= 0:
+        args_parser.error("Invalid handler threads or aging seconds - use positive values")
+    if args.micro_batch < 0 or args.micro_batch_wait < 0 or args.micro_batch_pixels <= 0:
+        args_parser.error("Invalid micro-batch size, wait, or pixels - use non-negative values and positive pixels")
+    if args.workers <= 0 or args.drain_seconds < 0:
+        args_parser.error("Invalid workers or drain seconds - use a positive number of workers and non-negative seconds")
+    if args.shm_lease <= 0:
+        args_parser.error("Invalid shared memory lease " + str(args.shm_lease) + " - use a positive value")
+    if args.unix_socket is not None and args.workers > 1:
+        args_parser.error("--unix-socket cannot be shared by several workers - use --workers 1")
+
+    if args.workers == 1:
+        run_server(args)
+        return
+
+    supervisor = prefork.Supervisor(run_server, (args,), args.workers, args.drain_seconds)
+    if args.metrics_port > 0:
+        metrics.serve_metrics(supervisor, args.metrics_host, args.metrics_port)
+    supervisor.run()
+
+def run_server(args, connection=None):
+    '''
+    Runs an ImageService server configured by the parsed arguments of server.py until it is terminated.
+
+    SIGTERM stops the server after letting requests in flight finish for up to args.drain_seconds.
+    Run as a worker process of a prefork.Supervisor, the server listens with SO_REUSEPORT alongside the other workers,
+    leaves SIGINT to the supervisor, and sends its metrics to the supervisor over connection instead of serving them.
+    It stops like on SIGTERM once connection is closed because the supervisor has exited.
+    Once the server has stopped, the worker processes of the compute backend are shut down and the shared memory
+    segments still leased are unlinked.
+
+        Parameters:
+            args (argparse.Namespace): Parsed and validated arguments of server.py
+            connection (multiprocessing.connection.Connection): Pipe to the supervisor, or None if not run by one
+        Returns:
+            None
+    '''
+    options = []
+    if connection is not None:
+        options = [('grpc.so_reuseport', 1)]
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    backend = None
+    if args.process_workers > 0:
+        backend = compute_backend.ProcessPoolBackend(
+            workers=args.process_workers, inline_threshold=args.inline_threshold, warmup=not args.no_warmup)
+
+    cache = None
+    if args.cache_bytes > 0:
+        cache = result_cache.ResultCache(args.cache_bytes, disk_dir=args.cache_dir, disk_max_bytes=args.cache_disk_bytes)
+
+    coalescer = single_flight.SingleFlight() if args.coalesce else None
+
+    threads = args.handler_threads if args.scheduler == 'priority' else args.compute_workers
+    server_metrics = None
+    executor = futures.ThreadPoolExecutor(max_workers=threads)
+    if args.metrics_port > 0:
+        server_metrics = metrics.ServerMetrics()
+        executor = metrics.InstrumentedThreadPoolExecutor(server_metrics, max_workers=threads)
+        if connection is None:
+            metrics.serve_metrics(server_metrics, args.metrics_host, args.metrics_port)
+    if connection is not None:
+        prefork.serve_snapshots(connection, server_metrics)
+
+    request_profiler = profiler.RequestProfiler(args.profile_mode, args.profile_dir, args.profile_interval)
+    if args.profile_requests is not None or args.profile_seconds is not None:
+        request_profiler.arm(args.profile_requests, args.profile_seconds)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: request_profiler.arm(args.profile_requests, args.profile_seconds))
+
+    controller = None
+    if args.memory_budget > 0:
+        controller = admission.AdmissionController(args.memory_budget, args.admission_queue, args.admission_timeout, server_metrics)
+
+    request_scheduler = None
+    if args.scheduler == 'priority':
+        request_scheduler = scheduler.PriorityScheduler(args.compute_workers, args.aging_seconds, server_metrics)
+
+    batcher = None
+    if args.micro_batch > 0:
+        batcher = micro_batch.MicroBatcher(args.micro_batch, args.micro_batch_wait, args.micro_batch_pixels, server_metrics)
+
+    segments = None
+    local_address = None
+    if args.unix_socket is not None:
+        segments = local_transport.SegmentStore(args.shm_lease, server_metrics)
+        segments.start()
+        local_address = 'unix:' + args.unix_socket
+
+    servicer = ImageServiceServicer(parallelism=args.parallelism, compute_backend=backend, result_cache=cache,
+                                    single_flight=coalescer, metrics=server_metrics, profiler=request_profiler,
+                                    admission=controller, scheduler=request_scheduler, micro_batcher=batcher,
+                                    segments=segments)
+    address = args.host + ':' + args.port
+
+    try:
+        if args.mode == 'asyncio':
+            server_interceptors = [interceptors.AsyncMetricsInterceptor(server_metrics)] if server_metrics else []
+            asyncio.run(aio_server.serve_async(address, servicer, executor, server_interceptors,
+                                               codec.CHANNEL_COMPRESSION[args.compression], options, args.drain_seconds,
+                                               local_address))
+            return
+
+        server_interceptors = [interceptors.MetricsInterceptor(server_metrics)] if server_metrics else []
+        server = grpc.server(executor, interceptors=server_interceptors, options=options,
+                             compression=codec.CHANNEL_COMPRESSION[args.compression])
+        image_pb2_grpc.add_ImageServiceServicer_to_server(
+            servicer, server
+        )
+        server.add_insecure_port(address)
+        if local_address is not None:
+            server.add_insecure_port(local_address)
+        server.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop(args.drain_seconds))
+        server.wait_for_termination()
+    finally:
+        if backend is not None:
+            backend.shutdown()
+        if segments is not None:
+            segments.close()
     
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+import pathlib
+import grpc
+from concurrent import futures
+
+from PIL import Image
+
+import image_pb2_grpc, image_pb2
+from aio_server import AsyncImageServiceServicer
+from server import ImageServiceServicer
+from utils.stream_utils import image_to_chunks
+from utils.admission import AdmissionController
+
+class TestAsyncImageServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.parent_path = pathlib.Path(__file__).parent.parent.resolve()
+        test_img = Image.open(str(self.parent_path) + '/test_images/test-png.png')
+        self.test_img = image_pb2.Image(color=True, data=test_img.tobytes(), width=test_img.size[0], height=test_img.size[1])
+
+        self.port = 50053
+        self.executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.server = grpc.aio.server()
+        image_pb2_grpc.add_ImageServiceServicer_to_server(AsyncImageServiceServicer(ImageServiceServicer(), self.executor), self.server)
+        self.server.add_insecure_port(f'localhost:{self.port}')
+        await self.server.start()
+
+        self.channel = grpc.aio.insecure_channel(f'localhost:{self.port}')
+        self.stub = image_pb2_grpc.ImageServiceStub(self.channel)
+
+    async def asyncTearDown(self):
+        await self.channel.close()
+        await self.server.stop(None)
+        self.executor.shutdown()
+
+    async def test_rotate_image(self):
+        expected_img = Image.open(str(self.parent_path) + '/test_images/rotated-90-test-png.png')
+        response = await self.stub.RotateImage(image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=self.test_img))
+        self.assertEqual(response.data, expected_img.tobytes())
+
+    async def test_mean_filter(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        response = await self.stub.MeanFilter(self.test_img)
+        self.assertEqual(response.data, expected_mean_img.tobytes())
+
+    async def test_invalid_image(self):
+        invalid_img = image_pb2.Image(color=True, data=b'', width=16, height=64)
+        with self.assertRaises(grpc.aio.AioRpcError) as ex:
+            await self.stub.MeanFilter(invalid_img)
+        self.assertEqual(ex.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+    async def test_mean_filter_stream(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        chunks = [chunk async for chunk in self.stub.MeanFilterStream(image_to_chunks(self.test_img, chunk_size=100000))]
+        self.assertEqual(chunks[0].header.width, self.test_img.width)
+        self.assertEqual(b''.join(chunk.data for chunk in chunks[1:]), expected_mean_img.tobytes())
+
+    async def test_mean_filter_bands(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        chunks = [chunk async for chunk in self.stub.MeanFilterBands(image_pb2.MeanFilterRequest(image=self.test_img))]
+        self.assertEqual(chunks[0].header.width, self.test_img.width)
+        self.assertEqual(b''.join(chunk.data for chunk in chunks[1:]), expected_mean_img.tobytes())
+
+    async def test_rotate_image_bands_invalid(self):
+        request = image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=image_pb2.Image(color=True, data=b'', width=16, height=64))
+        with self.assertRaises(grpc.aio.AioRpcError) as ex:
+            [chunk async for chunk in self.stub.RotateImageBands(request)]
+        self.assertEqual(ex.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+    async def test_batch_process(self):
+        small_img = image_pb2.Image(color=False, data=bytes(range(12)), width=4, height=3)
+        items = [image_pb2.BatchItem(image=small_img, operations=[image_pb2.Operation(type='ROTATE', rotation='ONE_EIGHTY_DEG')]),
+                 image_pb2.BatchItem(image=image_pb2.Image(), operations=[])]
+        results = {result.index: result async for result in self.stub.BatchProcess(image_pb2.BatchRequest(items=items))}
+        self.assertEqual(results[0].image.data, bytes(reversed(range(12))))
+        self.assertEqual(results[1].status_code, grpc.StatusCode.INVALID_ARGUMENT.value[0])
+
+    async def test_cancelled_acquire_releases_memory(self):
+        admission = AdmissionController(budget=100)
+        servicer = AsyncImageServiceServicer(ImageServiceServicer(admission=admission), self.executor)
+        admission.acquire(100)
+
+        task = asyncio.ensure_future(servicer.acquire_memory(50))
+        while admission.get_waiting() == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        admission.release(100)
+        for _ in range(100):
+            if admission.admitted == 2 and admission.in_use == 0:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(admission.in_use, 0)
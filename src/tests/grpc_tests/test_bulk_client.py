@@ -0,0 +1,76 @@
+import os
+import json
+import argparse
+import tempfile
+import unittest
+import grpc
+from concurrent import futures
+
+from PIL import Image
+
+import image_pb2_grpc
+from server import ImageServiceServicer
+from bulk_client import run_bulk
+from utils.bulk_utils import find_inputs, read_journal, LineWriter
+from utils.benchmark_utils import make_test_image
+from utils.image_utils import image_to_pil_image
+
+class TestBulkClient(unittest.TestCase):
+
+    def setUp(self):
+        self.port = 50056
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+        image_pb2_grpc.add_ImageServiceServicer_to_server(ImageServiceServicer(), self.server)
+        self.server.add_insecure_port(f'localhost:{self.port}')
+        self.server.start()
+        self.channel = grpc.insecure_channel(f'localhost:{self.port}')
+        self.stub = image_pb2_grpc.ImageServiceStub(self.channel)
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.temp_dir.name, 'in')
+        self.output_dir = os.path.join(self.temp_dir.name, 'out')
+        os.makedirs(os.path.join(self.input_dir, 'sub'))
+        for index, (name, mode) in enumerate([('a.png', 'RGB'), ('b.png', 'L'), ('sub/c.png', 'RGBA'), ('d.jpg', 'RGB')]):
+            image_to_pil_image(make_test_image(16 + index, mode, seed=index)).save(os.path.join(self.input_dir, name))
+        with open(os.path.join(self.input_dir, 'broken.png'), 'wb') as file:
+            file.write(b'not a png')
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.stop(None)
+        self.temp_dir.cleanup()
+
+    def run_bulk(self, inputs, encoded=False):
+        args = argparse.Namespace(rotate='NINETY_DEG', mean=True, radius=1, quality=0, encoded=encoded, concurrency=2, workers=1)
+        journal_path = os.path.join(self.output_dir, '.bulk_journal')
+        error_path = os.path.join(self.output_dir, 'bulk_errors.jsonl')
+        os.makedirs(self.output_dir, exist_ok=True)
+        journal, error_report = LineWriter(journal_path), LineWriter(error_path)
+        try:
+            counts = run_bulk(self.stub, inputs, args, journal, error_report)
+        finally:
+            journal.close()
+            error_report.close()
+        with open(error_path) as file:
+            errors = [json.loads(line) for line in file]
+        return counts, read_journal(journal_path), errors
+
+    def test_bulk_directory(self):
+        inputs = find_inputs(self.input_dir, self.output_dir)
+        (processed, failed), done, errors = self.run_bulk(inputs)
+
+        self.assertEqual((processed, failed), (4, 1))
+        self.assertEqual(done, {input_path for input_path, _ in inputs} - {os.path.join(self.input_dir, 'broken.png')})
+        self.assertEqual([(error['input'], error['stage']) for error in errors], [(os.path.join(self.input_dir, 'broken.png'), 'load')])
+
+        result = Image.open(os.path.join(self.output_dir, 'sub', 'c.png'))
+        self.assertEqual((result.mode, result.size), ('RGBA', (18, 18)))
+        self.assertFalse(any(name.startswith('.partial-') for name in os.listdir(self.output_dir)))
+
+    def test_bulk_encoded(self):
+        inputs = find_inputs(os.path.join(self.input_dir, '*.png'), self.output_dir, '.jpg')
+        (processed, failed), done, errors = self.run_bulk(inputs, encoded=True)
+
+        self.assertEqual((processed, failed), (2, 1))
+        self.assertEqual((errors[0]['stage'], errors[0]['code']), ('load', 'UnidentifiedImageError'))
+        self.assertEqual(Image.open(os.path.join(self.output_dir, 'a.jpg')).format, 'JPEG')
@@ -0,0 +1,50 @@
+import unittest
+import os
+import signal
+import pathlib
+
+from PIL import Image
+
+import image_pb2
+from server import ImageServiceServicer
+from utils.compute_backend import ProcessPoolBackend
+
+class TestProcessPoolBackend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.backend = ProcessPoolBackend(workers=1, inline_threshold=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backend.shutdown()
+
+    def setUp(self):
+        self.parent_path = pathlib.Path(__file__).parent.parent.resolve()
+        test_img = Image.open(str(self.parent_path) + '/test_images/test-png.png')
+        self.test_img = image_pb2.Image(color=True, data=test_img.tobytes(), width=test_img.size[0], height=test_img.size[1])
+        self.service = ImageServiceServicer(compute_backend=self.backend)
+
+    def test_mean_filter(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        response = self.service.MeanFilter(self.test_img, None)
+        self.assertEqual(response.data, expected_mean_img.tobytes())
+
+    def test_rotate_image(self):
+        expected_img = Image.open(str(self.parent_path) + '/test_images/rotated-270-test-png.png')
+        rotate_request = image_pb2.ImageRotateRequest(rotation='TWO_SEVENTY_DEG', image=self.test_img)
+        response = self.service.RotateImage(rotate_request, None)
+        self.assertEqual(response.data, expected_img.tobytes())
+        self.assertEqual((response.width, response.height), expected_img.size)
+
+    def test_worker_crash_replaces_pool(self):
+        expected_img = Image.open(str(self.parent_path) + '/test_images/rotated-180-test-png.png')
+        broken_pool = self.backend.pool
+        for pid in list(broken_pool._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        rotate_request = image_pb2.ImageRotateRequest(rotation='ONE_EIGHTY_DEG', image=self.test_img)
+        response = self.service.RotateImage(rotate_request, None)
+
+        self.assertIsNot(self.backend.pool, broken_pool)
+        self.assertEqual(response.data, expected_img.tobytes())
@@ -6,8 +6,15 @@ from concurrent import futures
 from PIL import Image
 
 import image_pb2_grpc, image_pb2
-from client import rotate_image, mean_filter
+from utils.image_ops import image_to_array, mean_filter_array
+from client import process_unary, rotate_image, mean_filter, rotate_image_stream, mean_filter_stream, rotate_image_bands, mean_filter_bands, get_operations, batch_process, process_image, convolve, process, is_streamed
 from server import ImageServiceServicer
+from utils.codec import file_to_image, decode_image
+from utils.stream_utils import chunks_to_image
+from utils.admission import AdmissionController
+from utils.scheduler import PriorityScheduler
+from utils.metrics import ServerMetrics
+from interceptors import PriorityInterceptor
 
 class TestImageClient(unittest.TestCase):
 
@@ -53,6 +60,17 @@ class TestImageClient(unittest.TestCase):
         response = mean_filter(self.stub, self.test_img)
         self.assertEqual(response.data, expected_mean_img.tobytes())
 
+    def test_process_image(self):
+        expected_img = Image.open(str(self.parent_path) + '/test_images/rotate-180-mean-test-png.png')
+        response = process_image(self.stub, self.test_img, get_operations('ONE_EIGHTY_DEG', True))
+        self.assertEqual(response.data, expected_img.tobytes())
+
+    def test_convolve(self):
+        kernel = image_pb2.Kernel(type='CUSTOM', width=3, height=3, weights=[1] * 9)
+        response = convolve(self.stub, self.test_img, kernel)
+        self.assertEqual((response.width, response.height), (self.test_img.width, self.test_img.height))
+        self.assertEqual(len(response.data), len(self.test_img.data))
+
     def test_rotate_ninety_mean(self):
         self.run_mean_rotation_test('NINETY_DEG', '/test_images/rotate-90-mean-test-png.png')
 
@@ -62,3 +80,131 @@ class TestImageClient(unittest.TestCase):
     def test_rotate_two_seventy_mean(self):
         self.run_mean_rotation_test('TWO_SEVENTY_DEG', '/test_images/rotate-270-mean-test-png.png')
 
+    def test_rotate_image_stream(self):
+        expected_img = Image.open(str(self.parent_path) + '/test_images/rotated-90-test-png.png')
+        response = rotate_image_stream(self.stub, self.test_img, 'NINETY_DEG')
+        self.assertEqual(response.data, expected_img.tobytes())
+
+    def test_mean_filter_stream(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        response = mean_filter_stream(self.stub, self.test_img)
+        self.assertEqual(response.data, expected_mean_img.tobytes())
+
+    def test_rotate_image_bands(self):
+        expected_img = Image.open(str(self.parent_path) + '/test_images/rotated-270-test-png.png')
+        response = chunks_to_image(rotate_image_bands(self.stub, self.test_img, 'TWO_SEVENTY_DEG'))
+        self.assertEqual(response.data, expected_img.tobytes())
+
+    def test_mean_filter_bands_exceeds_max_message_size(self):
+        jpeg = file_to_image(str(self.parent_path) + '/test_images/test-jpg-exceeds-max.jpeg')
+        response = chunks_to_image(mean_filter_bands(self.stub, jpeg))
+        self.assertEqual(response.data, mean_filter_array(image_to_array(decode_image(jpeg))).tobytes())
+
+    def test_mean_filter_stream_exceeds_max_message_size(self):
+        large_img = Image.open(str(self.parent_path) + '/test_images/test-jpg-exceeds-max.jpeg')
+        image = image_pb2.Image(color=True, data=large_img.tobytes(), width=large_img.size[0], height=large_img.size[1])
+        response = mean_filter_stream(self.stub, image)
+        self.assertEqual(response.data, mean_filter_array(image_to_array(image)).tobytes())
+
+    def test_process_streamed_radius(self):
+        large_img = Image.open(str(self.parent_path) + '/test_images/test-jpg-exceeds-max.jpeg')
+        image = image_pb2.Image(color=True, data=large_img.tobytes(), width=large_img.size[0], height=large_img.size[1])
+        self.assertTrue(is_streamed(image))
+        self.assertFalse(is_streamed(self.test_img))
+        with self.assertRaises(ValueError):
+            process(self.stub, image, None, True, 2)
+
+    def test_batch_process(self):
+        expected_rotate_img = Image.open(str(self.parent_path) + '/test_images/rotated-180-test-png.png')
+        small_img = Image.open(str(self.parent_path) + '/test_images/test-png.png').crop((0, 0, 40, 30))
+        small_image = image_pb2.Image(color=True, data=small_img.tobytes(), width=40, height=30)
+        invalid_img = image_pb2.Image(color=True, data=b'\xff' * 10, width=16, height=64)
+        items = [
+            (self.test_img, get_operations('ONE_EIGHTY_DEG', False)),
+            (invalid_img, get_operations(None, True)),
+            (small_image, get_operations(None, True)),
+        ]
+
+        results = {result.index: result for result in batch_process(self.stub, items)}
+
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual(results[0].status_code, grpc.StatusCode.OK.value[0])
+        self.assertEqual(results[0].image.data, expected_rotate_img.tobytes())
+        self.assertEqual(results[1].status_code, grpc.StatusCode.INVALID_ARGUMENT.value[0])
+        self.assertEqual(results[2].status_code, grpc.StatusCode.OK.value[0])
+        self.assertEqual(results[2].image.data, mean_filter_array(image_to_array(small_image)).tobytes())
+
+    def test_invalid_image(self):
+        invalid_img = image_pb2.Image(color=True, data=b'', width=16, height=64)
+        with self.assertRaises(grpc.RpcError) as ex:
+            mean_filter(self.stub, invalid_img)
+        self.assertEqual(ex.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        with self.assertRaises(grpc.RpcError) as ex:
+            chunks_to_image(rotate_image_bands(self.stub, invalid_img, 'NINETY_DEG'))
+        self.assertEqual(ex.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        self.assertEqual(mean_filter(self.stub, self.test_img).width, self.test_img.width)
+
+    def test_header_bands_must_match_color(self):
+        for color, bands in [(False, 3), (True, 1)]:
+            header = image_pb2.ImageHeader(color=color, width=2, height=2, bands=bands)
+            chunks = [image_pb2.ImageChunk(header=header), image_pb2.ImageChunk(data=bytes(4 * bands), row_start=0, row_count=2)]
+            with self.assertRaises(grpc.RpcError) as ex:
+                list(self.stub.MeanFilterStream(iter(chunks)))
+            self.assertEqual(ex.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+    def test_memory_budget_exceeded(self):
+        port = 50057
+        controller = AdmissionController(len(self.test_img.data) * 4, max_waiting=0)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        image_pb2_grpc.add_ImageServiceServicer_to_server(ImageServiceServicer(admission=controller), server)
+        server.add_insecure_port(f'localhost:{port}')
+        server.start()
+        try:
+            with grpc.insecure_channel(f'localhost:{port}') as channel:
+                stub = image_pb2_grpc.ImageServiceStub(channel)
+                self.assertEqual(rotate_image(stub, self.test_img, 'NINETY_DEG').height, self.test_img.width)
+                with self.assertRaises(grpc.RpcError) as ex:
+                    mean_filter(stub, self.test_img)
+                self.assertEqual(ex.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+                controller.acquire(len(self.test_img.data) * 2)
+                with self.assertRaises(grpc.RpcError) as ex:
+                    rotate_image(stub, self.test_img, 'NINETY_DEG')
+                self.assertEqual(ex.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+                controller.release(len(self.test_img.data) * 2)
+                self.assertEqual(controller.in_use, 0)
+        finally:
+            server.stop(None)
+
+    def test_priority_scheduled(self):
+        port = 50058
+        metrics = ServerMetrics()
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        image_pb2_grpc.add_ImageServiceServicer_to_server(ImageServiceServicer(scheduler=PriorityScheduler(1, metrics=metrics)), server)
+        server.add_insecure_port(f'localhost:{port}')
+        server.start()
+        try:
+            with grpc.insecure_channel(f'localhost:{port}') as channel:
+                stub = image_pb2_grpc.ImageServiceStub(grpc.intercept_channel(channel, PriorityInterceptor('high')))
+                self.assertEqual(rotate_image(stub, self.test_img, 'NINETY_DEG').height, self.test_img.width)
+                self.assertEqual(rotate_image(image_pb2_grpc.ImageServiceStub(channel), self.test_img, 'NINETY_DEG').height, self.test_img.width)
+                self.assertEqual(metrics.scheduler_wait.get_count('high'), 1)
+                self.assertEqual(metrics.scheduler_wait.get_count('normal'), 1)
+
+                stub = image_pb2_grpc.ImageServiceStub(grpc.intercept_channel(channel, PriorityInterceptor('urgent')))
+                with self.assertRaises(grpc.RpcError) as ex:
+                    mean_filter(stub, self.test_img)
+                self.assertEqual(ex.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        finally:
+            server.stop(None)
+
+    def test_encoded_compressed_request(self):
+        with grpc.insecure_channel(f'localhost:{self.port}', compression=grpc.Compression.Gzip) as channel:
+            stub = image_pb2_grpc.ImageServiceStub(channel)
+            image = file_to_image(str(self.parent_path) + '/test_images/test-png.png', image_pb2.Image.Encoding.PNG)
+            response = process_unary(stub, image, 'NINETY_DEG', True)
+
+        expected = process_unary(self.stub, self.test_img, 'NINETY_DEG', True)
+        self.assertEqual(response.encoding, image_pb2.Image.Encoding.PNG)
+        self.assertEqual(decode_image(response).data, expected.data)
+        self.assertLess(len(response.data), len(expected.data))
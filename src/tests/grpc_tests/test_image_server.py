@@ -1,12 +1,27 @@
+import os
+import tempfile
 import unittest
 import pathlib
 import grpc
 from concurrent import futures
 
+import numpy as np
+
 from PIL import Image
 
 import image_pb2_grpc, image_pb2
 from server import ImageServiceServicer
+from utils.image_ops import image_to_array, convolve_array
+from utils.kernels import SHARPEN_KERNEL
+from utils.result_cache import ResultCache
+from utils.single_flight import SingleFlight
+from utils.profiler import RequestProfiler
+from utils.codec import encode_image, decode_image
+from utils.stream_utils import image_to_chunks, chunks_to_image, RotateStreamProcessor, MeanFilterStreamProcessor
+from utils.cancellation import RequestMonitor, CancelledError, DeadlineExceededError
+from utils.micro_batch import MicroBatcher
+from utils.scheduler import PriorityScheduler
+from utils.admission import AdmissionController, estimate_memory
 
 class TestImageServer(unittest.TestCase):
 
@@ -43,6 +58,86 @@ class TestImageServer(unittest.TestCase):
         response = self.service.MeanFilter(self.test_img, None)
         self.assertEqual(response.data, expected_mean_img.tobytes())
 
+    def test_mean_filter_parallel(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        service = ImageServiceServicer(parallelism=4, parallel_threshold=0)
+        response = service.MeanFilter(self.test_img, None)
+        self.assertEqual(response.data, expected_mean_img.tobytes())
+
+    def test_mean_filter_radius_one(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        for radius in [0, 1]:
+            response = self.service.MeanFilterRadius(image_pb2.MeanFilterRequest(image=self.test_img, radius=radius), None)
+            self.assertEqual(response.data, expected_mean_img.tobytes())
+
+    def test_mean_filter_radius(self):
+        request = image_pb2.MeanFilterRequest(image=self.test_img, radius=5)
+        response = self.service.MeanFilterRadius(request, None)
+        operations = [image_pb2.Operation(type='MEAN_FILTER', radius=5)]
+        processed = self.service.ProcessImage(image_pb2.ProcessImageRequest(image=self.test_img, operations=operations), None)
+        self.assertEqual(len(response.data), len(self.test_img.data))
+        self.assertNotEqual(response.data, self.service.MeanFilter(self.test_img, None).data)
+        self.assertEqual(response.data, processed.data)
+
+    def test_convolve(self):
+        sharpen = image_pb2.ConvolveRequest(image=self.test_img, kernel=image_pb2.Kernel(type='SHARPEN'))
+        response = self.service.Convolve(sharpen, None)
+        expected = convolve_array(image_to_array(self.test_img), np.array(SHARPEN_KERNEL, dtype=float))
+        self.assertEqual(response.data, expected.tobytes())
+
+        gaussian = image_pb2.Kernel(type='GAUSSIAN', sigma=2)
+        response = self.service.Convolve(image_pb2.ConvolveRequest(image=self.test_img, kernel=gaussian), None)
+        operations = [image_pb2.Operation(type='ROTATE', rotation='NINETY_DEG'), image_pb2.Operation(type='CONVOLVE', kernel=gaussian)]
+        processed = self.service.ProcessImage(image_pb2.ProcessImageRequest(image=self.test_img, operations=operations), None)
+        self.assertEqual(processed.data, self.service.RotateImage(image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=response), None).data)
+
+    def run_process_image_test(self, operations, expected_image_path):
+        expected_img = Image.open(str(self.parent_path) + expected_image_path)
+        request = image_pb2.ProcessImageRequest(image=self.test_img, operations=operations)
+        response = self.service.ProcessImage(request, None)
+        self.assertEqual(response.data, expected_img.tobytes())
+        self.assertEqual((response.width, response.height), expected_img.size)
+
+    def test_process_image_mean_rotate(self):
+        operations = [image_pb2.Operation(type='MEAN_FILTER'), image_pb2.Operation(type='ROTATE', rotation='NINETY_DEG')]
+        self.run_process_image_test(operations, '/test_images/rotate-90-mean-test-png.png')
+
+    def test_process_image_collapsed_rotations(self):
+        operations = [image_pb2.Operation(type='ROTATE', rotation='NINETY_DEG'), image_pb2.Operation(type='ROTATE', rotation='ONE_EIGHTY_DEG')]
+        self.run_process_image_test(operations, '/test_images/rotated-270-test-png.png')
+
+    def test_mean_filter_cached(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        cache = ResultCache(16777216)
+        service = ImageServiceServicer(result_cache=cache)
+
+        first = service.MeanFilter(self.test_img, None)
+        second = service.MeanFilter(self.test_img, None)
+
+        self.assertIs(first, second)
+        self.assertEqual(second.data, expected_mean_img.tobytes())
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_cache_hit_does_not_wait_for_slot(self):
+        service = ImageServiceServicer(result_cache=ResultCache(16777216), scheduler=PriorityScheduler(1))
+        first = service.MeanFilter(self.test_img, None)
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor, service.scheduler.slot('normal'):
+            second = executor.submit(service.MeanFilter, self.test_img, None).result(timeout=5)
+
+        self.assertIs(first, second)
+
+    def test_mean_filter_coalesced(self):
+        expected_mean_img = Image.open(str(self.parent_path) + '/test_images/mean-test-png.png')
+        service = ImageServiceServicer(single_flight=SingleFlight())
+
+        with futures.ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(lambda _: service.MeanFilter(self.test_img, None), range(4)))
+
+        for response in responses:
+            self.assertEqual(response.data, expected_mean_img.tobytes())
+        self.assertEqual(service.single_flight.leaders + service.single_flight.shared, 4)
+
     def test_rotate_ninety_mean(self):
         self.run_mean_rotation_test('NINETY_DEG', '/test_images/rotate-90-mean-test-png.png')
 
@@ -53,4 +148,158 @@ class TestImageServer(unittest.TestCase):
         self.run_mean_rotation_test('TWO_SEVENTY_DEG', '/test_images/rotate-270-mean-test-png.png')
 
 
-        
\ No newline at end of file
+        
+
+    def run_stream_test(self, method, rotation_string, expected_image_path):
+        expected_img = Image.open(str(self.parent_path) + expected_image_path)
+        chunks = image_to_chunks(self.test_img, rotation_string, chunk_size=100000)
+        response = chunks_to_image(method(chunks, None))
+        self.assertEqual(response.data, expected_img.tobytes())
+        self.assertEqual((response.width, response.height), expected_img.size)
+
+    def test_rotate_image_stream_ninety(self):
+        self.run_stream_test(self.service.RotateImageStream, 'NINETY_DEG', '/test_images/rotated-90-test-png.png')
+
+    def test_rotate_image_stream_one_eighty(self):
+        self.run_stream_test(self.service.RotateImageStream, 'ONE_EIGHTY_DEG', '/test_images/rotated-180-test-png.png')
+
+    def test_rotate_image_stream_two_seventy(self):
+        self.run_stream_test(self.service.RotateImageStream, 'TWO_SEVENTY_DEG', '/test_images/rotated-270-test-png.png')
+
+    def test_mean_filter_stream(self):
+        self.run_stream_test(self.service.MeanFilterStream, 'NONE', '/test_images/mean-test-png.png')
+
+    def run_bands_test(self, method, request, expected):
+        chunks = list(method(request, None))
+        self.assertEqual((chunks[0].header.width, chunks[0].header.height), (expected.width, expected.height))
+        next_row = 0
+        for chunk in chunks[1:]:
+            self.assertEqual(chunk.row_start, next_row)
+            next_row += chunk.row_count
+        self.assertEqual(next_row, expected.height)
+        self.assertEqual(chunks_to_image(chunks).data, expected.data)
+
+    def test_rotate_image_bands(self):
+        for rotation in ['NINETY_DEG', 'ONE_EIGHTY_DEG', 'TWO_SEVENTY_DEG']:
+            request = image_pb2.ImageRotateRequest(rotation=rotation, image=self.test_img)
+            self.run_bands_test(self.service.RotateImageBands, request, self.service.RotateImage(request, None))
+
+    def test_mean_filter_bands(self):
+        self.run_bands_test(self.service.MeanFilterBands, image_pb2.MeanFilterRequest(image=self.test_img),
+                            self.service.MeanFilter(self.test_img, None))
+        request = image_pb2.MeanFilterRequest(image=self.test_img, radius=3)
+        self.run_bands_test(self.service.MeanFilterBands, request, self.service.MeanFilterRadius(request, None))
+
+    def test_invalid_bands_requests(self):
+        with self.assertRaises(ValueError):
+            next(self.service.mean_filter_bands(image_pb2.Image(color=True, data=b'', width=16, height=64)))
+        with self.assertRaises(ValueError):
+            next(self.service.mean_filter_bands(self.test_img, radius=16))
+        with self.assertRaises(ValueError):
+            next(self.service.rotate_image_bands(self.test_img, 7))
+        png = encode_image(self.test_img, image_pb2.Image.Encoding.PNG)
+        png.response_encoding = image_pb2.Image.Encoding.PNG
+        with self.assertRaises(ValueError):
+            next(self.service.mean_filter_bands(png))
+
+    def test_deadline_rejected_up_front(self):
+        with self.assertRaises(DeadlineExceededError):
+            self.service.mean_filter(self.test_img, 1, RequestMonitor(0.0001))
+        with self.assertRaises(DeadlineExceededError):
+            self.service.apply_operations(self.test_img, [image_pb2.Operation(type='ROTATE', rotation='NINETY_DEG')], RequestMonitor(0.0001))
+        response = self.service.mean_filter(self.test_img, 1, RequestMonitor(60))
+        self.assertEqual(response.data, self.service.mean_filter(self.test_img).data)
+
+    def test_cancelled_request_stops(self):
+        monitor = RequestMonitor()
+        monitor.terminate()
+        with self.assertRaises(CancelledError):
+            self.service.rotate_image(self.test_img, image_pb2.ImageRotateRequest.Rotation.NINETY_DEG, monitor)
+        with self.assertRaises(CancelledError):
+            list(self.service.mean_filter_bands(self.test_img, 1, monitor))
+        with self.assertRaises(CancelledError):
+            list(self.service.process_stream(RotateStreamProcessor, image_pb2.Operation.Type.ROTATE, image_to_chunks(self.test_img), monitor))
+        with self.assertRaises(CancelledError):
+            list(self.service.process_stream(MeanFilterStreamProcessor, image_pb2.Operation.Type.MEAN_FILTER, image_to_chunks(self.test_img), monitor))
+
+        service = ImageServiceServicer(single_flight=SingleFlight(), result_cache=ResultCache(1 << 24))
+        with self.assertRaises(CancelledError):
+            service.mean_filter(self.test_img, 1, monitor)
+        self.assertEqual(service.mean_filter(self.test_img, 1, RequestMonitor()).data, self.service.mean_filter(self.test_img).data)
+
+    def test_micro_batched_requests(self):
+        batcher = MicroBatcher(max_batch=4, max_wait=1)
+        service = ImageServiceServicer(micro_batcher=batcher)
+        icons = [image_pb2.Image(color=True, data=np.random.default_rng(seed).integers(0, 256, 16 * 16 * 3, dtype=np.uint8).tobytes(),
+                                 width=16, height=16) for seed in range(4)]
+        requests = [image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=icon) for icon in icons]
+        with futures.ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(lambda request: service.RotateImage(request, None), requests))
+        self.assertEqual(batcher.batches, 1)
+        for request, response in zip(requests, responses):
+            self.assertEqual(response.data, self.service.RotateImage(request, None).data)
+
+        self.assertEqual(service.MeanFilter(self.test_img, None).data, self.service.MeanFilter(self.test_img, None).data)
+        self.assertEqual(batcher.batched, 4)
+
+    def test_profiled_requests(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profiler = RequestProfiler(output_dir=temp_dir)
+            service = ImageServiceServicer(profiler=profiler)
+            expected = self.service.MeanFilter(self.test_img, None)
+
+            self.assertEqual(service.MeanFilter(self.test_img, None).data, expected.data)
+            self.assertEqual(os.listdir(temp_dir), [])
+
+            profiler.arm(requests=2)
+            self.assertEqual(service.MeanFilter(self.test_img, None).data, expected.data)
+            service.RotateImage(image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=self.test_img), None)
+            names = sorted(name.split('-', 3)[3] for name in os.listdir(temp_dir))
+            size = '{}x{}-RGBA'.format(self.test_img.width, self.test_img.height)
+            self.assertEqual(names, ['MeanFilter-' + size + '.json', 'MeanFilter-' + size + '.pstats',
+                                     'RotateImage-' + size + '.json', 'RotateImage-' + size + '.pstats'])
+
+    def test_encoded_requests(self):
+        png = encode_image(self.test_img, image_pb2.Image.Encoding.PNG)
+        expected = self.service.MeanFilter(self.test_img, None)
+
+        png.response_encoding = image_pb2.Image.Encoding.PNG
+        response = self.service.MeanFilter(png, None)
+        self.assertEqual(response.encoding, image_pb2.Image.Encoding.PNG)
+        self.assertEqual(decode_image(response).data, expected.data)
+
+        png.response_encoding = image_pb2.Image.Encoding.RAW
+        self.assertEqual(self.service.MeanFilter(png, None).data, expected.data)
+
+        request = image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=png)
+        request.image.response_encoding = image_pb2.Image.Encoding.JPEG
+        response = self.service.RotateImage(request, None)
+        self.assertEqual(response.encoding, image_pb2.Image.Encoding.JPEG)
+        self.assertEqual((response.width, response.height), (self.test_img.height, self.test_img.width))
+
+    def test_encoded_request_admitted_once(self):
+        png = encode_image(self.test_img, image_pb2.Image.Encoding.PNG)
+        png.response_encoding = image_pb2.Image.Encoding.PNG
+        budget = estimate_memory(png, [image_pb2.Operation.Type.MEAN_FILTER])
+        service = ImageServiceServicer(admission=AdmissionController(budget, timeout=1), scheduler=PriorityScheduler(1))
+
+        service.MeanFilter(png, None)
+        self.assertEqual(service.admission.admitted, 1)
+        self.assertEqual(service.admission.in_use, 0)
+
+    def test_invalid_encoded_requests(self):
+        png = encode_image(self.test_img, image_pb2.Image.Encoding.PNG)
+        with self.assertRaises(ValueError):
+            self.service.mean_filter(image_pb2.Image(data=png.data, encoding=image_pb2.Image.Encoding.JPEG))
+        with self.assertRaises(ValueError):
+            self.service.mean_filter(image_pb2.Image(data=png.data, encoding=7))
+        with self.assertRaises(ValueError):
+            self.service.mean_filter(image_pb2.Image(data=png.data, encoding=image_pb2.Image.Encoding.PNG,
+                                                     response_encoding=image_pb2.Image.Encoding.JPEG, response_quality=101))
+
+        large = image_pb2.Image(color=False, data=bytes(2048 * 2049), width=2048, height=2049)
+        large_png = image_pb2.Image(data=encode_image(large, image_pb2.Image.Encoding.PNG).data, encoding=image_pb2.Image.Encoding.PNG)
+        with self.assertRaises(ValueError):
+            self.service.mean_filter(large_png)
+        large_png.response_encoding = image_pb2.Image.Encoding.PNG
+        self.assertEqual(decode_image(self.service.mean_filter(large_png)).data, large.data)
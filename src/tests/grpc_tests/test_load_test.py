@@ -0,0 +1,45 @@
+import unittest
+import grpc
+from concurrent import futures
+
+import image_pb2_grpc
+from server import ImageServiceServicer
+from load_test import run_load, get_report
+from utils.benchmark_utils import make_test_image
+from utils.load_utils import get_arrival_offsets
+
+class TestLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.port = 50054
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+        image_pb2_grpc.add_ImageServiceServicer_to_server(ImageServiceServicer(), self.server)
+        self.server.add_insecure_port(f'localhost:{self.port}')
+        self.server.start()
+
+        self.channels = [grpc.insecure_channel(f'localhost:{self.port}') for _ in range(2)]
+        self.stubs = [image_pb2_grpc.ImageServiceStub(channel) for channel in self.channels]
+
+    def tearDown(self):
+        for channel in self.channels:
+            channel.close()
+        self.server.stop(None)
+
+    def test_run_load(self):
+        images = [make_test_image(32, 'RGB'), make_test_image(16, 'L')]
+        mix = [('rotate', 2), ('mean', 1), ('process', 1)]
+        offsets = get_arrival_offsets(200, 0.5)
+        recorder, elapsed = run_load(self.stubs, mix, images, offsets, concurrency=8)
+
+        report = get_report(recorder, elapsed, 200)
+        self.assertEqual(report['overall']['count'], 100)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(set(report['operations']), {'rotate', 'mean', 'process'})
+        self.assertEqual(sum(count for _, count in report['histogram']), 100)
+        self.assertGreaterEqual(elapsed, offsets[-1])
+
+    def test_errors_are_recorded(self):
+        self.server.stop(None)
+        recorder, elapsed = run_load(self.stubs, [('mean', 1)], [make_test_image(8, 'L')], [0.0, 0.01], concurrency=2)
+        self.assertEqual(recorder.get_all_latencies(), [])
+        self.assertEqual(sum(recorder.errors.values()), 2)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+import grpc
+from concurrent import futures
+from multiprocessing import shared_memory
+
+import image_pb2_grpc, image_pb2
+import client
+from server import ImageServiceServicer
+from utils.local_transport import SegmentStore, share_image, read_image
+from utils.benchmark_utils import make_test_image
+from utils.image_ops import image_to_array
+from utils.pipeline import run_stages
+
+class TestLocalTransportServer(unittest.TestCase):
+
+    def setUp(self):
+        self.port = 50060
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, 'image.sock')
+        self.segments = SegmentStore()
+        self.service = ImageServiceServicer(segments=self.segments)
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        image_pb2_grpc.add_ImageServiceServicer_to_server(self.service, self.server)
+        self.server.add_insecure_port(f'localhost:{self.port}')
+        self.server.add_insecure_port('unix:' + self.socket_path)
+        self.server.start()
+
+        self.channel = grpc.insecure_channel('unix:' + self.socket_path)
+        self.stub = image_pb2_grpc.ImageServiceStub(self.channel)
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.stop(None)
+        self.segments.close()
+        self.directory.cleanup()
+
+    def test_rotate_image(self):
+        image = make_test_image(32, 'RGB')
+        expected = self.service.RotateImage(image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=image), None)
+        with share_image(image) as shared:
+            response = self.stub.RotateImage(image_pb2.ImageRotateRequest(rotation='NINETY_DEG', image=shared))
+        self.assertEqual(response.data, b'')
+        self.assertEqual(read_image(response), expected)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=response.shared_memory.name)
+
+    def test_process_shared(self):
+        image = make_test_image(32, 'RGBA')
+        expected = client.process_unary(self.stub, image, 'ONE_EIGHTY_DEG', True, 2)
+        self.assertEqual(client.process_shared(self.stub, image, 'ONE_EIGHTY_DEG', True, 2), expected)
+        self.assertEqual(client.process_shared(self.stub, image, None, True), client.mean_filter(self.stub, image))
+
+    def test_larger_than_message_size(self):
+        image = make_test_image(1400, 'RGB')
+        expected = run_stages(image_to_array(image), [(image_pb2.Operation.Type.ROTATE, image_pb2.ImageRotateRequest.NINETY_DEG, 0)])
+        self.assertEqual(client.process_shared(self.stub, image, 'NINETY_DEG', False).data, expected.tobytes())
+
+    def test_rejects_shared_memory_over_tcp(self):
+        with grpc.insecure_channel(f'localhost:{self.port}') as channel:
+            with share_image(make_test_image(16, 'L')) as shared:
+                with self.assertRaises(grpc.RpcError) as error:
+                    image_pb2_grpc.ImageServiceStub(channel).MeanFilter(shared)
+        self.assertEqual(error.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+import urllib.error
+import urllib.request
+import grpc
+from concurrent import futures
+
+import image_pb2, image_pb2_grpc
+import aio_server
+from server import ImageServiceServicer
+from interceptors import MetricsInterceptor, AsyncMetricsInterceptor
+from utils.metrics import ServerMetrics, InstrumentedThreadPoolExecutor, serve_metrics
+from utils.benchmark_utils import make_test_image
+from utils.stream_utils import image_to_chunks, chunks_to_image
+
+class TestMetricsServer(unittest.TestCase):
+
+    def setUp(self):
+        self.port = 50055
+        self.metrics = ServerMetrics()
+        executor = InstrumentedThreadPoolExecutor(self.metrics, max_workers=10)
+        self.server = grpc.server(executor, interceptors=[MetricsInterceptor(self.metrics)])
+        image_pb2_grpc.add_ImageServiceServicer_to_server(ImageServiceServicer(metrics=self.metrics), self.server)
+        self.server.add_insecure_port(f'localhost:{self.port}')
+        self.server.start()
+        self.http_server = serve_metrics(self.metrics, '127.0.0.1', 0)
+
+        self.channel = grpc.insecure_channel(f'localhost:{self.port}')
+        self.stub = image_pb2_grpc.ImageServiceStub(self.channel)
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.stop(None)
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def scrape(self, path='/metrics'):
+        with urllib.request.urlopen('http://127.0.0.1:{}{}'.format(self.http_server.server_port, path)) as response:
+            return response.read().decode()
+
+    def test_unary_metrics(self):
+        image = make_test_image(16, 'RGB')
+        self.stub.MeanFilter(image)
+        self.stub.MeanFilter(image)
+
+        self.assertEqual(self.metrics.rpcs.get('MeanFilter', 'OK'), 2)
+        self.assertEqual(self.metrics.rpc_duration.get_count('MeanFilter'), 2)
+        self.assertEqual(self.metrics.received_bytes.get('MeanFilter'), 2 * image.ByteSize())
+        self.assertEqual(self.metrics.sent_bytes.get('MeanFilter'), 2 * image.ByteSize())
+        self.assertEqual(self.metrics.in_flight.get('MeanFilter'), 0)
+        for stage in ['validate', 'decode', 'compute', 'encode', 'queue']:
+            self.assertGreaterEqual(self.metrics.stage_duration.get_count(stage), 2)
+
+        text = self.scrape()
+        self.assertIn('image_service_rpcs_total{method="MeanFilter",code="OK"} 2\n', text)
+        self.assertIn('image_service_rpc_duration_seconds_count{method="MeanFilter"} 2\n', text)
+        self.assertIn('image_service_stage_duration_seconds_count{stage="compute"}', text)
+
+    def test_stream_metrics(self):
+        image = make_test_image(64, 'L')
+        request = image_pb2.BatchRequest(items=[image_pb2.BatchItem(image=image)] * 3)
+        self.assertEqual(len(list(self.stub.BatchProcess(request))), 3)
+        result = chunks_to_image(self.stub.MeanFilterStream(image_to_chunks(image)))
+
+        self.assertEqual(self.metrics.rpcs.get('BatchProcess', 'OK'), 1)
+        self.assertEqual(self.metrics.rpcs.get('MeanFilterStream', 'OK'), 1)
+        self.assertGreater(self.metrics.received_bytes.get('MeanFilterStream'), len(image.data))
+        self.assertGreater(self.metrics.sent_bytes.get('MeanFilterStream'), len(result.data))
+
+    def test_unknown_path(self):
+        request = image_pb2.ImageRotateRequest(rotation=image_pb2.ImageRotateRequest.Rotation.NINETY_DEG, image=make_test_image(8, 'L'))
+        self.stub.RotateImage(request)
+        with self.assertRaises(urllib.error.HTTPError):
+            self.scrape('/')
+        self.assertEqual(self.metrics.rpcs.get('RotateImage', 'OK'), 1)
+
+    def test_aio_metrics(self):
+        metrics = ServerMetrics()
+        servicer = ImageServiceServicer(metrics=metrics)
+
+        async def run():
+            server = grpc.aio.server(interceptors=[AsyncMetricsInterceptor(metrics)])
+            image_pb2_grpc.add_ImageServiceServicer_to_server(
+                aio_server.AsyncImageServiceServicer(servicer, futures.ThreadPoolExecutor(max_workers=2)), server)
+            port = server.add_insecure_port('localhost:0')
+            await server.start()
+            try:
+                async with grpc.aio.insecure_channel(f'localhost:{port}') as channel:
+                    stub = image_pb2_grpc.ImageServiceStub(channel)
+                    await stub.MeanFilter(make_test_image(8, 'RGB'))
+                    with self.assertRaises(grpc.aio.AioRpcError) as context:
+                        await stub.MeanFilter(image_pb2.Image(color=True, data=b'abc', width=8, height=8))
+                    self.assertEqual(context.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+                    chunks = [chunk async for chunk in stub.RotateImageStream(iter(image_to_chunks(make_test_image(8, 'L'))))]
+                    self.assertGreater(len(chunks), 1)
+            finally:
+                await server.stop(None)
+
+        asyncio.run(run())
+        self.assertEqual(metrics.rpcs.get('MeanFilter', 'OK'), 1)
+        self.assertEqual(metrics.rpcs.get('MeanFilter', 'INVALID_ARGUMENT'), 1)
+        self.assertEqual(metrics.rpcs.get('RotateImageStream', 'OK'), 1)
+        self.assertEqual(metrics.in_flight.get('MeanFilter'), 0)
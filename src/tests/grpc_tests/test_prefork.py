@@ -0,0 +1,68 @@
+import os
+import time
+import signal
+import unittest
+import grpc
+
+import image_pb2_grpc
+from server import run_server
+from utils.argument_parser import get_server_args_parser
+from utils.prefork import Supervisor
+from utils.benchmark_utils import make_test_image
+
+class TestPrefork(unittest.TestCase):
+
+    def setUp(self):
+        self.port = 50059
+        args = get_server_args_parser().parse_args(['--host', 'localhost', '--port', str(self.port), '--metrics-port', '1',
+                                                    '--compute-workers', '2', '--handler-threads', '4', '--drain-seconds', '5'])
+        self.supervisor = Supervisor(run_server, (args,), 2, args.drain_seconds)
+        self.supervisor.start()
+        self.channels = [grpc.insecure_channel(f'localhost:{self.port}', options=[('grpc.use_local_subchannel_pool', 1)])
+                         for _ in range(4)]
+        for channel in self.channels:
+            grpc.channel_ready_future(channel).result(timeout=30)
+
+    def tearDown(self):
+        for channel in self.channels:
+            channel.close()
+        self.supervisor.stop()
+
+    def test_workers_share_port(self):
+        image = make_test_image(16, 'RGB')
+        for channel in self.channels:
+            image_pb2_grpc.ImageServiceStub(channel).MeanFilter(image)
+
+        self.assertIn('image_service_rpcs_total{method="MeanFilter",code="OK"} 4\n', self.supervisor.render())
+
+    def test_restarts_worker(self):
+        worker = self.supervisor.workers[0]
+        os.kill(worker.process.pid, signal.SIGKILL)
+        worker.process.join(timeout=5)
+
+        deadline = time.monotonic() + 10
+        while self.supervisor.workers[0] is worker and time.monotonic() < deadline:
+            self.supervisor.check_workers()
+            time.sleep(0.05)
+        self.assertIsNot(self.supervisor.workers[0], worker)
+        self.assertTrue(self.supervisor.workers[0].process.is_alive())
+        self.assertEqual(self.supervisor.metrics.worker_restarts.get(), 1)
+
+    def test_stop_drains_workers(self):
+        workers = list(self.supervisor.workers)
+        self.supervisor.stop()
+        for worker in workers:
+            self.assertFalse(worker.process.is_alive())
+            self.assertEqual(worker.process.exitcode, 0)
+        self.supervisor.check_workers()
+        self.assertEqual(self.supervisor.workers, workers)
+
+    def test_worker_stops_without_supervisor(self):
+        worker = self.supervisor.workers[0]
+        with worker.lock:
+            worker.connection.close()
+        worker.process.join(timeout=10)
+        self.assertEqual(worker.process.exitcode, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import sys
+import time
+import threading
+from concurrent import futures
+sys.path.append("..")
+
+import grpc
+
+import image_pb2
+from utils.admission import AdmissionController, ResourceExhaustedError, get_status, estimate_memory, estimate_band_memory, BASE_MEMORY, STAGE_MEMORY
+from utils.codec import encode_image
+from utils.metrics import ServerMetrics
+
+class TestAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.image = image_pb2.Image(color=True, data=bytes(64 * 32 * 3), width=64, height=32)
+
+    def wait_for_waiting(self, controller, count):
+        while controller.get_waiting() < count:
+            time.sleep(0.001)
+
+    def test_estimate_memory(self):
+        size = len(self.image.data)
+        self.assertEqual(estimate_memory(self.image, [image_pb2.Operation.Type.ROTATE]), size * BASE_MEMORY)
+        self.assertEqual(estimate_memory(self.image, [image_pb2.Operation.Type.ROTATE, image_pb2.Operation.Type.MEAN_FILTER]),
+                         size * (BASE_MEMORY + STAGE_MEMORY[image_pb2.Operation.Type.MEAN_FILTER]))
+
+        png = encode_image(self.image, image_pb2.Image.Encoding.PNG)
+        self.assertEqual(estimate_memory(png, []), size * (BASE_MEMORY + 1) + len(png.data))
+        png.response_encoding = image_pb2.Image.Encoding.PNG
+        self.assertEqual(estimate_memory(png, []), size * (BASE_MEMORY + 2) + len(png.data))
+
+        with self.assertRaises(ValueError):
+            estimate_memory(image_pb2.Image(data=b'not a png', encoding=image_pb2.Image.Encoding.PNG), [])
+
+    def test_estimate_band_memory(self):
+        self.assertEqual(estimate_band_memory(1000, image_pb2.Operation.Type.ROTATE, 100), 1200)
+        self.assertEqual(estimate_band_memory(50, image_pb2.Operation.Type.ROTATE, 100), 150)
+
+    def test_get_status(self):
+        self.assertEqual(get_status(ValueError('bad'))[0], grpc.StatusCode.INVALID_ARGUMENT)
+        self.assertEqual(get_status(ResourceExhaustedError('full'))[0], grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+    def test_admits_within_budget(self):
+        controller = AdmissionController(100)
+        with controller.admit(60):
+            with controller.admit(40):
+                self.assertEqual(controller.in_use, 100)
+        self.assertEqual(controller.in_use, 0)
+        self.assertEqual(controller.admitted, 2)
+
+    def test_rejects_larger_than_budget(self):
+        controller = AdmissionController(100)
+        with self.assertRaises(ResourceExhaustedError):
+            controller.acquire(101)
+        self.assertEqual(controller.rejected, 1)
+
+    def test_waits_for_release(self):
+        controller = AdmissionController(100)
+        controller.acquire(80)
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            waiter = executor.submit(controller.acquire, 50)
+            self.wait_for_waiting(controller, 1)
+            self.assertFalse(waiter.done())
+            controller.release(80)
+            waiter.result(timeout=5)
+        self.assertEqual(controller.in_use, 50)
+
+    def test_admits_in_arrival_order(self):
+        controller = AdmissionController(100)
+        controller.acquire(60)
+        admitted = []
+
+        def acquire(name, cost):
+            controller.acquire(cost)
+            admitted.append(name)
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            large = executor.submit(acquire, 'large', 100)
+            self.wait_for_waiting(controller, 1)
+            small = executor.submit(acquire, 'small', 10)
+            self.wait_for_waiting(controller, 2)
+            self.assertEqual(admitted, [])
+
+            controller.release(60)
+            large.result(timeout=5)
+            self.assertEqual(admitted, ['large'])
+            controller.release(100)
+            small.result(timeout=5)
+        self.assertEqual(admitted, ['large', 'small'])
+
+    def test_rejects_when_queue_full(self):
+        controller = AdmissionController(100, max_waiting=1)
+        controller.acquire(100)
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            waiter = executor.submit(controller.acquire, 10)
+            self.wait_for_waiting(controller, 1)
+            with self.assertRaises(ResourceExhaustedError):
+                controller.acquire(10)
+            controller.release(100)
+            waiter.result(timeout=5)
+
+    def test_rejects_after_timeout(self):
+        metrics = ServerMetrics()
+        controller = AdmissionController(100, timeout=0.05, metrics=metrics)
+        controller.acquire(100)
+        with self.assertRaises(ResourceExhaustedError):
+            controller.acquire(10)
+        self.assertEqual(controller.get_waiting(), 0)
+        self.assertEqual(metrics.admission_rejections.get('timeout'), 1)
+        self.assertEqual(metrics.admission_bytes.get(), 100)
+        controller.release(100)
+        self.assertEqual(metrics.admission_bytes.get(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import sys
+sys.path.append("..")
+
+from utils.benchmark_utils import make_test_image, get_percentile, measure, compare_results
+
+def make_results(*cases):
+    return {'results': [{'operation': operation, 'mode': 'RGB', 'size': 64, 'median': median} for operation, median in cases]}
+
+class TestBenchmarkUtils(unittest.TestCase):
+
+    def test_make_test_image(self):
+        for mode, num_bands in [('L', 1), ('RGB', 3), ('RGBA', 4)]:
+            image = make_test_image(8, mode)
+            self.assertEqual(len(image.data), 8 * 8 * num_bands)
+            self.assertEqual(image.color, num_bands != 1)
+
+    def test_get_percentile(self):
+        times = [float(i) for i in range(1, 21)]
+        self.assertEqual(get_percentile(times, 50), 10.0)
+        self.assertEqual(get_percentile(times, 95), 19.0)
+        self.assertEqual(get_percentile([3.0], 95), 3.0)
+
+    def test_measure(self):
+        calls = []
+        result = measure(lambda: calls.append(bytearray(1048576)), repeats=3)
+        self.assertEqual(result['runs'], 3)
+        self.assertEqual(len(calls), 4)
+        self.assertGreaterEqual(result['peak_bytes'], 1048576)
+        self.assertLessEqual(result['median'], result['p95'])
+
+    def test_measure_time_budget(self):
+        result = measure(lambda: None, repeats=1000, max_seconds=0, measure_memory=False)
+        self.assertEqual(result['runs'], 1)
+        self.assertIsNone(result['peak_bytes'])
+
+    def test_compare_results(self):
+        baseline = make_results(('MeanFilter', 0.1), ('RotateImage', 0.1), ('image_to_pil_image', 0.0001))
+        current = make_results(('MeanFilter', 0.15), ('RotateImage', 0.11), ('image_to_pil_image', 0.0005), ('Missing', 1.0))
+        self.assertEqual(compare_results(current, baseline, 0.2), [('MeanFilter/RGB/64', 0.1, 0.15)])
+        self.assertEqual(compare_results(current, baseline, 0.6), [])
@@ -0,0 +1,61 @@
+import os
+import json
+import tempfile
+import unittest
+import sys
+sys.path.append("..")
+
+from utils.bulk_utils import find_inputs, read_manifest, read_journal, LineWriter, format_error
+
+class TestBulkUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        for path in ['in/a.png', 'in/b.JPG', 'in/sub/a.png', 'in/notes.txt']:
+            os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+            open(os.path.join(self.root, path), 'w').close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def test_find_inputs_directory(self):
+        inputs = find_inputs(self.path('in'), self.path('out'))
+        self.assertEqual(inputs, [(self.path('in', 'a.png'), self.path('out', 'a.png')),
+                                  (self.path('in', 'b.JPG'), self.path('out', 'b.JPG')),
+                                  (self.path('in', 'sub', 'a.png'), self.path('out', 'sub', 'a.png'))])
+
+    def test_find_inputs_glob(self):
+        inputs = find_inputs(self.path('in', '**', '*.png'), self.path('out'), '.webp')
+        self.assertEqual(inputs, [(self.path('in', 'a.png'), self.path('out', 'a.webp')),
+                                  (self.path('in', 'sub', 'a.png'), self.path('out', 'sub', 'a.webp'))])
+        self.assertEqual(find_inputs(self.path('missing', '*.png'), self.path('out')), [])
+
+    def test_read_manifest(self):
+        with open(self.path('manifest.txt'), 'w') as file:
+            file.write('# inputs\n' + self.path('in', 'a.png') + '\n\n' + self.path('in', 'sub', 'a.png') + '\tnested/c.png\n')
+        self.assertEqual(read_manifest(self.path('manifest.txt'), self.path('out'), '.jpg'),
+                         [(self.path('in', 'a.png'), self.path('out', 'a.jpg')),
+                          (self.path('in', 'sub', 'a.png'), self.path('out', 'nested', 'c.jpg'))])
+
+        with open(self.path('manifest.txt'), 'w') as file:
+            file.write(self.path('in', 'notes.txt') + '\n')
+        with self.assertRaises(ValueError):
+            read_manifest(self.path('manifest.txt'), self.path('out'))
+
+    def test_journal(self):
+        self.assertEqual(read_journal(self.path('journal')), set())
+        journal = LineWriter(self.path('journal'))
+        journal.write('a.png')
+        journal.write('b.png')
+        journal.close()
+        with open(self.path('journal'), 'a') as file:
+            file.write('partial')
+        self.assertEqual(read_journal(self.path('journal')), {'a.png', 'b.png'})
+
+    def test_format_error(self):
+        self.assertEqual(json.loads(format_error('a.png', 'rpc', 'UNAVAILABLE', 'down')),
+                         {'input': 'a.png', 'stage': 'rpc', 'code': 'UNAVAILABLE', 'error': 'down'})
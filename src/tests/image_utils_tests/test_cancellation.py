@@ -0,0 +1,111 @@
+import unittest
+import sys
+import time
+sys.path.append("..")
+
+import numpy as np
+
+import image_pb2
+from utils.cancellation import RequestMonitor, CancelledError, DeadlineExceededError, estimate_seconds, monitor_context, STAGE_SECONDS_PER_BYTE
+from utils.image_ops import mean_filter_array, rotate_array, BAND_ROWS
+from utils.pipeline import run_stages
+
+class TestContext:
+
+    def __init__(self, time_remaining=None, active=True):
+        self.remaining = time_remaining
+        self.active = active
+        self.callbacks = []
+
+    def time_remaining(self):
+        return self.remaining
+
+    def add_callback(self, callback):
+        if not self.active:
+            return False
+        self.callbacks.append(callback)
+        return True
+
+class TestCancellation(unittest.TestCase):
+
+    def setUp(self):
+        self.pixels = np.random.default_rng(0).integers(0, 256, size=(BAND_ROWS * 4, 20, 3), dtype=np.uint8)
+
+    def get_check(self, calls_allowed):
+        calls = []
+
+        def check():
+            calls.append(None)
+            if len(calls) > calls_allowed:
+                raise CancelledError('cancelled')
+
+        return check, calls
+
+    def test_monitor_cancelled(self):
+        monitor = RequestMonitor()
+        monitor.check()
+        monitor.terminate()
+        with self.assertRaises(CancelledError):
+            monitor.check()
+
+    def test_monitor_deadline(self):
+        monitor = RequestMonitor(0.01)
+        monitor.check()
+        time.sleep(0.02)
+        with self.assertRaises(DeadlineExceededError):
+            monitor.check()
+        self.assertIsNone(RequestMonitor().get_time_remaining())
+
+    def test_check_cost(self):
+        monitor = RequestMonitor(10)
+        monitor.check_cost(1)
+        with self.assertRaises(DeadlineExceededError):
+            monitor.check_cost(20)
+        RequestMonitor().check_cost(1e9)
+
+    def test_estimate_seconds(self):
+        stages = [image_pb2.Operation.Type.MEAN_FILTER, image_pb2.Operation.Type.ROTATE]
+        expected = 1000 * (STAGE_SECONDS_PER_BYTE[image_pb2.Operation.Type.MEAN_FILTER] + STAGE_SECONDS_PER_BYTE[image_pb2.Operation.Type.ROTATE])
+        self.assertAlmostEqual(estimate_seconds(1000, stages), expected)
+        self.assertEqual(estimate_seconds(1000, []), 0)
+
+    def test_monitor_context(self):
+        self.assertIsNone(monitor_context(None))
+        context = TestContext(5)
+        monitor = monitor_context(context)
+        self.assertAlmostEqual(monitor.get_time_remaining(), 5, places=1)
+        context.callbacks[0]()
+        with self.assertRaises(CancelledError):
+            monitor.check()
+        with self.assertRaises(CancelledError):
+            monitor_context(TestContext(active=False)).check()
+
+    def test_mean_filter_stops_at_band(self):
+        check, calls = self.get_check(1)
+        with self.assertRaises(CancelledError):
+            mean_filter_array(self.pixels, check=check)
+        self.assertEqual(len(calls), 2)
+
+        check, calls = self.get_check(100)
+        np.testing.assert_array_equal(mean_filter_array(self.pixels, check=check), mean_filter_array(self.pixels))
+        self.assertEqual(len(calls), 4)
+
+    def test_rotate_stops_at_band(self):
+        for rotation in [1, 2]:
+            check, calls = self.get_check(0)
+            with self.assertRaises(CancelledError):
+                rotate_array(self.pixels, rotation, tile_size=16, check=check)
+            self.assertEqual(len(calls), 1)
+
+            check, _ = self.get_check(1000)
+            np.testing.assert_array_equal(rotate_array(self.pixels, rotation, tile_size=16, check=check), rotate_array(self.pixels, rotation))
+
+    def test_run_stages_stops(self):
+        check, calls = self.get_check(0)
+        stages = [(image_pb2.Operation.Type.MEAN_FILTER, 0, 1), (image_pb2.Operation.Type.ROTATE, 1, 0)]
+        with self.assertRaises(CancelledError):
+            run_stages(self.pixels, stages, check=check)
+        self.assertEqual(len(calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import io
+import unittest
+from unittest import mock
+import pathlib
+import sys
+sys.path.append("..")
+
+from PIL import Image
+
+import image_pb2
+import utils.codec as codec
+from utils.benchmark_utils import make_test_image
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.parent_path = pathlib.Path(__file__).parent.parent.resolve()
+        self.raw = make_test_image(32, 'RGB')
+
+    def encode_with_pil(self, img, format):
+        output = io.BytesIO()
+        img.save(output, format)
+        return output.getvalue()
+
+    def test_png_round_trip(self):
+        for mode in ['L', 'RGB', 'RGBA']:
+            raw = make_test_image(16, mode)
+            encoded = codec.encode_image(raw, image_pb2.Image.Encoding.PNG)
+            self.assertEqual(encoded.encoding, image_pb2.Image.Encoding.PNG)
+            self.assertEqual(encoded.data[:8], b'\x89PNG\r\n\x1a\n')
+            decoded = codec.decode_image(encoded)
+            self.assertEqual((decoded.data, decoded.width, decoded.height, decoded.color),
+                             (raw.data, raw.width, raw.height, raw.color))
+            self.assertEqual(decoded.encoding, image_pb2.Image.Encoding.RAW)
+
+    def test_lossy_encodings(self):
+        flat = image_pb2.Image(color=True, data=bytes([10, 200, 30]) * 1024, width=32, height=32)
+        for encoding in [image_pb2.Image.Encoding.JPEG, image_pb2.Image.Encoding.WEBP]:
+            encoded = codec.encode_image(flat, encoding, quality=95)
+            decoded = codec.decode_image(encoded)
+            self.assertEqual(len(decoded.data), len(flat.data))
+            self.assertTrue(all(abs(a - b) <= 4 for a, b in zip(decoded.data, flat.data)))
+
+    def test_quality(self):
+        low = codec.encode_image(self.raw, image_pb2.Image.Encoding.JPEG, quality=10)
+        high = codec.encode_image(self.raw, image_pb2.Image.Encoding.JPEG, quality=100)
+        self.assertLess(len(low.data), len(high.data))
+        with self.assertRaises(ValueError):
+            codec.encode_image(self.raw, image_pb2.Image.Encoding.JPEG, quality=101)
+        with self.assertRaises(ValueError):
+            codec.encode_image(self.raw, image_pb2.Image.Encoding.RAW)
+
+    def test_jpeg_drops_alpha(self):
+        decoded = codec.decode_image(codec.encode_image(make_test_image(8, 'RGBA'), image_pb2.Image.Encoding.JPEG))
+        self.assertEqual(len(decoded.data), 8 * 8 * 3)
+
+    def test_decoded_modes(self):
+        palette = Image.new('P', (4, 4))
+        palette.info['transparency'] = 0
+        image = image_pb2.Image(data=self.encode_with_pil(palette, 'PNG'), encoding=image_pb2.Image.Encoding.PNG)
+        self.assertEqual(len(codec.decode_image(image).data), 4 * 4 * 4)
+
+        grey_alpha = Image.new('LA', (4, 4))
+        image = image_pb2.Image(data=self.encode_with_pil(grey_alpha, 'PNG'), encoding=image_pb2.Image.Encoding.PNG)
+        self.assertEqual(len(codec.decode_image(image).data), 4 * 4 * 4)
+
+    def test_invalid_files(self):
+        with self.assertRaises(ValueError):
+            codec.decode_image(image_pb2.Image(data=b'not an image', encoding=image_pb2.Image.Encoding.PNG))
+        jpeg = codec.encode_image(self.raw, image_pb2.Image.Encoding.JPEG)
+        with self.assertRaises(ValueError):
+            codec.decode_image(image_pb2.Image(data=jpeg.data, encoding=image_pb2.Image.Encoding.PNG))
+        with self.assertRaises(ValueError):
+            codec.decode_image(image_pb2.Image(data=jpeg.data[:200], encoding=image_pb2.Image.Encoding.JPEG))
+
+    def test_max_decoded_size(self):
+        png = codec.encode_image(self.raw, image_pb2.Image.Encoding.PNG)
+        with mock.patch.object(codec, 'MAX_DECODED_SIZE', len(self.raw.data) - 1):
+            with self.assertRaises(ValueError):
+                codec.decode_image(png)
+
+    def test_decompression_bomb(self):
+        png = codec.encode_image(self.raw, image_pb2.Image.Encoding.PNG)
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1):
+            with self.assertRaises(ValueError):
+                codec.get_decoded_size(png)
+            with self.assertRaises(ValueError):
+                codec.decode_image(png)
+
+    def test_file_to_image(self):
+        path = str(self.parent_path) + '/test_images/test-jpg.jpg'
+        image = codec.file_to_image(path, image_pb2.Image.Encoding.PNG, 80)
+        with open(path, 'rb') as file:
+            self.assertEqual(image.data, file.read())
+        self.assertEqual(image.encoding, image_pb2.Image.Encoding.JPEG)
+        self.assertEqual((image.response_encoding, image.response_quality), (image_pb2.Image.Encoding.PNG, 80))
+        self.assertEqual(codec.get_file_encoding('out.WEBP'), image_pb2.Image.Encoding.WEBP)
+        self.assertIsNone(codec.get_file_encoding('out.gif'))
@@ -0,0 +1,235 @@
+import unittest
+import sys
+sys.path.append("..")
+
+from concurrent import futures
+
+import numpy as np
+
+import image_pb2
+from utils.image_utils import get_pixel_neighbors
+from utils.image_ops import image_to_array, mean_filter_array, mean_filter_rows, mean_filter_stack, rotate_array, rotate_rows, convolve_array, get_separable_factors, QuantizedKernel
+from utils.kernels import get_gaussian_kernel, SHARPEN_KERNEL
+
+def reference_mean_filter(pixels):
+    height, width, num_bands = pixels.shape
+    out = np.empty_like(pixels)
+    for x in range(width):
+        for y in range(height):
+            neighbors = get_pixel_neighbors(x, y, width, height)
+            neighbors.append((x,y))
+            for band in range(num_bands):
+                out[y, x, band] = sum([int(pixels[ny, nx, band]) for (nx, ny) in neighbors]) // len(neighbors)
+    return out
+
+def reference_box_filter(pixels, radius):
+    height, width, num_bands = pixels.shape
+    out = np.empty_like(pixels)
+    for x in range(width):
+        for y in range(height):
+            window = pixels[max(y-radius, 0):y+radius+1, max(x-radius, 0):x+radius+1].astype(np.int64)
+            out[y, x] = window.sum(axis=(0, 1)) // (window.shape[0] * window.shape[1])
+    return out
+
+def reference_convolve(pixels, kernel):
+    height, width, num_bands = pixels.shape
+    kernel_height, kernel_width = kernel.shape
+    out = np.empty_like(pixels)
+    for x in range(width):
+        for y in range(height):
+            total = np.zeros(num_bands)
+            weights = 0
+            for i in range(kernel_height):
+                for j in range(kernel_width):
+                    ny, nx = y + i - kernel_height // 2, x + j - kernel_width // 2
+                    if 0 <= ny < height and 0 <= nx < width:
+                        total += kernel[i, j] * pixels[ny, nx]
+                        weights += kernel[i, j]
+            out[y, x] = np.clip(np.floor(total / weights + 0.5), 0, 255)
+    return out
+
+def reference_rotate(pixels, rotation):
+    height, width, num_bands = pixels.shape
+    new_height, new_width = (width, height) if rotation % 2 else (height, width)
+    out = np.empty((new_height, new_width, num_bands), dtype=pixels.dtype)
+    for x in range(width):
+        for y in range(height):
+            if rotation == 1:
+                out[x, new_width-y-1] = pixels[y, x]
+            elif rotation == 2:
+                out[new_height-y-1, new_width-x-1] = pixels[y, x]
+            elif rotation == 3:
+                out[new_height-x-1, y] = pixels[y, x]
+    return out
+
+class TestMeanFilterArray(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def run_reference_test(self, height, width, num_bands):
+        pixels = self.rng.integers(0, 256, size=(height, width, num_bands), dtype=np.uint8)
+        np.testing.assert_array_equal(mean_filter_array(pixels), reference_mean_filter(pixels))
+
+    def test_single_band(self):
+        self.run_reference_test(7, 9, 1)
+
+    def test_three_band(self):
+        self.run_reference_test(5, 6, 3)
+
+    def test_four_band(self):
+        self.run_reference_test(6, 5, 4)
+
+    def test_single_row(self):
+        self.run_reference_test(1, 8, 3)
+
+    def test_single_column(self):
+        self.run_reference_test(8, 1, 1)
+
+    def test_single_pixel(self):
+        self.run_reference_test(1, 1, 4)
+
+    def test_bands_match_whole_image(self):
+        pixels = self.rng.integers(0, 256, size=(11, 7, 3), dtype=np.uint8)
+        out = np.empty_like(pixels)
+        for row_start in range(0, 11, 3):
+            mean_filter_rows(pixels, out, row_start, min(row_start + 3, 11))
+        np.testing.assert_array_equal(out, mean_filter_array(pixels))
+
+    def test_fused_rotation_matches_rotated_filter(self):
+        pixels = self.rng.integers(0, 256, size=(150, 37, 3), dtype=np.uint8)
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            for rotation in [1, 2, 3]:
+                expected = reference_rotate(mean_filter_array(pixels), rotation)
+                np.testing.assert_array_equal(mean_filter_array(pixels, rotation=rotation), expected)
+                np.testing.assert_array_equal(mean_filter_array(pixels, executor, 3, rotation), expected)
+
+    def test_parallel_matches_serial(self):
+        pixels = self.rng.integers(0, 256, size=(23, 9, 4), dtype=np.uint8)
+        with futures.ThreadPoolExecutor(max_workers=4) as executor:
+            for parallelism in [2, 4, 7, 50]:
+                np.testing.assert_array_equal(mean_filter_array(pixels, executor, parallelism), mean_filter_array(pixels))
+
+    def test_radius_matches_reference(self):
+        pixels = self.rng.integers(0, 256, size=(19, 14, 3), dtype=np.uint8)
+        for radius in [2, 3, 7, 15]:
+            np.testing.assert_array_equal(mean_filter_array(pixels, radius=radius), reference_box_filter(pixels, radius))
+
+    def test_radius_one_matches_reference(self):
+        pixels = self.rng.integers(0, 256, size=(9, 8, 4), dtype=np.uint8)
+        np.testing.assert_array_equal(mean_filter_array(pixels, radius=1), reference_box_filter(pixels, 1))
+
+    def test_radius_bands_and_rotation(self):
+        pixels = self.rng.integers(0, 256, size=(150, 23, 1), dtype=np.uint8)
+        expected = reference_box_filter(pixels, 4)
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            np.testing.assert_array_equal(mean_filter_array(pixels, executor, 7, radius=4), expected)
+            np.testing.assert_array_equal(mean_filter_array(pixels, executor, 3, 1, radius=4), reference_rotate(expected, 1))
+
+    def test_stack_matches_each_image(self):
+        stack = self.rng.integers(0, 256, size=(4, 13, 7, 3), dtype=np.uint8)
+        for radius in [1, 3]:
+            for rotation in [0, 1, 2, 3]:
+                filtered = mean_filter_stack(stack, rotation, radius)
+                for index, pixels in enumerate(stack):
+                    np.testing.assert_array_equal(filtered[index], mean_filter_array(pixels, rotation=rotation, radius=radius))
+
+class TestConvolveArray(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.pixels = self.rng.integers(0, 256, size=(21, 17, 3), dtype=np.uint8)
+
+    def assert_close(self, actual, expected):
+        # Fixed-point weights may move results by one from the float reference
+        self.assertLessEqual(np.abs(actual.astype(int) - expected.astype(int)).max(), 1)
+
+    def test_sharpen_matches_reference(self):
+        kernel = np.array(SHARPEN_KERNEL, dtype=float)
+        np.testing.assert_array_equal(convolve_array(self.pixels, kernel), reference_convolve(self.pixels, kernel))
+
+    def test_gaussian_matches_reference(self):
+        kernel = get_gaussian_kernel(1.5)
+        self.assert_close(convolve_array(self.pixels, kernel), reference_convolve(self.pixels, kernel))
+
+    def test_custom_kernel_matches_reference(self):
+        for kernel in [self.rng.random((3, 5)), np.array([[1.0, 2.0, 1.0], [2.0, 4.0, 3.0], [1.0, 2.0, 1.0]])]:
+            self.assert_close(convolve_array(self.pixels, kernel), reference_convolve(self.pixels, kernel))
+
+    def test_single_band_and_rgba(self):
+        kernel = get_gaussian_kernel(1)
+        for num_bands in [1, 4]:
+            pixels = self.rng.integers(0, 256, size=(9, 12, num_bands), dtype=np.uint8)
+            self.assert_close(convolve_array(pixels, kernel), reference_convolve(pixels, kernel))
+
+    def test_separable_detection(self):
+        self.assertIsNotNone(get_separable_factors(get_gaussian_kernel(2)))
+        self.assertIsNotNone(get_separable_factors(np.ones((3, 5))))
+        self.assertIsNone(get_separable_factors(np.array(SHARPEN_KERNEL, dtype=float)))
+
+    def test_quantized_kernel(self):
+        separable = QuantizedKernel(get_gaussian_kernel(1))
+        self.assertIsNone(separable.weights)
+        self.assertEqual((len(separable.column), len(separable.row)), separable.shape)
+
+        sharpen = QuantizedKernel(np.array(SHARPEN_KERNEL, dtype=float))
+        self.assertIsNone(sharpen.column)
+        self.assertEqual(sharpen.sums[-1, -1], sharpen.weights.sum())
+
+    def test_parallel_and_rotation_match_serial(self):
+        pixels = self.rng.integers(0, 256, size=(150, 23, 3), dtype=np.uint8)
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            for kernel in [get_gaussian_kernel(1), np.array(SHARPEN_KERNEL, dtype=float)]:
+                expected = convolve_array(pixels, kernel)
+                np.testing.assert_array_equal(convolve_array(pixels, kernel, executor, 4), expected)
+                np.testing.assert_array_equal(convolve_array(pixels, kernel, executor, 3, 1), reference_rotate(expected, 1))
+
+    def test_invalid_kernel(self):
+        with self.assertRaises(ValueError):
+            convolve_array(self.pixels, np.array([[1.0, -1.0, 0.0]]))
+        with self.assertRaises(ValueError):
+            convolve_array(self.pixels, np.array([[-3.0, 1.0, 3.0]]))
+        with self.assertRaises(ValueError):
+            convolve_array(self.pixels, np.array([[100.0, -99.0, 0.0]]))
+
+class TestRotateArray(unittest.TestCase):
+
+    def setUp(self):
+        self.pixels = np.random.default_rng(0).integers(0, 256, size=(13, 10, 3), dtype=np.uint8)
+
+    def run_reference_test(self, rotation):
+        expected = reference_rotate(self.pixels, rotation)
+        np.testing.assert_array_equal(rotate_array(self.pixels, rotation), expected)
+        np.testing.assert_array_equal(rotate_array(self.pixels, rotation, tile_size=4), expected)
+
+    def test_rotate_ninety(self):
+        self.run_reference_test(1)
+
+    def test_rotate_one_eighty(self):
+        self.run_reference_test(2)
+
+    def test_rotate_two_seventy(self):
+        self.run_reference_test(3)
+
+    def test_rotate_into_out(self):
+        out = np.empty((10, 13, 3), dtype=np.uint8)
+        result = rotate_array(self.pixels, 1, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, reference_rotate(self.pixels, 1))
+
+    def test_rotate_rows_matches_rotated_bands(self):
+        for rotation in range(4):
+            expected = reference_rotate(self.pixels, rotation) if rotation else self.pixels
+            for row_start, row_end in [(0, 3), (3, 7), (7, expected.shape[0]), (0, expected.shape[0])]:
+                np.testing.assert_array_equal(rotate_rows(self.pixels, rotation, row_start, row_end), expected[row_start:row_end])
+
+class TestImageToArray(unittest.TestCase):
+
+    def test_shape_and_values(self):
+        data = bytes(range(24))
+        image = image_pb2.Image(color=True, data=data, width=3, height=2)
+
+        pixels = image_to_array(image)
+
+        self.assertEqual(pixels.shape, (2, 3, 4))
+        self.assertEqual(pixels.tobytes(), data)
@@ -91,3 +91,15 @@ class TestIsValidImage(unittest.TestCase):
         image = image_pb2.Image(color=color, data=data, width=width, height=height)
 
         self.assertEqual(is_valid_image(image), expected)
+
+    def test_data_length_mismatch(self):
+        expected = False
+
+        data = b'\xff' * 1000
+        width = 16
+        height = 64
+        color = False
+
+        image = image_pb2.Image(color=color, data=data, width=width, height=height)
+
+        self.assertEqual(is_valid_image(image), expected)
@@ -0,0 +1,38 @@
+import unittest
+import sys
+sys.path.append("..")
+
+import numpy as np
+
+import image_pb2
+from utils.kernels import get_kernel, get_gaussian_kernel, SHARPEN_KERNEL
+
+class TestGetKernel(unittest.TestCase):
+
+    def test_gaussian(self):
+        kernel = get_kernel(image_pb2.Kernel(type='GAUSSIAN', sigma=1.0))
+        self.assertEqual(kernel.shape, (7, 7))
+        self.assertEqual(kernel.argmax(), 24)
+        np.testing.assert_allclose(kernel, kernel.T)
+
+    def test_sharpen(self):
+        np.testing.assert_array_equal(get_kernel(image_pb2.Kernel(type='SHARPEN')), SHARPEN_KERNEL)
+
+    def test_custom(self):
+        kernel = get_kernel(image_pb2.Kernel(type='CUSTOM', width=3, height=1, weights=[1, 2, 1]))
+        np.testing.assert_array_equal(kernel, [[1, 2, 1]])
+
+    def test_invalid_sigma(self):
+        for sigma in [0, -1, 5.5, float('inf'), float('nan')]:
+            with self.assertRaises(ValueError):
+                get_gaussian_kernel(sigma)
+
+    def test_invalid_custom(self):
+        with self.assertRaises(ValueError):
+            get_kernel(image_pb2.Kernel(type='CUSTOM', width=2, height=1, weights=[1, 1]))
+        with self.assertRaises(ValueError):
+            get_kernel(image_pb2.Kernel(type='CUSTOM', width=3, height=3, weights=[1, 1, 1]))
+        with self.assertRaises(ValueError):
+            get_kernel(image_pb2.Kernel(type='CUSTOM', width=3, height=1, weights=[1, -2, 0]))
+        with self.assertRaises(ValueError):
+            get_kernel(image_pb2.Kernel(type='CUSTOM', width=33, height=1, weights=[1] * 33))
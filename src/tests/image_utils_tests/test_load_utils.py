@@ -0,0 +1,46 @@
+import unittest
+import sys
+sys.path.append("..")
+
+from utils.load_utils import parse_mix, get_arrival_offsets, get_histogram, summarize, LatencyRecorder
+
+class TestLoadUtils(unittest.TestCase):
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix(['rotate=3', 'mean']), [('rotate', 3.0), ('mean', 1.0)])
+        with self.assertRaises(ValueError):
+            parse_mix(['rotate=0'])
+        with self.assertRaises(ValueError):
+            parse_mix(['rotate=fast'])
+
+    def test_constant_arrivals(self):
+        self.assertEqual(get_arrival_offsets(4, 1), [0.0, 0.25, 0.5, 0.75])
+
+    def test_poisson_arrivals(self):
+        offsets = get_arrival_offsets(1000, 2, 'poisson')
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertLess(offsets[-1], 2)
+        self.assertAlmostEqual(len(offsets) / 2000, 1, delta=0.1)
+        self.assertEqual(offsets, get_arrival_offsets(1000, 2, 'poisson'))
+
+    def test_histogram(self):
+        self.assertEqual(get_histogram([0.0004, 0.0005, 0.0006, 0.003], first_bucket=0.0005),
+                         [(0.0005, 2), (0.001, 1), (0.002, 0), (0.004, 1)])
+        self.assertEqual(get_histogram([]), [])
+
+    def test_summarize(self):
+        summary = summarize([i / 1000 for i in range(1, 1001)])
+        self.assertEqual(summary['count'], 1000)
+        self.assertEqual(summary['p50'], 0.5)
+        self.assertEqual(summary['p99.9'], 0.999)
+        self.assertEqual(summary['max'], 1.0)
+        self.assertIsNone(summarize([])['p50'])
+
+    def test_recorder(self):
+        recorder = LatencyRecorder()
+        recorder.record('rotate', 0.1)
+        recorder.record('mean', 0.2)
+        recorder.record_error('mean', 'UNAVAILABLE')
+        recorder.record_error('mean', 'UNAVAILABLE')
+        self.assertEqual(sorted(recorder.get_all_latencies()), [0.1, 0.2])
+        self.assertEqual(recorder.errors, {('mean', 'UNAVAILABLE'): 2})
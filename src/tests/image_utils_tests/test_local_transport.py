@@ -0,0 +1,87 @@
+import unittest
+import sys
+import time
+from multiprocessing import shared_memory
+sys.path.append("..")
+
+import image_pb2
+from utils.local_transport import SegmentStore, SharedImage, share_image, open_image, read_image, is_shared, is_local_peer
+from utils.metrics import ServerMetrics
+from utils.benchmark_utils import make_test_image
+
+class TestLocalTransport(unittest.TestCase):
+
+    def assertUnlinked(self, name):
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_is_local_peer(self):
+        self.assertTrue(is_local_peer('unix:/tmp/image.sock'))
+        self.assertFalse(is_local_peer('ipv4:127.0.0.1:50052'))
+        self.assertFalse(is_local_peer(None))
+
+    def test_share_and_open_image(self):
+        image = make_test_image(16, 'RGB')
+        with share_image(image) as shared:
+            self.assertTrue(is_shared(shared))
+            self.assertEqual(shared.data, b'')
+            self.assertEqual(shared.shared_memory.size, len(image.data))
+            with open_image(shared) as view:
+                self.assertIsInstance(view, SharedImage)
+                self.assertEqual((view.width, view.height, view.color), (image.width, image.height, image.color))
+                self.assertEqual(bytes(view.data), image.data)
+                self.assertTrue(view.data.readonly)
+        self.assertUnlinked(shared.shared_memory.name)
+
+    def test_open_image_rejects_invalid_references(self):
+        with self.assertRaises(ValueError):
+            with open_image(image_pb2.Image(shared_memory=image_pb2.SharedMemory(name='other', size=1))):
+                pass
+        with self.assertRaises(ValueError):
+            with open_image(image_pb2.Image(shared_memory=image_pb2.SharedMemory(name='imgsvc-missing', size=1))):
+                pass
+        with share_image(make_test_image(4, 'L')) as shared:
+            shared.shared_memory.size += 1
+            with self.assertRaises(ValueError):
+                with open_image(shared):
+                    pass
+
+    def test_segment_store_lease(self):
+        metrics = ServerMetrics()
+        store = SegmentStore(lease_seconds=10, metrics=metrics)
+        image = make_test_image(8, 'L')
+        read = store.share(image)
+        unread = store.share(image)
+        self.assertEqual(metrics.shared_segments.get(), 2)
+
+        self.assertEqual(read_image(read).data, image.data)
+        self.assertUnlinked(read.shared_memory.name)
+
+        store.reap()
+        self.assertEqual(metrics.shared_segments.get(), 2)
+        store.reap(time.monotonic() + 10)
+        self.assertUnlinked(unread.shared_memory.name)
+        self.assertEqual(metrics.shared_segments.get(), 0)
+        self.assertEqual(metrics.shared_segments_reclaimed.get(), 1)
+
+    def test_segment_store_compute(self):
+        metrics = ServerMetrics()
+        store = SegmentStore(metrics=metrics)
+        result = store.compute((2, 3, 1), False, lambda out: out.fill(7))
+        self.assertEqual((result.width, result.height, result.color), (3, 2, False))
+        self.assertEqual(read_image(result).data, bytes([7] * 6))
+
+        def fail(out):
+            raise ValueError('failed')
+        with self.assertRaises(ValueError):
+            store.compute((2, 3, 1), False, fail)
+        self.assertEqual(metrics.shared_segments.get(), 1)
+
+    def test_segment_store_close(self):
+        store = SegmentStore()
+        shared = store.share(make_test_image(8, 'RGB'))
+        store.close()
+        self.assertUnlinked(shared.shared_memory.name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+sys.path.append("..")
+
+from utils.metrics import Counter, Gauge, Histogram, ServerMetrics, InstrumentedThreadPoolExecutor, format_labels
+
+class TestMetrics(unittest.TestCase):
+
+    def test_format_labels(self):
+        self.assertEqual(format_labels((), ()), '')
+        self.assertEqual(format_labels(('method', 'code'), ('Rotate', 'OK')), '{method="Rotate",code="OK"}')
+        self.assertEqual(format_labels(('stage',), ('a"b\\c\n',)), '{stage="a\\"b\\\\c\\n"}')
+
+    def test_counter_and_gauge(self):
+        counter = Counter('requests_total', 'Requests.', ['code'])
+        counter.inc('OK')
+        counter.inc('OK', amount=2)
+        counter.inc('INTERNAL')
+        self.assertEqual(counter.get('OK'), 3)
+        self.assertEqual(counter.render(), ['# HELP requests_total Requests.', '# TYPE requests_total counter',
+                                            'requests_total{code="INTERNAL"} 1', 'requests_total{code="OK"} 3'])
+
+        gauge = Gauge('depth', 'Depth.')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertEqual(gauge.render()[-1], 'depth 1')
+
+    def test_histogram(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ['method'], buckets=[0.1, 1])
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value, 'Rotate')
+        self.assertEqual(histogram.get_count('Rotate'), 4)
+        self.assertEqual(histogram.get_count('Mean'), 0)
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{method="Rotate",le="0.1"} 2',
+            'latency_seconds_bucket{method="Rotate",le="1"} 3',
+            'latency_seconds_bucket{method="Rotate",le="+Inf"} 4',
+            'latency_seconds_sum{method="Rotate"} 2.65',
+            'latency_seconds_count{method="Rotate"} 4',
+        ])
+
+    def test_server_metrics_render(self):
+        metrics = ServerMetrics()
+        metrics.observe_stage('compute', 0.002)
+        text = metrics.render()
+        self.assertIn('# TYPE image_service_rpc_duration_seconds histogram\n', text)
+        self.assertIn('image_service_stage_duration_seconds_count{stage="compute"} 1\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_snapshot(self):
+        worker = ServerMetrics()
+        worker.rpcs.inc('Rotate', 'OK', amount=2)
+        worker.in_flight.inc('Rotate')
+        worker.observe_stage('compute', 0.002)
+        other = ServerMetrics()
+        other.rpcs.inc('Rotate', 'OK')
+        other.observe_stage('compute', 0.5)
+
+        aggregate = ServerMetrics()
+        aggregate.add_snapshot(worker.get_snapshot())
+        aggregate.add_snapshot(other.get_snapshot())
+        self.assertEqual(aggregate.rpcs.get('Rotate', 'OK'), 3)
+        self.assertEqual(aggregate.in_flight.get('Rotate'), 1)
+        self.assertEqual(aggregate.stage_duration.get_count('compute'), 2)
+        self.assertEqual(worker.rpcs.get('Rotate', 'OK'), 2)
+
+    def test_instrumented_executor(self):
+        metrics = ServerMetrics()
+        with InstrumentedThreadPoolExecutor(metrics, max_workers=2) as executor:
+            results = [executor.submit(pow, 2, power) for power in range(10)]
+            self.assertEqual([future.result() for future in results], [2 ** power for power in range(10)])
+        self.assertEqual(metrics.queue_depth.get(), 0)
+        self.assertEqual(metrics.stage_duration.get_count('queue'), 10)
@@ -0,0 +1,75 @@
+import unittest
+import sys
+import time
+from concurrent import futures
+from unittest import mock
+sys.path.append("..")
+
+import numpy as np
+
+import image_pb2
+from utils.micro_batch import MicroBatcher
+from utils.pipeline import run_stages
+from utils.metrics import ServerMetrics
+
+MEAN_FILTER = image_pb2.Operation.Type.MEAN_FILTER
+ROTATE = image_pb2.Operation.Type.ROTATE
+CONVOLVE = image_pb2.Operation.Type.CONVOLVE
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.images = np.random.default_rng(0).integers(0, 256, size=(6, 8, 5, 3), dtype=np.uint8)
+
+    def run_concurrently(self, batcher, images, stages):
+        with futures.ThreadPoolExecutor(max_workers=len(images)) as executor:
+            return list(executor.map(lambda pixels: batcher.run(pixels, stages), images))
+
+    def test_accepts(self):
+        batcher = MicroBatcher(max_pixels=40)
+        self.assertTrue(batcher.accepts(self.images[0], [(MEAN_FILTER, 1, 1)]))
+        self.assertFalse(batcher.accepts(np.zeros((9, 5, 3), dtype=np.uint8), [(ROTATE, 1, 0)]))
+        self.assertFalse(batcher.accepts(self.images[0], [(CONVOLVE, 0, ((1,),))]))
+
+    def test_batches_concurrent_requests(self):
+        metrics = ServerMetrics()
+        batcher = MicroBatcher(max_batch=len(self.images), max_wait=5, metrics=metrics)
+        stages = [(MEAN_FILTER, 1, 1)]
+        started = time.perf_counter()
+        results = self.run_concurrently(batcher, self.images, stages)
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(batcher.batches, 1)
+        self.assertEqual(batcher.batched, len(self.images))
+        self.assertEqual(metrics.micro_batch_size.get_count(), 1)
+        for pixels, result in zip(self.images, results):
+            np.testing.assert_array_equal(result, run_stages(pixels, stages))
+
+    def test_runs_alone_after_max_wait(self):
+        batcher = MicroBatcher(max_wait=0.001)
+        stages = [(ROTATE, 2, 0)]
+        np.testing.assert_array_equal(batcher.run(self.images[0], stages), run_stages(self.images[0], stages))
+        self.assertEqual(batcher.batches, 1)
+
+    def test_separates_shapes_and_stages(self):
+        batcher = MicroBatcher(max_wait=0.05)
+        stages = [[(ROTATE, 1, 0)], [(ROTATE, 3, 0)]]
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            pending = [executor.submit(batcher.run, self.images[0], stages[0]),
+                       executor.submit(batcher.run, self.images[1], stages[1]),
+                       executor.submit(batcher.run, self.images[2, :4], stages[0])]
+            results = [future.result(timeout=5) for future in pending]
+        self.assertEqual(batcher.batches, 3)
+        np.testing.assert_array_equal(results[1], run_stages(self.images[1], stages[1]))
+        np.testing.assert_array_equal(results[2], run_stages(self.images[2, :4], stages[0]))
+
+    def test_error_raised_in_every_request(self):
+        batcher = MicroBatcher(max_batch=2, max_wait=5)
+        with mock.patch('utils.pipeline.run_stack_stages', side_effect=ValueError('failed')):
+            with futures.ThreadPoolExecutor(max_workers=2) as executor:
+                pending = [executor.submit(batcher.run, pixels, [(ROTATE, 1, 0)]) for pixels in self.images[:2]]
+                for future in pending:
+                    with self.assertRaises(ValueError):
+                        future.result(timeout=5)
+
+if __name__ == '__main__':
+    unittest.main()
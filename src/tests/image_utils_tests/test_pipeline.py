@@ -0,0 +1,89 @@
+import unittest
+import sys
+sys.path.append("..")
+
+import numpy as np
+
+import image_pb2
+from utils.pipeline import plan_operations, run_stages, run_stack_stages, can_stack
+from utils.image_ops import rotate_array
+
+MEAN_FILTER = image_pb2.Operation.Type.MEAN_FILTER
+ROTATE = image_pb2.Operation.Type.ROTATE
+CONVOLVE = image_pb2.Operation.Type.CONVOLVE
+
+def mean(radius=0):
+    return image_pb2.Operation(type=MEAN_FILTER, radius=radius)
+
+def rotate(rotation):
+    return image_pb2.Operation(type=ROTATE, rotation=rotation)
+
+def convolve(weights):
+    kernel = image_pb2.Kernel(type='CUSTOM', width=len(weights[0]), height=len(weights), weights=sum(weights, []))
+    return image_pb2.Operation(type=CONVOLVE, kernel=kernel)
+
+class TestPlanOperations(unittest.TestCase):
+
+    def test_no_operations(self):
+        self.assertEqual(plan_operations([]), [])
+
+    def test_mean_filter_then_rotation_is_fused(self):
+        self.assertEqual(plan_operations([mean(), rotate('NINETY_DEG')]), [(MEAN_FILTER, 1, 1)])
+
+    def test_rotation_then_mean_filter_is_fused(self):
+        self.assertEqual(plan_operations([rotate('TWO_SEVENTY_DEG'), mean()]), [(MEAN_FILTER, 3, 1)])
+
+    def test_consecutive_rotations_collapse(self):
+        self.assertEqual(plan_operations([rotate('NINETY_DEG'), rotate('ONE_EIGHTY_DEG')]), [(ROTATE, 3, 0)])
+
+    def test_full_turn_is_dropped(self):
+        self.assertEqual(plan_operations([rotate('NINETY_DEG'), rotate('TWO_SEVENTY_DEG')]), [])
+        self.assertEqual(plan_operations([rotate('ONE_EIGHTY_DEG'), mean(), rotate('ONE_EIGHTY_DEG')]), [(MEAN_FILTER, 0, 1)])
+
+    def test_rotation_fused_into_last_mean_filter(self):
+        operations = [mean(), rotate('NINETY_DEG'), mean(), rotate('NINETY_DEG')]
+        self.assertEqual(plan_operations(operations), [(MEAN_FILTER, 0, 1), (MEAN_FILTER, 2, 1)])
+
+    def test_mean_filter_radius(self):
+        self.assertEqual(plan_operations([mean(5), rotate('NINETY_DEG')]), [(MEAN_FILTER, 1, 5)])
+
+    def test_invalid_radius(self):
+        with self.assertRaises(ValueError):
+            plan_operations([mean(-1)])
+        with self.assertRaises(ValueError):
+            plan_operations([mean(16)])
+
+    def test_convolve(self):
+        self.assertEqual(plan_operations([convolve([[1, 2, 3]])]), [(CONVOLVE, 0, ((1, 2, 3),))])
+
+    def test_rotation_moved_past_convolve(self):
+        stages = plan_operations([rotate('NINETY_DEG'), convolve([[1, 2, 3]])])
+        self.assertEqual(stages, [(CONVOLVE, 1, ((3,), (2,), (1,)))])
+
+        pixels = np.random.default_rng(0).integers(0, 256, size=(7, 5, 3), dtype=np.uint8)
+        expected = run_stages(rotate_array(pixels, 1), plan_operations([convolve([[1, 2, 3]])]))
+        np.testing.assert_array_equal(run_stages(pixels, stages), expected)
+
+    def test_invalid_kernel(self):
+        with self.assertRaises(ValueError):
+            plan_operations([convolve([[1, 2]])])
+        with self.assertRaises(ValueError):
+            plan_operations([image_pb2.Operation(type=CONVOLVE, kernel=image_pb2.Kernel(type='GAUSSIAN', sigma=6))])
+
+    def test_invalid_rotation(self):
+        with self.assertRaises(ValueError):
+            plan_operations([image_pb2.Operation(type=ROTATE, rotation=7)])
+
+    def test_invalid_operation_type(self):
+        with self.assertRaises(ValueError):
+            plan_operations([image_pb2.Operation(type=9)])
+
+    def test_run_stack_stages_matches_run_stages(self):
+        stack = np.random.default_rng(0).integers(0, 256, size=(9, 11, 6, 4), dtype=np.uint8)
+        for operations in [[rotate(1)], [rotate(2)], [mean(2), rotate(3)], [mean(), rotate(1), mean()]]:
+            stages = plan_operations(operations)
+            self.assertTrue(can_stack(stages))
+            result = run_stack_stages(stack, stages)
+            for index, pixels in enumerate(stack):
+                np.testing.assert_array_equal(result[index], run_stages(pixels, stages))
+        self.assertFalse(can_stack(plan_operations([convolve([[1]])])))
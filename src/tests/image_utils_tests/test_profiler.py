@@ -0,0 +1,84 @@
+import os
+import json
+import pstats
+import tempfile
+import unittest
+import sys
+sys.path.append("..")
+
+from utils.profiler import RequestProfiler, get_image_mode
+from utils.benchmark_utils import make_test_image
+
+def busy(count):
+    return sum(i * i for i in range(count))
+
+class TestRequestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image = make_test_image(8, 'RGB')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_files(self, extension):
+        return sorted(name for name in os.listdir(self.temp_dir.name) if name.endswith(extension)) if os.path.isdir(self.temp_dir.name) else []
+
+    def test_get_image_mode(self):
+        self.assertEqual(get_image_mode(make_test_image(4, 'L')), 'L')
+        self.assertEqual(get_image_mode(make_test_image(4, 'RGBA')), 'RGBA')
+        self.assertEqual(get_image_mode(make_test_image(0, 'RGB')), 'unknown')
+
+    def test_disarmed_writes_nothing(self):
+        profiler = RequestProfiler(output_dir=self.temp_dir.name)
+        self.assertEqual(profiler.run('MeanFilter', self.image, busy, 100), busy(100))
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_cprofile_request_limit(self):
+        profiler = RequestProfiler(output_dir=self.temp_dir.name)
+        profiler.arm(requests=2)
+        for _ in range(3):
+            self.assertEqual(profiler.run('RotateImage', self.image, busy, 1000), busy(1000))
+        self.assertFalse(profiler.armed)
+
+        profiles = self.get_files('.pstats')
+        self.assertEqual(len(profiles), 2)
+        self.assertIn('-RotateImage-8x8-RGB.pstats', profiles[0])
+        stats = pstats.Stats(os.path.join(self.temp_dir.name, profiles[0]))
+        self.assertTrue(any(function[2] == 'busy' for function in stats.stats))
+
+        with open(os.path.join(self.temp_dir.name, self.get_files('.json')[0])) as file:
+            info = json.load(file)
+        self.assertEqual((info['method'], info['width'], info['height'], info['mode']), ('RotateImage', 8, 8, 'RGB'))
+
+    def test_time_limit(self):
+        profiler = RequestProfiler(output_dir=self.temp_dir.name)
+        profiler.arm(seconds=0)
+        profiler.run('MeanFilter', self.image, busy, 100)
+        self.assertFalse(profiler.armed)
+        self.assertEqual(self.get_files('.pstats'), [])
+
+    def test_sample_mode(self):
+        profiler = RequestProfiler('sample', self.temp_dir.name, interval=0.0005)
+        profiler.arm(requests=1)
+        profiler.run('MeanFilter', self.image, busy, 2000000)
+
+        profiles = self.get_files('.collapsed')
+        self.assertEqual(len(profiles), 1)
+        with open(os.path.join(self.temp_dir.name, profiles[0])) as file:
+            lines = file.read().splitlines()
+        self.assertTrue(any('busy (test_profiler.py' in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+
+    def test_exception_is_reraised(self):
+        profiler = RequestProfiler(output_dir=self.temp_dir.name)
+        profiler.arm()
+        with self.assertRaises(ValueError):
+            profiler.run('MeanFilter', self.image, int, 'not a number')
+        self.assertEqual(len(self.get_files('.pstats')), 1)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            RequestProfiler('perf')
@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import tempfile
+sys.path.append("..")
+
+import image_pb2
+from utils.result_cache import ResultCache, make_key
+
+def make_image(value, size=100):
+    return image_pb2.Image(color=False, data=bytes([value]) * size, width=size, height=1)
+
+class TestResultCache(unittest.TestCase):
+
+    def test_make_key(self):
+        image = make_image(1)
+        self.assertEqual(make_key(image, [(0, 1)]), make_key(make_image(1), [(0, 1)]))
+        self.assertNotEqual(make_key(image, [(0, 1)]), make_key(image, [(0, 2)]))
+        self.assertNotEqual(make_key(image, [(0, 1)]), make_key(make_image(2), [(0, 1)]))
+
+    def test_hit_and_miss(self):
+        cache = ResultCache(1000)
+        image = make_image(1)
+
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', image)
+
+        self.assertEqual(cache.get('a'), image)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = ResultCache(250)
+        cache.put('a', make_image(1))
+        cache.put('b', make_image(2))
+        cache.get('a')
+        cache.put('c', make_image(3))
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['bytes'], 200)
+
+    def test_image_larger_than_budget_not_cached(self):
+        cache = ResultCache(50)
+        cache.put('a', make_image(1))
+        self.assertIsNone(cache.get('a'))
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as disk_dir:
+            cache = ResultCache(150, disk_dir=disk_dir, disk_max_bytes=10000)
+            cache.put('a', make_image(1))
+            cache.put('b', make_image(2))
+
+            self.assertEqual(cache.stats()['disk_entries'], 1)
+            self.assertEqual(cache.get('a'), make_image(1))
+            self.assertEqual(cache.stats()['disk_hits'], 1)
+
+            reopened = ResultCache(150, disk_dir=disk_dir, disk_max_bytes=10000)
+            self.assertEqual(reopened.get('b'), make_image(2))
+
+    def test_hit_while_writing_counted_in_memory(self):
+        with tempfile.TemporaryDirectory() as disk_dir:
+            cache = ResultCache(150, disk_dir=disk_dir, disk_max_bytes=10000)
+            cache.put('a', make_image(1))
+            with cache.lock:
+                evicted = cache.add_to_memory('b', make_image(2))
+
+            self.assertEqual(cache.get('a'), make_image(1))
+            cache.write_to_disk(evicted)
+            self.assertEqual(cache.stats()['hits'], 1)
+            self.assertEqual(cache.stats()['disk_hits'], 0)
+
+    def test_disk_write_error_drops_entry(self):
+        with tempfile.TemporaryDirectory() as parent_dir:
+            disk_dir = os.path.join(parent_dir, 'cache')
+            cache = ResultCache(150, disk_dir=disk_dir, disk_max_bytes=10000)
+            os.rmdir(disk_dir)
+            with open(disk_dir, 'w'):
+                pass
+
+            cache.put('a', make_image(1))
+            with self.assertLogs(level='ERROR'):
+                cache.put('b', make_image(2))
+
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('b'), make_image(2))
+            self.assertEqual(cache.stats()['disk_entries'], 0)
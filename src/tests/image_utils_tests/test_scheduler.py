@@ -0,0 +1,122 @@
+import unittest
+import sys
+import time
+from concurrent import futures
+sys.path.append("..")
+
+from utils.scheduler import PriorityScheduler, get_priority, PRIORITY_METADATA_KEY, DEFAULT_PRIORITY
+from utils.metrics import ServerMetrics
+from utils.cancellation import RequestMonitor, CancelledError, DeadlineExceededError
+
+class TestScheduler(unittest.TestCase):
+
+    def wait_for_waiting(self, scheduler, count):
+        while scheduler.get_waiting() < count:
+            time.sleep(0.001)
+
+    def run_queued(self, scheduler, requests):
+        '''
+        Queues requests behind a held slot, then releases it and returns the names of the requests in the order they ran.
+        '''
+        order = []
+
+        def run(name, priority, deadline, cost):
+            with scheduler.slot(priority, deadline, cost):
+                order.append(name)
+
+        scheduler.acquire('high')
+        with futures.ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            pending = []
+            for count, request in enumerate(requests, 1):
+                pending.append(executor.submit(run, *request))
+                self.wait_for_waiting(scheduler, count)
+            scheduler.release()
+            for future in pending:
+                future.result(timeout=5)
+        return order
+
+    def test_get_priority(self):
+        self.assertEqual(get_priority(None), DEFAULT_PRIORITY)
+        self.assertEqual(get_priority([('other', 'x'), (PRIORITY_METADATA_KEY, 'low')]), 'low')
+
+    def test_rejects_invalid_priority(self):
+        with self.assertRaises(ValueError):
+            PriorityScheduler(1).acquire('urgent')
+
+    def test_runs_without_waiting(self):
+        scheduler = PriorityScheduler(2)
+        with scheduler.slot('low'):
+            with scheduler.slot('high'):
+                self.assertEqual(scheduler.running, 2)
+        self.assertEqual(scheduler.running, 0)
+
+    def test_orders_by_priority(self):
+        order = self.run_queued(PriorityScheduler(1), [('low', 'low', None, 0), ('normal', 'normal', None, 0), ('high', 'high', None, 0)])
+        self.assertEqual(order, ['high', 'normal', 'low'])
+
+    def test_orders_by_deadline(self):
+        now = time.monotonic()
+        order = self.run_queued(PriorityScheduler(1), [('none', 'normal', None, 0), ('late', 'normal', now + 5, 0), ('soon', 'normal', now + 1, 0)])
+        self.assertEqual(order, ['soon', 'late', 'none'])
+
+    def test_orders_shortest_job_first(self):
+        order = self.run_queued(PriorityScheduler(1), [('large', 'normal', None, 1.0), ('small', 'normal', None, 0.001)])
+        self.assertEqual(order, ['small', 'large'])
+
+    def test_aging(self):
+        scheduler = PriorityScheduler(1, aging_seconds=0.05)
+        scheduler.acquire('high')
+        order = []
+
+        def run(name, priority):
+            with scheduler.slot(priority):
+                order.append(name)
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            low = executor.submit(run, 'low', 'low')
+            self.wait_for_waiting(scheduler, 1)
+            time.sleep(0.15)
+            high = executor.submit(run, 'high', 'high')
+            self.wait_for_waiting(scheduler, 2)
+            scheduler.release()
+            low.result(timeout=5)
+            high.result(timeout=5)
+        self.assertEqual(order, ['low', 'high'])
+
+    def test_metrics(self):
+        metrics = ServerMetrics()
+        scheduler = PriorityScheduler(1, metrics=metrics)
+        scheduler.acquire('normal')
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            waiter = executor.submit(scheduler.acquire, 'low')
+            self.wait_for_waiting(scheduler, 1)
+            self.assertEqual(metrics.scheduler_queued.get('low'), 1)
+            scheduler.release()
+            waiter.result(timeout=5)
+        scheduler.release()
+        self.assertEqual(metrics.scheduler_queued.get('low'), 0)
+        self.assertEqual(metrics.scheduler_wait.get_count('low'), 1)
+        self.assertEqual(metrics.scheduler_wait.get_count('normal'), 1)
+        self.assertEqual(scheduler.running, 0)
+
+    def test_stopped_requests_leave_queue(self):
+        scheduler = PriorityScheduler(1)
+        scheduler.acquire('high')
+        monitor = RequestMonitor()
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            cancelled = executor.submit(scheduler.acquire, 'normal', None, 0, monitor.check)
+            expired = executor.submit(scheduler.acquire, 'normal', time.monotonic() + 0.1)
+            self.wait_for_waiting(scheduler, 2)
+            monitor.terminate()
+
+            with self.assertRaises(CancelledError):
+                cancelled.result(timeout=5)
+            with self.assertRaises(DeadlineExceededError):
+                expired.result(timeout=5)
+        self.assertEqual(scheduler.get_waiting(), 0)
+
+        scheduler.release()
+        self.assertEqual(scheduler.running, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import sys
+import threading
+from concurrent import futures
+sys.path.append("..")
+
+from utils.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_result(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            started.set()
+            release.wait()
+            return value * 2
+
+        with futures.ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(single_flight.do, 'key', compute, 21)
+            started.wait()
+            waiters = [executor.submit(single_flight.do, 'key', compute, 21) for _ in range(3)]
+            while single_flight.get_waiters('key') < 3:
+                pass
+            release.set()
+
+            self.assertEqual(leader.result(), 42)
+            self.assertEqual([waiter.result() for waiter in waiters], [42, 42, 42])
+
+        self.assertEqual(calls, [21])
+        self.assertEqual(single_flight.leaders, 1)
+        self.assertEqual(single_flight.shared, 3)
+        self.assertEqual(single_flight.get_waiters('key'), 0)
+
+    def test_sequential_calls_recompute(self):
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do('key', lambda: 1), 1)
+        self.assertEqual(single_flight.do('key', lambda: 2), 2)
+
+    def test_exception_raised_in_waiters(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            single_flight.do('key', fail)
+
+    def test_stopped_waiter_stops_waiting(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        stop = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait()
+            return 42
+
+        def check():
+            if stop.is_set():
+                raise RuntimeError('stopped')
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(single_flight.do, 'key', compute)
+            started.wait()
+            waiter = executor.submit(single_flight.do, 'key', compute, check=check)
+            while single_flight.get_waiters('key') < 1:
+                pass
+            stop.set()
+
+            with self.assertRaises(RuntimeError):
+                waiter.result()
+            self.assertEqual(single_flight.get_waiters('key'), 0)
+            release.set()
+            self.assertEqual(leader.result(), 42)
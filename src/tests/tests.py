@@ -4,19 +4,68 @@ import sys
 from image_utils_tests.test_is_valid_image import TestIsValidImage
 from image_utils_tests.test_pil_image_conversions import TestPILImageToImage, TestImageToPILImage
 from image_utils_tests.test_get_pixel_neighbors import TestGetPixelNeighbors
+from image_utils_tests.test_image_ops import TestMeanFilterArray, TestConvolveArray, TestRotateArray, TestImageToArray
+from image_utils_tests.test_pipeline import TestPlanOperations
+from image_utils_tests.test_result_cache import TestResultCache
+from image_utils_tests.test_single_flight import TestSingleFlight
+from image_utils_tests.test_kernels import TestGetKernel
+from image_utils_tests.test_benchmark_utils import TestBenchmarkUtils
+from image_utils_tests.test_load_utils import TestLoadUtils
+from image_utils_tests.test_metrics import TestMetrics
+from image_utils_tests.test_profiler import TestRequestProfiler
+from image_utils_tests.test_codec import TestCodec
+from image_utils_tests.test_bulk_utils import TestBulkUtils
+from image_utils_tests.test_admission import TestAdmission
+from image_utils_tests.test_cancellation import TestCancellation
+from image_utils_tests.test_scheduler import TestScheduler
+from image_utils_tests.test_micro_batch import TestMicroBatcher
+from image_utils_tests.test_local_transport import TestLocalTransport
 
 from grpc_tests.test_image_server import TestImageServer
 from grpc_tests.test_image_client import TestImageClient
+from grpc_tests.test_aio_server import TestAsyncImageServer
+from grpc_tests.test_compute_backend import TestProcessPoolBackend
+from grpc_tests.test_load_test import TestLoadTest
+from grpc_tests.test_metrics_server import TestMetricsServer
+from grpc_tests.test_bulk_client import TestBulkClient
+from grpc_tests.test_prefork import TestPrefork
+from grpc_tests.test_local_transport_server import TestLocalTransportServer
 
 unittest1 = unittest.TestLoader().loadTestsFromTestCase(TestIsValidImage)
 unittest2 = unittest.TestLoader().loadTestsFromTestCase(TestPILImageToImage)
 unittest3 = unittest.TestLoader().loadTestsFromTestCase(TestImageToPILImage)
 unittest4 = unittest.TestLoader().loadTestsFromTestCase(TestGetPixelNeighbors)
+unittest5 = unittest.TestLoader().loadTestsFromTestCase(TestMeanFilterArray)
+unittest6 = unittest.TestLoader().loadTestsFromTestCase(TestRotateArray)
+unittest7 = unittest.TestLoader().loadTestsFromTestCase(TestImageToArray)
+unittest8 = unittest.TestLoader().loadTestsFromTestCase(TestPlanOperations)
+unittest9 = unittest.TestLoader().loadTestsFromTestCase(TestResultCache)
+unittest10 = unittest.TestLoader().loadTestsFromTestCase(TestSingleFlight)
+unittest11 = unittest.TestLoader().loadTestsFromTestCase(TestConvolveArray)
+unittest12 = unittest.TestLoader().loadTestsFromTestCase(TestGetKernel)
+unittest13 = unittest.TestLoader().loadTestsFromTestCase(TestBenchmarkUtils)
+unittest14 = unittest.TestLoader().loadTestsFromTestCase(TestLoadUtils)
+unittest15 = unittest.TestLoader().loadTestsFromTestCase(TestMetrics)
+unittest16 = unittest.TestLoader().loadTestsFromTestCase(TestRequestProfiler)
+unittest17 = unittest.TestLoader().loadTestsFromTestCase(TestCodec)
+unittest18 = unittest.TestLoader().loadTestsFromTestCase(TestBulkUtils)
+unittest19 = unittest.TestLoader().loadTestsFromTestCase(TestAdmission)
+unittest20 = unittest.TestLoader().loadTestsFromTestCase(TestCancellation)
+unittest21 = unittest.TestLoader().loadTestsFromTestCase(TestScheduler)
+unittest22 = unittest.TestLoader().loadTestsFromTestCase(TestMicroBatcher)
+unittest23 = unittest.TestLoader().loadTestsFromTestCase(TestLocalTransport)
 
 servertest = unittest.TestLoader().loadTestsFromTestCase(TestImageServer)
 clienttest = unittest.TestLoader().loadTestsFromTestCase(TestImageClient)
+aioservertest = unittest.TestLoader().loadTestsFromTestCase(TestAsyncImageServer)
+backendtest = unittest.TestLoader().loadTestsFromTestCase(TestProcessPoolBackend)
+loadtest = unittest.TestLoader().loadTestsFromTestCase(TestLoadTest)
+metricstest = unittest.TestLoader().loadTestsFromTestCase(TestMetricsServer)
+bulktest = unittest.TestLoader().loadTestsFromTestCase(TestBulkClient)
+preforktest = unittest.TestLoader().loadTestsFromTestCase(TestPrefork)
+localtest = unittest.TestLoader().loadTestsFromTestCase(TestLocalTransportServer)
 
-alltests = unittest.TestSuite([unittest1, unittest2, unittest3, unittest4, servertest, clienttest])
+alltests = unittest.TestSuite([unittest1, unittest2, unittest3, unittest4, unittest5, unittest6, unittest7, unittest8, unittest9, unittest10, unittest11, unittest12, unittest13, unittest14, unittest15, unittest16, unittest17, unittest18, unittest19, unittest20, unittest21, unittest22, unittest23, servertest, clienttest, aioservertest, backendtest, loadtest, metricstest, bulktest, preforktest, localtest])
 
 if __name__ == '__main__':
     unittest.main()
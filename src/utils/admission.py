@@ -0,0 +1,242 @@
+import time
+import threading
+import contextlib
+import collections
+import grpc
+
+import image_pb2
+import utils.stream_utils as stream_utils
+import utils.codec as codec
+import utils.cancellation as cancellation
+
+# Default memory budget in bytes shared by all requests being processed
+DEFAULT_BUDGET = 1073741824
+
+# Default max number of requests waiting for memory before further requests are rejected
+DEFAULT_MAX_WAITING = 64
+
+# Default max seconds a request waits for memory before it is rejected
+DEFAULT_TIMEOUT = 10.0
+
+# Bytes of working memory per byte of raw pixels held by every request - the request data,
+# the output array, and the response data
+BASE_MEMORY = 3
+
+# Bytes of working memory per byte of raw pixels held by the intermediate arrays of each stage type, on top of BASE_MEMORY
+# Mean filter holds a uint16 copy and uint32 window sums of its band, and convolution int32 copies, sums and totals
+STAGE_MEMORY = {
+    image_pb2.Operation.Type.ROTATE: 0,
+    image_pb2.Operation.Type.MEAN_FILTER: 8,
+    image_pb2.Operation.Type.CONVOLVE: 12,
+}
+
+class ResourceExhaustedError(Exception):
+    '''
+    Raised when a request is rejected because the server does not have the memory to process it.
+    '''
+
+# Exceptions that requests are aborted with a status code for, see get_status
+REQUEST_ERRORS = (ValueError, ResourceExhaustedError, cancellation.RequestStoppedError)
+
+def get_status(ex):
+    '''
+    Returns gRPC status code and message that a request failing with ex is aborted with
+
+    Requests rejected by admission control are answered with RESOURCE_EXHAUSTED, so clients can retry them later,
+    requests stopped early with CANCELLED or DEADLINE_EXCEEDED, and invalid requests with INVALID_ARGUMENT.
+
+        Parameters:
+            ex (Exception): One of REQUEST_ERRORS raised by the request
+        Returns:
+            (tuple): (grpc.StatusCode, message)
+    '''
+    if isinstance(ex, ResourceExhaustedError):
+        return grpc.StatusCode.RESOURCE_EXHAUSTED, 'Server overloaded - ' + str(ex)
+    if isinstance(ex, cancellation.RequestStoppedError):
+        return ex.code, 'Request stopped - ' + str(ex)
+    return grpc.StatusCode.INVALID_ARGUMENT, 'Invalid message - ' + str(ex)
+
+def get_raw_size(image):
+    '''
+    Returns size in bytes of the raw pixels of a request Image, reading the header of encoded files without decoding them
+
+    Raises ValueError if Image holds an encoded file that is not valid.
+    '''
+    if image.encoding == image_pb2.Image.Encoding.RAW:
+        return len(image.data)
+    return codec.get_decoded_size(image)
+
+def estimate_memory(image, stage_types):
+    '''
+    Returns estimated peak working memory in bytes of applying stages to a request Image
+
+    Stages run one after another, so only the stage with the largest intermediate arrays is counted.
+    Encoded requests and responses add a copy of the pixels held by Pillow while decoding or encoding.
+
+        Parameters:
+            image (Image): gRPC Image object of the request
+            stage_types (list): Operation.Type of each stage applied to Image
+        Returns:
+            (int): Estimated working memory in bytes
+    '''
+    factor = BASE_MEMORY + max((STAGE_MEMORY.get(stage_type, 0) for stage_type in stage_types), default=0)
+    if image.encoding == image_pb2.Image.Encoding.RAW:
+        return len(image.data) * factor
+
+    factor += 1 + (image.response_encoding != image_pb2.Image.Encoding.RAW)
+    return get_raw_size(image) * factor + len(image.data)
+
+def estimate_band_memory(raw_size, stage_type, band_size):
+    '''
+    Returns estimated peak working memory in bytes of a request whose output is computed and sent one row band at a time
+
+    Only the input pixels are held in full. Each band holds its output array, response data, and intermediate arrays.
+
+        Parameters:
+            raw_size (int): Size in bytes of the raw pixels of the input image
+            stage_type (Operation.Type): Type of the stage applied to each band
+            band_size (int): Target size in bytes of each row band
+        Returns:
+            (int): Estimated working memory in bytes
+    '''
+    return raw_size + min(raw_size, band_size) * (2 + STAGE_MEMORY.get(stage_type, 0))
+
+def estimate_stream_memory(header, stage_type):
+    '''
+    Returns estimated peak working memory in bytes of a chunked image stream described by ImageHeader
+
+    Stream processors hold the full image received so far, or its rotated output, and process one chunk at a time.
+    '''
+    raw_size = header.width * header.height * header.bands
+    return estimate_band_memory(raw_size, stage_type, stream_utils.CHUNK_SIZE)
+
+class AdmissionController:
+    '''
+    Admits requests against a global budget of working memory, so bursts of large images wait for memory
+    instead of exhausting the memory of the host.
+
+    Each request acquires its estimated working memory before it is processed, and releases it when it finishes.
+    Requests that do not fit in the remaining budget wait in arrival order, so large requests are not starved by
+    a stream of small ones. Requests are rejected with ResourceExhaustedError if they are larger than the whole budget,
+    if max_waiting requests are already waiting, or if they wait longer than timeout seconds.
+
+    ...
+
+    Attributes
+    ----------
+    budget : int
+        Bytes of working memory shared by all requests being processed.
+    max_waiting : int
+        Max number of requests waiting for memory.
+    timeout : float
+        Max seconds a request waits for memory.
+    in_use : int
+        Bytes of working memory held by admitted requests.
+    admitted : int
+        Number of requests admitted.
+    rejected : int
+        Number of requests rejected.
+
+    Methods
+    -------
+    acquire(cost):
+        Waits until cost bytes of the budget are free, and holds them.
+    release(cost):
+        Returns cost bytes to the budget.
+    admit(cost):
+        Context manager that holds cost bytes of the budget while its block runs.
+    get_waiting():
+        Returns the number of requests waiting for memory.
+    '''
+
+    def __init__(self, budget=DEFAULT_BUDGET, max_waiting=DEFAULT_MAX_WAITING, timeout=DEFAULT_TIMEOUT, metrics=None):
+        self.budget = budget
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.metrics = metrics
+        self.condition = threading.Condition()
+        self.waiting = collections.deque()
+        self.in_use = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def reject(self, reason, message):
+        self.rejected += 1
+        if self.metrics is not None:
+            self.metrics.admission_rejections.inc(reason)
+        raise ResourceExhaustedError(message)
+
+    def acquire(self, cost):
+        '''
+        Waits until cost bytes of the budget are free and every request that arrived earlier has been admitted,
+        and holds them.
+
+        Raises ResourceExhaustedError if the request is rejected.
+        The time spent waiting is recorded in metrics as the admission stage.
+
+            Parameters:
+                cost (int): Estimated working memory in bytes of the request
+            Returns:
+                None
+        '''
+        started = time.perf_counter()
+        with self.condition:
+            if cost > self.budget:
+                self.reject('too_large', 'request needs ' + str(cost) + ' bytes of memory, more than the budget of ' + str(self.budget))
+
+            if self.waiting or self.in_use + cost > self.budget:
+                if len(self.waiting) >= self.max_waiting:
+                    self.reject('queue_full', str(len(self.waiting)) + ' requests are already waiting for memory')
+
+                ticket = object()
+                self.waiting.append(ticket)
+                if self.metrics is not None:
+                    self.metrics.admission_waiting.inc()
+                deadline = started + self.timeout
+                try:
+                    while self.waiting[0] is not ticket or self.in_use + cost > self.budget:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self.reject('timeout', 'timed out after ' + str(self.timeout) + ' s waiting for memory')
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting.remove(ticket)
+                    if self.metrics is not None:
+                        self.metrics.admission_waiting.dec()
+                    self.condition.notify_all()
+
+            self.in_use += cost
+            self.admitted += 1
+            if self.metrics is not None:
+                self.metrics.admission_bytes.inc(amount=cost)
+
+        if self.metrics is not None:
+            self.metrics.observe_stage('admission', time.perf_counter() - started)
+
+    def release(self, cost):
+        '''
+        Returns cost bytes to the budget, and wakes the requests waiting for memory.
+        '''
+        with self.condition:
+            self.in_use -= cost
+            if self.metrics is not None:
+                self.metrics.admission_bytes.dec(amount=cost)
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def admit(self, cost):
+        '''
+        Context manager that acquires cost bytes of the budget, and releases them when its block exits.
+        '''
+        self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def get_waiting(self):
+        '''
+        Returns the number of requests waiting for memory.
+        '''
+        with self.condition:
+            return len(self.waiting)
@@ -1,5 +1,14 @@
+import os
 import argparse
 import image_pb2
+import utils.compute_backend as compute_backend
+import utils.benchmark_utils as benchmark_utils
+import utils.profiler as profiler
+import utils.admission as admission
+import utils.scheduler as scheduler
+import utils.micro_batch as micro_batch
+import utils.prefork as prefork
+import utils.local_transport as local_transport
 
 def get_server_args_parser():
     '''
@@ -7,6 +16,21 @@ def get_server_args_parser():
 
     Sets valid arguments for server.py.
     Ensures that --host and --port arguments are both required
+    --parallelism sets the number of row bands large mean filter requests are split into, defaulting to 1 (serial)
+    Provides list of choices for --mode argument, selecting a threaded or asyncio server
+    --compute-workers sets the number of threads that run pixel work, defaulting to 10
+    --process-workers sets the number of worker processes that large images are processed in, defaulting to 0 (disabled)
+    --cache-bytes sets the memory budget of the result cache, defaulting to 0 (disabled)
+    Ensures that --coalesce argument value is set to True when flag is present, False when flag not present
+    --metrics-port sets the port of the Prometheus metrics endpoint, defaulting to 0 (disabled)
+    Provides list of choices for --profile-mode argument, selecting cProfile or stack sampling profiles
+    Provides list of choices for --compression argument, selecting gRPC channel compression of responses
+    --memory-budget sets the working memory shared by requests being processed, defaulting to 1 GiB (0 disables admission control)
+    Provides list of choices for --scheduler argument, selecting a FIFO thread pool (the default) or priority scheduling of compute slots
+    --handler-threads sets the number of threads that receive requests and wait for a compute slot, defaulting to 64
+    --micro-batch sets the max number of small requests run together in one stack, defaulting to 0 (disabled)
+    --workers sets the number of server processes sharing the port, defaulting to the number of CPUs (1 runs a single process)
+    --unix-socket sets a Unix domain socket that local clients may refer to Image data in shared memory over, defaulting to none
 
         Parameters:
             None
@@ -16,6 +40,52 @@ def get_server_args_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--host', required=True, action='store', help='Host name')
     parser.add_argument('--port', required=True, action='store', help='Port number')
+    parser.add_argument('--parallelism', type=int, default=1, action='store', help='Number of threads to mean filter large images with')
+    parser.add_argument('--mode', default='threaded', action='store', choices=['threaded', 'asyncio'], help='Server concurrency model')
+    parser.add_argument('--compute-workers', type=int, default=10, action='store', help='Number of threads to run requests in')
+    parser.add_argument('--process-workers', type=int, default=0, action='store', help='Number of worker processes for large images')
+    parser.add_argument('--inline-threshold', type=int, default=compute_backend.INLINE_THRESHOLD, action='store',
+                        help='Min number of pixels in an image before it is sent to a worker process')
+    parser.add_argument('--no-warmup', action='store_true', help='Start worker processes on demand instead of at startup')
+    parser.add_argument('--cache-bytes', type=int, default=0, action='store', help='Memory budget in bytes of the result cache')
+    parser.add_argument('--cache-dir', action='store', help='Directory of the on-disk tier of the result cache')
+    parser.add_argument('--cache-disk-bytes', type=int, default=1073741824, action='store', help='Disk budget in bytes of the result cache')
+    parser.add_argument('--coalesce', action='store_true', help='Share one computation between concurrent identical requests')
+    parser.add_argument('--metrics-port', type=int, default=0, action='store', help='Port of the Prometheus metrics endpoint')
+    parser.add_argument('--metrics-host', default='127.0.0.1', action='store', help='Host name of the Prometheus metrics endpoint')
+    parser.add_argument('--compression', default='none', action='store', choices=['none', 'gzip', 'deflate'], help='gRPC channel compression')
+    parser.add_argument('--profile-mode', default='cprofile', action='store', choices=['cprofile', 'sample'],
+                        help='Write cProfile pstats or sampled collapsed stacks')
+    parser.add_argument('--profile-dir', default='profiles', action='store', help='Directory profiles are written to')
+    parser.add_argument('--profile-requests', type=int, action='store', help='Number of requests to profile from startup and on SIGUSR1')
+    parser.add_argument('--profile-seconds', type=float, action='store', help='Seconds to profile requests for from startup and on SIGUSR1')
+    parser.add_argument('--profile-interval', type=float, default=profiler.SAMPLE_INTERVAL, action='store',
+                        help='Seconds between stack samples in sample mode')
+    parser.add_argument('--memory-budget', type=int, default=admission.DEFAULT_BUDGET, action='store',
+                        help='Bytes of working memory shared by the requests being processed (0 to disable admission control)')
+    parser.add_argument('--admission-queue', type=int, default=admission.DEFAULT_MAX_WAITING, action='store',
+                        help='Max number of requests waiting for memory before further requests are rejected')
+    parser.add_argument('--admission-timeout', type=float, default=admission.DEFAULT_TIMEOUT, action='store',
+                        help='Max seconds a request waits for memory before it is rejected')
+    parser.add_argument('--scheduler', default='fifo', action='store', choices=['fifo', 'priority'],
+                        help='Order requests wait for one of --compute-workers slots in')
+    parser.add_argument('--handler-threads', type=int, default=64, action='store',
+                        help='Number of threads that handle requests while they wait for a compute slot')
+    parser.add_argument('--aging-seconds', type=float, default=scheduler.AGING_SECONDS, action='store',
+                        help='Seconds of waiting that raise a request by one priority class')
+    parser.add_argument('--micro-batch', type=int, default=0, action='store',
+                        help='Max number of concurrent small requests run together in one stack (0 to disable micro-batching)')
+    parser.add_argument('--micro-batch-wait', type=float, default=micro_batch.DEFAULT_MAX_WAIT, action='store',
+                        help='Max seconds the first request of a micro-batch waits for more requests')
+    parser.add_argument('--micro-batch-pixels', type=int, default=micro_batch.DEFAULT_MAX_PIXELS, action='store',
+                        help='Max number of pixels of an image for its request to be micro-batched')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, action='store',
+                        help='Number of server processes sharing the port with SO_REUSEPORT (1 to run a single process)')
+    parser.add_argument('--drain-seconds', type=float, default=prefork.DRAIN_SECONDS, action='store',
+                        help='Seconds requests in flight are given to finish after SIGTERM')
+    parser.add_argument('--unix-socket', action='store', help='Path of a Unix domain socket to also listen on, accepting shared memory Images')
+    parser.add_argument('--shm-lease', type=float, default=local_transport.LEASE_SECONDS, action='store',
+                        help='Seconds a client has to read a shared memory response before the server unlinks it')
     return parser
 
 def get_client_args_parser():
@@ -23,9 +93,14 @@ def get_client_args_parser():
     Returns argparse argument parser for client.py
 
     Sets valid arguments for client.py.
-    Ensures that --host, --port, --input, and --output arguments are all required.
+    Ensures that --input and --output arguments are both required, and --host and --port are required unless --unix-socket is given.
     Provides list of enum choices for --rotate argument.
     Ensures that --mean argument value is set to True when flag is present, False when flag not present
+    --radius sets the radius of the mean filter, defaulting to 1 (3x3)
+    Ensures that --encoded argument value is set to True when flag is present, False when flag not present
+    Provides list of choices for --compression argument, selecting gRPC channel compression
+    Provides list of choices for --priority argument, selecting the priority class requests are scheduled with
+    --unix-socket connects to the server's Unix domain socket, sending and receiving Image data in shared memory
 
         Parameters:
             None
@@ -33,11 +108,118 @@ def get_client_args_parser():
             parser (argparse.ArgumentParser): Argument parser containing arguments for client.py
     '''
     parser = argparse.ArgumentParser()
-    parser.add_argument('--host', required=True, action='store', help='Host name')
-    parser.add_argument('--port', required=True, action='store', help='Port number')
+    parser.add_argument('--host', action='store', help='Host name')
+    parser.add_argument('--port', action='store', help='Port number')
     parser.add_argument('--input', required=True, action='store', help='Input image file path')
     parser.add_argument('--output', required=True, action='store', help='Output image file path')
     parser.add_argument('--rotate', action='store', choices=image_pb2.ImageRotateRequest.Rotation.keys(), help='Rotation enum input')
     parser.add_argument('--mean', action='store_true', help='Apply mean filter')
+    parser.add_argument('--radius', type=int, default=1, action='store', help='Number of neighbors either side of each pixel the mean filter averages over')
+    parser.add_argument('--encoded', action='store_true', help='Send the input file as-is and receive the result encoded in the format of --output')
+    parser.add_argument('--quality', type=int, default=0, action='store', help='JPEG or WebP quality of an encoded result, from 1 to 100 (0 for the server default)')
+    parser.add_argument('--compression', default='none', action='store', choices=['none', 'gzip', 'deflate'], help='gRPC channel compression')
+    parser.add_argument('--priority', action='store', choices=scheduler.PRIORITIES, help='Priority class of the request')
+    parser.add_argument('--unix-socket', action='store', help="Path of the server's Unix domain socket, to send images in shared memory")
+    return parser
+
+
+def get_benchmark_args_parser():
+    '''
+    Returns argparse argument parser for benchmark.py
+
+    Sets valid arguments for benchmark.py.
+    --operations, --sizes, and --modes select the cases to run, defaulting to every operation on L, RGB, and RGBA
+    images of 64x64 up to 4096x4096 pixels
+    --repeats and --max-seconds bound the number of timed calls of each case
+    --output sets the JSON file the results are written to
+    --baseline sets a JSON file of earlier results to compare against, failing if any case is more than --threshold slower
+
+        Parameters:
+            None
+        Returns:
+            parser (argparse.ArgumentParser): Argument parser containing arguments for benchmark.py
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--operations', nargs='+', default=benchmark_utils.OPERATIONS, choices=benchmark_utils.OPERATIONS,
+                        help='Operations to benchmark')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[64, 256, 1024, 4096], help='Widths and heights of the test images')
+    parser.add_argument('--modes', nargs='+', default=list(benchmark_utils.MODE_BANDS), choices=list(benchmark_utils.MODE_BANDS),
+                        help='Image modes')
+    parser.add_argument('--repeats', type=int, default=5, action='store', help='Max number of timed calls per case')
+    parser.add_argument('--max-seconds', type=float, default=10, action='store', help='Time budget in seconds of each case')
+    parser.add_argument('--no-memory', action='store_true', help='Skip measuring peak memory')
+    parser.add_argument('--no-size-limits', action='store_true', help='Run pure Python operations on the largest images too')
+    parser.add_argument('--output', default='benchmark.json', action='store', help='Output JSON file path')
+    parser.add_argument('--baseline', action='store', help='JSON file of baseline results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, action='store', help='Max allowed relative slowdown of a case')
+    return parser
+
+def get_load_test_args_parser():
+    '''
+    Returns argparse argument parser for load_test.py
+
+    Sets valid arguments for load_test.py.
+    Ensures that --port argument is required, with --host defaulting to localhost
+    --rate and --duration set the number of requests sent per second and the length of the run
+    Provides list of choices for --arrivals argument, spacing requests evenly or as a poisson process
+    --mix sets the operations to send as 'name=weight' items, defaulting to rotate and mean filter in equal parts
+    --sizes and --modes set the images to send, defaulting to 256x256 RGB
+    --channels and --concurrency set the number of persistent channels and max number of requests in flight
+
+        Parameters:
+            None
+        Returns:
+            parser (argparse.ArgumentParser): Argument parser containing arguments for load_test.py
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost', action='store', help='Host name')
+    parser.add_argument('--port', required=True, action='store', help='Port number')
+    parser.add_argument('--rate', type=float, default=50, action='store', help='Requests sent per second')
+    parser.add_argument('--duration', type=float, default=10, action='store', help='Length of the run in seconds')
+    parser.add_argument('--arrivals', default='constant', action='store', choices=['constant', 'poisson'], help='Spacing of requests')
+    parser.add_argument('--mix', nargs='+', default=['rotate=1', 'mean=1'], help='Operations to send, as name=weight items')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[256], help='Widths and heights of the images to send')
+    parser.add_argument('--modes', nargs='+', default=['RGB'], choices=list(benchmark_utils.MODE_BANDS), help='Modes of the images to send')
+    parser.add_argument('--channels', type=int, default=4, action='store', help='Number of persistent channels')
+    parser.add_argument('--concurrency', type=int, default=64, action='store', help='Max number of requests in flight')
+    parser.add_argument('--seed', type=int, default=0, action='store', help='Seed of the arrivals, operations, and images')
+    parser.add_argument('--output', action='store', help='JSON file path to write the report to')
     return parser
 
+def get_bulk_args_parser():
+    '''
+    Returns argparse argument parser for bulk_client.py
+
+    Sets valid arguments for bulk_client.py.
+    Ensures that --port and --output-dir arguments are required, with --host defaulting to localhost
+    Ensures that exactly one of --input (a directory or glob pattern) and --manifest is present
+    Provides list of enum choices for --rotate argument, and of output formats for --format argument
+    --concurrency sets the max number of RPCs in flight, and --workers the number of extra threads that load and save
+    files while RPCs are in flight
+    Ensures that --resume argument value is set to True when flag is present, False when flag not present
+    Provides list of choices for --priority argument, selecting the priority class requests are scheduled with
+
+        Parameters:
+            None
+        Returns:
+            parser (argparse.ArgumentParser): Argument parser containing arguments for bulk_client.py
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost', action='store', help='Host name')
+    parser.add_argument('--port', required=True, action='store', help='Port number')
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--input', action='store', help='Input directory or glob pattern')
+    inputs.add_argument('--manifest', action='store', help='File listing an input path, and optionally a tab and output path, per line')
+    parser.add_argument('--output-dir', required=True, action='store', help='Directory to write results to')
+    parser.add_argument('--format', action='store', choices=['png', 'jpg', 'webp'], help='Output format, defaulting to the format of each input')
+    parser.add_argument('--rotate', action='store', choices=image_pb2.ImageRotateRequest.Rotation.keys(), help='Rotation enum input')
+    parser.add_argument('--mean', action='store_true', help='Apply mean filter')
+    parser.add_argument('--radius', type=int, default=1, action='store', help='Number of neighbors either side of each pixel the mean filter averages over')
+    parser.add_argument('--encoded', action='store_true', help='Send input files as-is and receive results encoded in the output format')
+    parser.add_argument('--quality', type=int, default=0, action='store', help='JPEG or WebP quality of encoded results, from 1 to 100 (0 for the server default)')
+    parser.add_argument('--compression', default='none', action='store', choices=['none', 'gzip', 'deflate'], help='gRPC channel compression')
+    parser.add_argument('--concurrency', type=int, default=16, action='store', help='Max number of RPCs in flight')
+    parser.add_argument('--workers', type=int, default=4, action='store', help='Number of extra threads loading and saving files')
+    parser.add_argument('--resume', action='store_true', help='Skip inputs completed by a previous run into --output-dir')
+    parser.add_argument('--priority', action='store', choices=scheduler.PRIORITIES, help='Priority class of the requests')
+    return parser
@@ -0,0 +1,153 @@
+import json
+import math
+import time
+import platform
+import tracemalloc
+
+import numpy as np
+
+import image_pb2
+
+# Operations that can be benchmarked, see benchmark.get_operation
+OPERATIONS = ['RotateImage', 'MeanFilter', 'get_pixels_buffer', 'image_to_pil_image']
+
+# Number of bands stored per pixel by each image mode
+MODE_BANDS = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+# Min increase in seconds of a median time before it counts as a regression, so jitter in very fast
+# operations does not fail the regression gate
+MIN_REGRESSION_SECONDS = 0.001
+
+def make_test_image(size, mode, seed=0):
+    '''
+    Returns square gRPC Image of random pixels
+
+        Parameters:
+            size (int): Width and height of the image in pixels
+            mode (str): 'L', 'RGB', or 'RGBA'
+            seed (int): Seed of the random pixel values
+        Returns:
+            (Image): gRPC Image object
+    '''
+    num_bands = MODE_BANDS[mode]
+    data = np.random.default_rng(seed).integers(0, 256, size=size * size * num_bands, dtype=np.uint8).tobytes()
+    return image_pb2.Image(color=num_bands != 1, data=data, width=size, height=size)
+
+def get_percentile(times, percent):
+    '''
+    Returns percentile of a list of times, using the nearest-rank method
+
+        Parameters:
+            times (list): Non-empty list of times in seconds
+            percent (float): Percentile to return, from 0 to 100
+        Returns:
+            (float): Smallest time such that at least percent percent of times are less than or equal to it
+    '''
+    ordered = sorted(times)
+    # Rounded before taking the ceiling, so float error in fractional percentiles such as 99.9 does not skip a rank
+    rank = max(1, math.ceil(round(percent * len(ordered) / 100, 6)))
+    return ordered[rank - 1]
+
+def measure(function, repeats=5, max_seconds=10, measure_memory=True):
+    '''
+    Returns timing and memory statistics of calling function with no arguments
+
+    function is called repeats times, stopping early once max_seconds have been spent so large cases stay bounded,
+    but always at least once. If measure_memory is set, function is called once more under tracemalloc to record
+    the peak bytes allocated by Python and numpy during a call, so tracing does not slow down the timed calls.
+
+        Parameters:
+            function (function): Function to measure
+            repeats (int): Max number of timed calls
+            max_seconds (float): Time budget in seconds of the timed calls
+            measure_memory (bool): True to record peak memory
+        Returns:
+            (dict): Dictionary of runs, median, p95, min, and peak_bytes (None if memory was not measured)
+    '''
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeats and (not times or time.perf_counter() - started < max_seconds):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    peak_bytes = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'runs': len(times),
+        'median': float(np.median(times)),
+        'p95': get_percentile(times, 95),
+        'min': min(times),
+        'peak_bytes': peak_bytes,
+    }
+
+def get_environment():
+    '''
+    Returns dictionary describing the machine and library versions a benchmark was run with
+    '''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+def save_results(results, path):
+    '''
+    Writes benchmark results to path as JSON
+
+        Parameters:
+            results (dict): Dictionary of environment and results, where results is a list of result dictionaries
+            path (str): Output file path
+        Returns:
+            None
+    '''
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+def load_results(path):
+    '''
+    Returns benchmark results read from a JSON file written by save_results
+    '''
+    with open(path) as file:
+        return json.load(file)
+
+def get_case_name(result):
+    '''
+    Returns name identifying the operation, mode, and size of a result, used to match results between runs
+    '''
+    return '{}/{}/{}'.format(result['operation'], result['mode'], result['size'])
+
+def compare_results(current, baseline, threshold, min_seconds=MIN_REGRESSION_SECONDS):
+    '''
+    Returns list of cases whose median time in current is more than threshold slower than in baseline
+
+    Cases are matched by operation, mode, and size. Cases missing from either run are ignored.
+    A case only counts as a regression if its median also increased by more than min_seconds.
+
+        Parameters:
+            current (dict): Results of the run to check, as returned by load_results
+            baseline (dict): Results of the baseline run
+            threshold (float): Max allowed relative slowdown, e.g. 0.2 for 20%
+            min_seconds (float): Min absolute slowdown in seconds of a regression
+        Returns:
+            regressions (list): List of (name, baseline median, current median) tuples
+    '''
+    baseline_medians = {get_case_name(result): result['median'] for result in baseline['results']}
+
+    regressions = []
+    for result in current['results']:
+        name = get_case_name(result)
+        if name not in baseline_medians:
+            continue
+        before, after = baseline_medians[name], result['median']
+        if after > before * (1 + threshold) and after - before > min_seconds:
+            regressions.append((name, before, after))
+    return regressions
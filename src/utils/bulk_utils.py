@@ -0,0 +1,144 @@
+import os
+import glob
+import json
+import threading
+
+import utils.codec as codec
+
+# Names of the files that bulk_client.py keeps in the output directory
+JOURNAL_NAME = '.bulk_journal'
+ERROR_REPORT_NAME = 'bulk_errors.jsonl'
+
+def get_output_path(input_path, relative_path, output_dir, extension=None):
+    '''
+    Returns path in output_dir of the result of an input file
+
+        Parameters:
+            input_path (str): Path of the input file
+            relative_path (str): Path of the result relative to output_dir
+            output_dir (str): Directory results are written to
+            extension (str): Extension of the result, e.g. '.png', or None to keep the extension of the input file
+        Returns:
+            (str): Output file path
+    '''
+    path = os.path.join(output_dir, relative_path)
+    if extension is not None:
+        path = os.path.splitext(path)[0] + extension
+    return path
+
+def find_inputs(input, output_dir, extension=None):
+    '''
+    Returns list of (input path, output path) tuples of the image files in a directory or matched by a glob pattern
+
+    Directories are searched recursively. Results keep the path of their input file relative to the directory, or to the
+    deepest directory shared by every match of a glob pattern, so files with the same name in different directories
+    do not overwrite each other. Only files with a .png, .jpg, .jpeg, or .webp extension are included.
+
+        Parameters:
+            input (str): Directory or glob pattern
+            output_dir (str): Directory results are written to
+            extension (str): Extension of the results, or None to keep the extension of each input file
+        Returns:
+            inputs (list): Sorted list of (input path, output path) tuples
+    '''
+    if os.path.isdir(input):
+        root = input
+        paths = [os.path.join(directory, name) for directory, _, names in os.walk(input) for name in names]
+    else:
+        paths = [path for path in glob.glob(input, recursive=True) if os.path.isfile(path)]
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else ''
+
+    paths = sorted(path for path in paths if codec.get_file_encoding(path) is not None)
+    return [(path, get_output_path(path, os.path.relpath(os.path.abspath(path), os.path.abspath(root)), output_dir, extension))
+            for path in paths]
+
+def read_manifest(path, output_dir, extension=None):
+    '''
+    Returns list of (input path, output path) tuples read from a manifest file
+
+    Each line holds an input path, optionally followed by a tab and an output path relative to output_dir.
+    Inputs without an output path are written to their file name in output_dir. Blank lines and lines starting
+    with '#' are skipped.
+    Raises ValueError if a line has an unsupported extension.
+
+        Parameters:
+            path (str): Path of the manifest file
+            output_dir (str): Directory results are written to
+            extension (str): Extension of the results, or None to keep the extension of each input or output path
+        Returns:
+            inputs (list): List of (input path, output path) tuples in manifest order
+    '''
+    inputs = []
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            input_path, _, relative_path = line.partition('\t')
+            output_path = get_output_path(input_path, relative_path or os.path.basename(input_path), output_dir, extension)
+            if codec.get_file_encoding(input_path) is None or codec.get_file_encoding(output_path) is None:
+                raise ValueError('line ' + str(number) + ' of ' + path + ' is not a .png, .jpg, .jpeg, or .webp file')
+            inputs.append((input_path, output_path))
+    return inputs
+
+def read_journal(path):
+    '''
+    Returns set of input paths recorded as done in a journal file, or an empty set if it does not exist
+    '''
+    if not os.path.exists(path):
+        return set()
+    with open(path) as file:
+        return {line.rstrip('\n') for line in file if line.endswith('\n')}
+
+class LineWriter:
+    '''
+    Thread-safe writer that appends lines to a file, flushing each line so it survives the process being killed.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        Path of the file lines are appended to.
+
+    Methods
+    -------
+    write(line):
+        Appends a line to the file.
+    close():
+        Closes the file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def write(self, line):
+        '''
+        Appends line and a newline to the file, and flushes it.
+        '''
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        '''
+        Closes the file.
+        '''
+        with self.lock:
+            self.file.close()
+
+def format_error(input_path, stage, code, message):
+    '''
+    Returns line of the error report of bulk_client.py, as JSON
+
+        Parameters:
+            input_path (str): Path of the input file that failed
+            stage (str): 'load', 'rpc', or 'save'
+            code (str): gRPC status code name, or exception class name
+            message (str): Error message
+        Returns:
+            (str): JSON object on one line
+    '''
+    return json.dumps({'input': input_path, 'stage': stage, 'code': code, 'error': message})
@@ -0,0 +1,132 @@
+import time
+import grpc
+
+import image_pb2
+
+# Lower bound on the seconds per byte of raw pixels that each stage type takes to compute, a few times faster than
+# measured on one core, so requests are only rejected up front when they could not finish even on a fast host
+STAGE_SECONDS_PER_BYTE = {
+    image_pb2.Operation.Type.ROTATE: 1e-9,
+    image_pb2.Operation.Type.MEAN_FILTER: 2e-9,
+    image_pb2.Operation.Type.CONVOLVE: 5e-9,
+}
+
+class RequestStoppedError(Exception):
+    '''
+    Raised when processing of a request stops early because its result is no longer wanted.
+
+    Subclasses set code to the gRPC status code the request is aborted with.
+    '''
+
+    code = grpc.StatusCode.CANCELLED
+
+class CancelledError(RequestStoppedError):
+    '''
+    Raised when the client of a request has cancelled it or disconnected.
+    '''
+
+    code = grpc.StatusCode.CANCELLED
+
+class DeadlineExceededError(RequestStoppedError):
+    '''
+    Raised when a request has passed its deadline, or cannot finish before it.
+    '''
+
+    code = grpc.StatusCode.DEADLINE_EXCEEDED
+
+def estimate_seconds(raw_size, stage_types):
+    '''
+    Returns lower bound on the seconds needed to run stages of the given types on raw_size bytes of pixels
+
+        Parameters:
+            raw_size (int): Size in bytes of the raw pixels of the image
+            stage_types (list): Operation.Type of each stage, run one after another
+        Returns:
+            (float): Estimated seconds
+    '''
+    return raw_size * sum(STAGE_SECONDS_PER_BYTE.get(stage_type, 0) for stage_type in stage_types)
+
+class RequestMonitor:
+    '''
+    Tracks whether the client of a request is still waiting for its result, so processing loops can stop early.
+
+    The monitor is registered as a termination callback of the request's context, and its deadline is taken from the
+    time remaining on the context when it is created. check() only reads an attribute and the monotonic clock,
+    so it is cheap enough to call once per row band, from any thread.
+
+    ...
+
+    Attributes
+    ----------
+    deadline : float
+        time.monotonic() value the request must finish by, or None if it has no deadline.
+    active : bool
+        False once the request has terminated.
+
+    Methods
+    -------
+    check():
+        Raises CancelledError or DeadlineExceededError if processing should stop.
+    check_cost(seconds):
+        Raises DeadlineExceededError if seconds of work cannot finish before the deadline.
+    '''
+
+    def __init__(self, time_remaining=None):
+        self.deadline = time.monotonic() + time_remaining if time_remaining is not None else None
+        self.active = True
+
+    def terminate(self, *args):
+        '''
+        Marks the request as terminated. Called by gRPC when the request ends, with the context on grpc.aio servers.
+        '''
+        self.active = False
+
+    def get_time_remaining(self):
+        '''
+        Returns seconds left until the deadline, or None if the request has no deadline.
+        '''
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def check(self):
+        '''
+        Raises DeadlineExceededError if the deadline of the request has passed, or CancelledError if it has terminated.
+        Requests terminated by gRPC when their deadline passes are reported as DeadlineExceededError.
+        '''
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceededError('deadline passed while processing')
+        if not self.active:
+            raise CancelledError('request was cancelled')
+
+    def check_cost(self, seconds):
+        '''
+        Raises CancelledError or DeadlineExceededError if processing should stop, or DeadlineExceededError if
+        an estimated seconds of work cannot finish before the deadline.
+        '''
+        self.check()
+        remaining = self.get_time_remaining()
+        if remaining is not None and seconds > remaining:
+            raise DeadlineExceededError('needs at least {:.3f} s, but only {:.3f} s remain before the deadline'.format(seconds, remaining))
+
+def monitor_context(context):
+    '''
+    Returns RequestMonitor of the context of a request on a grpc.server, or None if there is no context
+
+    The context must not be used after the request has terminated, so the monitor is registered as its callback.
+    '''
+    if context is None:
+        return None
+    monitor = RequestMonitor(context.time_remaining())
+    if not context.add_callback(monitor.terminate):
+        monitor.terminate()
+    return monitor
+
+def monitor_async_context(context):
+    '''
+    Returns RequestMonitor of the context of a request on a grpc.aio server
+
+    Must be called on the event loop. The monitor only reads its own attributes, so it can be checked
+    from executor threads without touching the context.
+    '''
+    monitor = RequestMonitor(context.time_remaining())
+    context.add_done_callback(monitor.terminate)
+    return monitor
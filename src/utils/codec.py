@@ -0,0 +1,163 @@
+import io
+import os
+import grpc
+from PIL import Image, UnidentifiedImageError
+
+import image_pb2
+
+# Max size in bytes of the raw pixels of a decoded image, checked before the file is decoded
+MAX_DECODED_SIZE = 67108864
+
+# JPEG and WebP quality used when a request does not set response_quality
+DEFAULT_QUALITY = 90
+
+# zlib level of PNG responses - level 1 is several times faster than Pillow's default of 6,
+# and most of the size reduction of PNG comes from its row filters rather than the zlib level
+PNG_COMPRESS_LEVEL = 1
+
+# Pillow format name of each Image.Encoding
+FORMATS = {
+    image_pb2.Image.Encoding.PNG: 'PNG',
+    image_pb2.Image.Encoding.JPEG: 'JPEG',
+    image_pb2.Image.Encoding.WEBP: 'WEBP',
+}
+
+# Image.Encoding of each image file extension
+EXTENSIONS = {
+    '.png': image_pb2.Image.Encoding.PNG,
+    '.jpg': image_pb2.Image.Encoding.JPEG,
+    '.jpeg': image_pb2.Image.Encoding.JPEG,
+    '.webp': image_pb2.Image.Encoding.WEBP,
+}
+
+# gRPC channel-level compression algorithms, selected with --compression
+CHANNEL_COMPRESSION = {
+    'none': grpc.Compression.NoCompression,
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+}
+
+def get_file_encoding(path):
+    '''
+    Returns Image.Encoding of an image file path from its extension, or None if the extension is not supported
+    '''
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+def get_decoded_mode(img):
+    '''
+    Returns 'L', 'RGB', or 'RGBA' mode that a decoded Pillow Image is converted to
+
+    Single channel images become 'L', images with an alpha channel or transparent palette entry become 'RGBA',
+    and all other images become 'RGB'.
+    '''
+    if img.mode in ('1', 'L', 'I', 'I;16', 'F'):
+        return 'L'
+    elif 'A' in img.mode or 'transparency' in img.info:
+        return 'RGBA'
+    return 'RGB'
+
+def open_image(image):
+    '''
+    Returns Pillow Image of the file held by an encoded Image, reading only its header
+
+    Raises ValueError if Image.data is not a file of Image.encoding, or if its header declares more pixels than
+    Pillow will open.
+    '''
+    try:
+        img = Image.open(io.BytesIO(image.data))
+    except Image.DecompressionBombError:
+        raise ValueError('decoded image is larger than ' + str(MAX_DECODED_SIZE) + ' bytes')
+    except (UnidentifiedImageError, OSError):
+        raise ValueError('data is not a valid ' + FORMATS[image.encoding] + ' file')
+    if img.format != FORMATS[image.encoding]:
+        raise ValueError('data is a ' + str(img.format) + ' file, not ' + FORMATS[image.encoding])
+    return img
+
+def get_decoded_size(image):
+    '''
+    Returns size in bytes of the raw pixels an encoded Image decodes to, read from the file header without decoding it
+
+    Raises ValueError if Image.encoding is invalid, or Image.data is not a file of that encoding.
+    '''
+    if image.encoding not in FORMATS:
+        raise ValueError('encoding is not valid')
+    img = open_image(image)
+    return img.width * img.height * len(get_decoded_mode(img))
+
+def decode_image(image):
+    '''
+    Returns raw Image holding the pixels of an encoded Image
+
+    Raises ValueError if Image.data is not a file of Image.encoding, or if its pixels would be larger than
+    MAX_DECODED_SIZE bytes. The size is read from the file header, so oversized files are rejected before decoding.
+
+        Parameters:
+            image (Image): gRPC Image object whose data is a PNG, JPEG, or WebP file
+        Returns:
+            (Image): gRPC Image object with RAW encoding
+    '''
+    img = open_image(image)
+    mode = get_decoded_mode(img)
+    width, height = img.size
+    if width * height * len(mode) > MAX_DECODED_SIZE:
+        raise ValueError('decoded image is larger than ' + str(MAX_DECODED_SIZE) + ' bytes')
+
+    try:
+        img = img.convert(mode)
+    except (OSError, SyntaxError):
+        raise ValueError('data is not a valid ' + FORMATS[image.encoding] + ' file')
+    return image_pb2.Image(color=mode != 'L', data=img.tobytes(), width=width, height=height)
+
+def encode_image(image, encoding, quality=0):
+    '''
+    Returns Image whose data is a file of the given encoding, holding the pixels of a raw Image
+
+    JPEG cannot store an alpha channel, so the alpha channel of RGBA images is dropped when encoding JPEG.
+    Raises ValueError if encoding or quality is not valid.
+
+        Parameters:
+            image (Image): gRPC Image object with RAW encoding
+            encoding (Image.Encoding): PNG, JPEG, or WEBP
+            quality (int): JPEG or WebP quality from 1 to 100, or 0 for DEFAULT_QUALITY
+        Returns:
+            (Image): gRPC Image object with the given encoding, and the color, width, and height of image
+    '''
+    if encoding not in FORMATS:
+        raise ValueError('response encoding is not valid')
+    if quality < 0 or quality > 100:
+        raise ValueError('response quality is not valid')
+
+    num_bands = len(image.data) // (image.width * image.height)
+    mode = 'RGB' if num_bands == 3 else 'RGBA' if num_bands == 4 else 'L'
+    img = Image.frombuffer(mode, (image.width, image.height), image.data, 'raw', mode, 0, 1)
+    if encoding == image_pb2.Image.Encoding.JPEG and mode == 'RGBA':
+        img = img.convert('RGB')
+
+    output = io.BytesIO()
+    if encoding == image_pb2.Image.Encoding.PNG:
+        img.save(output, 'PNG', compress_level=PNG_COMPRESS_LEVEL)
+    else:
+        img.save(output, FORMATS[encoding], quality=quality or DEFAULT_QUALITY)
+    return image_pb2.Image(color=image.color, data=output.getvalue(), width=image.width, height=image.height,
+                           encoding=encoding)
+
+def file_to_image(path, response_encoding=image_pb2.Image.Encoding.RAW, response_quality=0):
+    '''
+    Returns Image whose data is the contents of a PNG, JPEG, or WebP file, sent without decoding it
+
+        Parameters:
+            path (str): Path of the image file
+            response_encoding (Image.Encoding): Encoding to request the result in
+            response_quality (int): JPEG or WebP quality to request the result in, or 0 for the default
+        Returns:
+            (Image): gRPC Image object with the encoding of the file
+    '''
+    with Image.open(path) as img:
+        encoding = {name: encoding for encoding, name in FORMATS.items()}.get(img.format)
+        width, height, color = img.width, img.height, get_decoded_mode(img) != 'L'
+    if encoding is None:
+        raise ValueError(path + ' is not a PNG, JPEG, or WebP file')
+    with open(path, 'rb') as file:
+        data = file.read()
+    return image_pb2.Image(color=color, data=data, width=width, height=height, encoding=encoding,
+                           response_encoding=response_encoding, response_quality=response_quality)
@@ -0,0 +1,158 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import image_pb2
+import utils.pipeline as pipeline
+
+# Default min number of pixels in an image before it is sent to a worker process rather than processed inline
+INLINE_THRESHOLD = 1048576
+
+def run_in_worker(input_name, input_shape, output_name, output_shape, stages):
+    '''
+    Runs planned stages on the pixels in a shared memory segment, and writes the result to another segment
+
+    Runs in a worker process of a ProcessPoolBackend. Only segment names, shapes, and stages are pickled,
+    the pixel data itself is read from and written to shared memory.
+
+        Parameters:
+            input_name (str): Name of the shared memory segment holding the input pixels
+            input_shape (tuple): Shape (height, width, bands) of the input pixels
+            output_name (str): Name of the shared memory segment to write the output pixels to
+            output_shape (tuple): Shape (height, width, bands) of the output pixels
+            stages (list): List of (type, rotation, parameter) tuples, as returned by pipeline.plan_operations
+        Returns:
+            None
+    '''
+    input_segment = shared_memory.SharedMemory(name=input_name)
+    output_segment = shared_memory.SharedMemory(name=output_name)
+    try:
+        pixels = np.ndarray(input_shape, dtype=np.uint8, buffer=input_segment.buf)
+        out = np.ndarray(output_shape, dtype=np.uint8, buffer=output_segment.buf)
+        np.copyto(out, pipeline.run_stages(pixels, stages))
+        del pixels, out
+    finally:
+        input_segment.close()
+        output_segment.close()
+
+def warm_up_worker():
+    '''
+    Runs a mean filter and rotation on a tiny image, so a worker process has imported and initialised
+    everything it needs before its first request
+
+        Parameters:
+            None
+        Returns:
+            (int): Process id of the worker
+    '''
+    pipeline.run_stages(np.zeros((2, 2, 1), dtype=np.uint8), [(image_pb2.Operation.Type.MEAN_FILTER, 1, 1)])
+    return os.getpid()
+
+class ProcessPoolBackend:
+    '''
+    Runs image operations in a pool of worker processes, so they are not limited by the GIL of the server process.
+
+    Pixel buffers are handed to and from workers through multiprocessing.shared_memory segments rather than pickled.
+    Images below inline_threshold pixels should be processed inline by the caller, since dispatching them to a
+    worker process costs more than the work itself.
+    If a worker process dies, the pool is replaced with a new one and the request is retried once.
+
+    ...
+
+    Attributes
+    ----------
+    workers : int
+        Number of worker processes in the pool.
+    inline_threshold : int
+        Min number of pixels in an image before it should be sent to the pool.
+
+    Methods
+    -------
+    run(pixels, stages):
+        Runs planned stages on pixels in a worker process, and returns the output data and shape.
+    shutdown():
+        Shuts down the worker processes.
+    '''
+
+    def __init__(self, workers=None, inline_threshold=INLINE_THRESHOLD, warmup=True):
+        '''
+        Starts the pool of worker processes.
+
+        If warmup is True, every worker is started and initialised before the constructor returns.
+        '''
+        self.workers = workers or os.cpu_count()
+        self.inline_threshold = inline_threshold
+        self.warmup = warmup
+        self.lock = threading.Lock()
+        self.pool = self.create_pool()
+
+    def create_pool(self):
+        '''
+        Returns a new pool of worker processes, warmed up if warmup is set.
+
+        Workers are spawned rather than forked, so they do not inherit the gRPC state of the server process.
+        '''
+        pool = futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        if self.warmup:
+            for future in [pool.submit(warm_up_worker) for _ in range(self.workers)]:
+                future.result()
+        return pool
+
+    def replace_pool(self, broken_pool):
+        '''
+        Replaces broken_pool with a new pool, unless another thread has already replaced it.
+        '''
+        with self.lock:
+            if self.pool is broken_pool:
+                logging.error('Compute worker process died - replacing worker pool')
+                broken_pool.shutdown(wait=False)
+                self.pool = self.create_pool()
+
+    def run(self, pixels, stages):
+        '''
+        Runs planned stages on pixels in a worker process, and returns the output data and shape.
+
+        If the worker process dies, the pool is replaced and the stages are run once more,
+        raising BrokenProcessPool if the retry also fails.
+
+            Parameters:
+                pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+                stages (list): List of (type, rotation, parameter) tuples, as returned by pipeline.plan_operations
+            Returns:
+                (tuple): (data, shape) where data is the bytes of the output pixels
+                         and shape is their (height, width, bands) shape
+        '''
+        output_shape = pipeline.get_output_shape(pixels.shape, stages)
+        input_segment = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        output_segment = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        try:
+            np.copyto(np.ndarray(pixels.shape, dtype=np.uint8, buffer=input_segment.buf), pixels)
+
+            for attempt in range(2):
+                pool = self.pool
+                try:
+                    pool.submit(run_in_worker, input_segment.name, pixels.shape, output_segment.name, output_shape, stages).result()
+                    break
+                except BrokenProcessPool:
+                    self.replace_pool(pool)
+                    if attempt:
+                        raise
+
+            return bytes(output_segment.buf[:pixels.nbytes]), output_shape
+        finally:
+            input_segment.close()
+            input_segment.unlink()
+            output_segment.close()
+            output_segment.unlink()
+
+    def shutdown(self):
+        '''
+        Shuts down the worker processes, waiting for running requests to finish.
+        '''
+        self.pool.shutdown()
@@ -0,0 +1,647 @@
+import functools
+from concurrent import futures
+
+import numpy as np
+
+# Number of rows filtered at a time, so the intermediate sums of a band stay in cache
+BAND_ROWS = 64
+
+# Number of fractional bits of the fixed-point weights of 2-D kernels, and of each 1-D factor of separable kernels
+KERNEL_FRACTION_BITS = 16
+SEPARABLE_FRACTION_BITS = 10
+
+# Bound on the magnitude of the int32 accumulators of a convolution
+MAX_TOTAL = 1 << 31
+
+# Max ratio of the second to the first singular value of a kernel for it to be treated as separable
+SEPARABLE_TOLERANCE = 1e-6
+
+def get_num_bands(image):
+    '''
+    Returns number of channels stored per pixel in Image.data
+
+    Calculates number of channels from the length of the data buffer and the image dimensions,
+    matching the mode detection used by image_utils.image_to_pil_image
+
+        Parameters:
+            image (Image): gRPC Image object
+        Returns:
+            (int): 1 for 'L', 3 for 'RGB', or 4 for 'RGBA' images
+    '''
+    return len(image.data) // (image.width * image.height)
+
+def image_to_array(image):
+    '''
+    Returns read-only numpy view of Image.data with shape (height, width, bands)
+
+    No pixel data is copied - the returned array shares memory with the Image.data bytes object
+
+        Parameters:
+            image (Image): gRPC Image object
+        Returns:
+            (numpy.ndarray): uint8 array of shape (height, width, bands)
+    '''
+    num_bands = get_num_bands(image)
+    return np.frombuffer(image.data, dtype=np.uint8, count=image.height * image.width * num_bands).reshape(
+        image.height, image.width, num_bands)
+
+def get_neighbor_counts(length, radius=1):
+    '''
+    Returns number of in-bounds positions along one axis covered by the neighbourhood of each position
+
+    The neighbourhood of a position spans radius positions either side of it, so positions within radius of the
+    first and last index have fewer neighbors than interior positions.
+    Multiplying the row counts by the column counts gives the number of pixels averaged by the
+    mean filter at each pixel, matching get_pixel_neighbors plus the pixel itself when radius is 1
+
+        Parameters:
+            length (int): Number of pixels along the axis
+            radius (int): Number of neighbors either side of each position
+        Returns:
+            (numpy.ndarray): uint16 array of length `length` holding the neighbor count of each position,
+                             or uint32 if radius is greater than 1
+    '''
+    index = np.arange(length)
+    counts = np.minimum(index + radius, length - 1) - np.maximum(index - radius, 0) + 1
+    return counts.astype(np.uint16 if radius == 1 else np.uint32)
+
+def get_window_sums(values, radius, axis):
+    '''
+    Returns sums of values over the window of radius positions either side of each position along axis
+
+    Windows are clipped to the bounds of the axis. Each sum is the difference of two entries of a running sum,
+    so the cost per position is the same for any radius.
+
+        Parameters:
+            values (numpy.ndarray): Array of non-negative integers
+            radius (int): Number of positions either side of each position to sum over
+            axis (int): Axis to sum along
+        Returns:
+            (numpy.ndarray): uint32 array of the same shape as values
+    '''
+    length = values.shape[axis]
+
+    def along_axis(start, end=None):
+        index = [slice(None)] * values.ndim
+        index[axis] = slice(start, end)
+        return tuple(index)
+
+    # Running sums padded with radius+1 zeros before the first position and radius copies of the total after the last,
+    # so the windows of positions near either end are clipped to the bounds of the axis
+    shape = list(values.shape)
+    shape[axis] = length + 2 * radius + 1
+    sums = np.zeros(shape, dtype=np.uint32)
+    np.cumsum(values, axis=axis, dtype=np.uint32, out=sums[along_axis(radius + 1, radius + 1 + length)])
+    sums[along_axis(radius + 1 + length)] = sums[along_axis(radius + length, radius + length + 1)]
+
+    return sums[along_axis(2 * radius + 1, 2 * radius + 1 + length)] - sums[along_axis(0, length)]
+
+def mean_filter_band(pixels, row_start, row_end, out=None, radius=1):
+    '''
+    Returns mean filtered rows [row_start, row_end) of pixels as a band of shape (row_end-row_start, width, bands)
+
+    Only rows row_start-radius to row_end+radius-1 (the halo above and below the band) are read from pixels,
+    so independent bands can be filtered separately and produce the same result as filtering the whole image.
+    Each output pixel is the floor of the sum of the in-bounds pixels within radius rows and columns of it
+    divided by their count, computed independently for each channel.
+    A radius of 1 is summed from shifted slices, and larger radii from running sums along each axis,
+    so the cost per pixel does not grow with radius.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 source array of shape (height, width, bands)
+            row_start (int): First row of the band to filter
+            row_end (int): Row after the last row of the band to filter
+            out (numpy.ndarray): Optional uint8 destination array for the band - allocated if None
+            radius (int): Number of neighbors either side of each pixel to average over
+        Returns:
+            out (numpy.ndarray): uint8 array holding the filtered band
+    '''
+    height, width, num_bands = pixels.shape
+    num_rows = row_end - row_start
+    if out is None:
+        out = np.empty((num_rows, width, num_bands), dtype=np.uint8)
+    if num_rows <= 0:
+        return out
+
+    halo_start = max(row_start - radius, 0)
+    halo_end = min(row_end + radius, height)
+    offset = row_start - halo_start
+
+    if radius == 1:
+        # Horizontal sums of each pixel and its west/east neighbors, for the band and its halo rows
+        band = pixels[halo_start:halo_end].astype(np.uint16)
+        sums = band.copy()
+        sums[:, 1:] += band[:, :-1]
+        sums[:, :-1] += band[:, 1:]
+
+        # Vertical sums of the horizontal sums for each row in the band
+        totals = sums[offset:offset + num_rows].copy()
+        if offset:
+            totals += sums[:num_rows]
+        else:
+            totals[1:] += sums[:num_rows - 1]
+        below = sums[offset + 1:offset + 1 + num_rows]
+        totals[:len(below)] += below
+    else:
+        sums = get_window_sums(pixels[halo_start:halo_end], radius, axis=1)
+        totals = get_window_sums(sums, radius, axis=0)[offset:offset + num_rows]
+
+    divisors = get_neighbor_counts(height, radius)[row_start:row_end, None, None] * get_neighbor_counts(width, radius)[None, :, None]
+    np.floor_divide(totals, divisors, out=out, casting='unsafe')
+    return out
+
+def filter_rows(filter_band, pixels, out, row_start, row_end, rotation=0, check=None):
+    '''
+    Writes filtered rows [row_start, row_end) of pixels into their position in out, rotated by rotation quarter turns
+
+    filter_band is called as filter_band(pixels, band_start, band_end, out=None) and returns the filtered rows
+    [band_start, band_end), reading whatever halo rows it needs from pixels - see mean_filter_band and convolve_band.
+    Rows are filtered in row bands of BAND_ROWS rows, whose intermediate sums stay in cache,
+    and rotated bands are written to their rotated position in out while they are still in cache.
+    If check is given, it is called before each row band, and can raise to stop filtering early.
+
+        Parameters:
+            filter_band (function): Function that filters a band of rows
+            pixels (numpy.ndarray): uint8 source array of shape (height, width, bands)
+            out (numpy.ndarray): uint8 destination array of the rotated shape of pixels
+            row_start (int): First row of the band to filter
+            row_end (int): Row after the last row of the band to filter
+            rotation (int): Number of quarter turns to rotate by, matching ImageRotateRequest.Rotation values
+            check (function): Optional function called with no arguments before each row band
+        Returns:
+            None
+    '''
+    for band_start in range(row_start, row_end, BAND_ROWS):
+        if check is not None:
+            check()
+        band_end = min(band_start + BAND_ROWS, row_end)
+        if rotation % 4 == 0:
+            filter_band(pixels, band_start, band_end, out=out[band_start:band_end])
+        else:
+            filtered = filter_band(pixels, band_start, band_end)
+            rotate_band_into(filtered, rotation, out, band_start, pixels.shape[0])
+
+def mean_filter_rows(pixels, out, row_start, row_end, rotation=0, radius=1):
+    '''
+    Writes mean filtered rows [row_start, row_end) of pixels into their position in out, rotated by rotation quarter turns
+
+    See mean_filter_band for the rows of pixels that are read, and filter_rows for how rotated rows are written.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 source array of shape (height, width, bands)
+            out (numpy.ndarray): uint8 destination array of the rotated shape of pixels
+            row_start (int): First row of the band to filter
+            row_end (int): Row after the last row of the band to filter
+            rotation (int): Number of quarter turns to rotate by, matching ImageRotateRequest.Rotation values
+            radius (int): Number of neighbors either side of each pixel to average over
+        Returns:
+            None
+    '''
+    filter_rows(functools.partial(mean_filter_band, radius=radius), pixels, out, row_start, row_end, rotation)
+
+def get_row_band_bounds(height, num_row_bands):
+    '''
+    Returns bounds of num_row_bands horizontal row bands of near-equal height covering all rows of an image
+
+        Parameters:
+            height (int): Height in pixels of the image
+            num_row_bands (int): Number of row bands to split the image into - capped at height
+        Returns:
+            (list): List of (row_start, row_end) tuples in order from the top row down
+    '''
+    num_row_bands = max(1, min(num_row_bands, height))
+    return [(height * i // num_row_bands, height * (i + 1) // num_row_bands) for i in range(num_row_bands)]
+
+def filter_array(filter_band, pixels, executor=None, parallelism=1, rotation=0, check=None, out=None):
+    '''
+    Returns filtered copy of pixels, optionally rotated by rotation quarter turns in the same pass
+
+    If an executor is given and parallelism is greater than 1, the image is split into parallelism row bands
+    that are filtered concurrently in the executor. The bands read their halo rows from the shared source
+    array and write disjoint rows of the shared output array, and numpy releases the GIL while filtering,
+    so no pixel data is copied between workers and the output is identical to the serial path.
+    If check raises, the other row bands stop at their next check, and the exception is raised once all have stopped.
+
+        Parameters:
+            filter_band (function): Function that filters a band of rows, as described by filter_rows
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            executor (concurrent.futures.Executor): Optional thread pool to filter row bands in
+            parallelism (int): Number of row bands to filter concurrently
+            rotation (int): Number of quarter turns to rotate the filtered image by
+            check (function): Optional function called with no arguments before each band of BAND_ROWS rows
+            out (numpy.ndarray): Optional uint8 destination array of the rotated shape of pixels - allocated if None
+        Returns:
+            out (numpy.ndarray): uint8 filtered array, of the rotated shape of pixels
+    '''
+    if out is None:
+        out = np.empty(get_rotated_view(pixels, rotation).shape, dtype=np.uint8)
+    height = pixels.shape[0]
+    if executor is None or parallelism <= 1:
+        filter_rows(filter_band, pixels, out, 0, height, rotation, check)
+    else:
+        row_bands = [executor.submit(filter_rows, filter_band, pixels, out, row_start, row_end, rotation, check)
+                     for row_start, row_end in get_row_band_bounds(height, parallelism)]
+        futures.wait(row_bands)
+        for row_band in row_bands:
+            row_band.result()
+    return out
+
+def mean_filter_array(pixels, executor=None, parallelism=1, rotation=0, radius=1, check=None, out=None):
+    '''
+    Returns mean filtered copy of pixels, optionally rotated by rotation quarter turns in the same pass
+
+    Each pixel is replaced by the average of itself and its in-bounds neighbors within radius rows and columns,
+    taken independently for each channel and rounded down, as described in the MeanFilter proto definition.
+    See filter_array for how row bands are filtered in parallel.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            executor (concurrent.futures.Executor): Optional thread pool to filter row bands in
+            parallelism (int): Number of row bands to filter concurrently
+            rotation (int): Number of quarter turns to rotate the filtered image by
+            radius (int): Number of neighbors either side of each pixel to average over
+            check (function): Optional function called before each row band, that can raise to stop filtering early
+            out (numpy.ndarray): Optional uint8 destination array of the rotated shape of pixels - allocated if None
+        Returns:
+            out (numpy.ndarray): uint8 mean filtered array, of the rotated shape of pixels
+    '''
+    return filter_array(functools.partial(mean_filter_band, radius=radius), pixels, executor, parallelism, rotation, check, out)
+
+def get_in_bounds_weights(length, weights):
+    '''
+    Returns sum of the kernel weights that fall in bounds when a 1-D kernel is centred on each position along an axis
+
+    Generalises get_neighbor_counts to weighted kernels - for a kernel of 2*radius+1 ones the two are equal.
+    Used to normalise convolutions by the weights of the in-bounds neighbors only, as the mean filter does.
+
+        Parameters:
+            length (int): Number of pixels along the axis
+            weights (numpy.ndarray): 1-D integer kernel of odd length
+        Returns:
+            (numpy.ndarray): int64 array of length `length` holding the in-bounds weight sum at each position
+    '''
+    first, last = get_kernel_bounds(length, len(weights))
+    sums = np.concatenate(([0], np.cumsum(weights, dtype=np.int64)))
+    return sums[last + 1] - sums[first]
+
+def get_kernel_bounds(length, size):
+    '''
+    Returns index of the first and last kernel weight that fall in bounds when a kernel of odd size is centred on
+    each position along an axis of length pixels
+
+        Parameters:
+            length (int): Number of pixels along the axis
+            size (int): Number of weights in the kernel along the axis
+        Returns:
+            (tuple): (first, last) int arrays of length `length`
+    '''
+    index = np.arange(length)
+    center = size // 2
+    return np.maximum(center - index, 0), np.minimum(size - 1, center + length - 1 - index)
+
+def get_separable_factors(kernel):
+    '''
+    Returns column and row 1-D kernels whose outer product is kernel, or None if kernel is not separable
+
+    A kernel is separable when it has rank 1, which is detected from its singular values.
+    The factors are signed so that both sum to a positive value where possible.
+
+        Parameters:
+            kernel (numpy.ndarray): 2-D float kernel
+        Returns:
+            (tuple): (column, row) float arrays, or None
+    '''
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > SEPARABLE_TOLERANCE * s[0]):
+        return None
+    column = u[:, 0] * np.sqrt(s[0])
+    row = vt[0] * np.sqrt(s[0])
+    if column.sum() < 0:
+        column, row = -column, -row
+    return column, row
+
+def quantize_weights(weights, fraction_bits):
+    '''
+    Returns kernel weights scaled to sum to 2**fraction_bits and rounded to integers
+
+    Raises ValueError if the weights do not sum to a positive value.
+
+        Parameters:
+            weights (numpy.ndarray): Float kernel
+            fraction_bits (int): Number of fractional bits of the fixed-point weights
+        Returns:
+            (numpy.ndarray): int32 array of the shape of weights
+    '''
+    total = weights.sum()
+    if total <= 0:
+        raise ValueError('kernel weights must sum to a positive value')
+    return np.rint(weights / total * (1 << fraction_bits)).astype(np.int32)
+
+class QuantizedKernel:
+    '''
+    Fixed-point integer weights of a convolution kernel, quantized once per convolution and shared by its row bands.
+
+    Separable kernels are held as their 1-D column and row factors, other kernels as 2-D weights together with
+    their 2-D running sums, which give the sum of the in-bounds weights around each pixel.
+    Raises ValueError if the weights do not sum to a positive value, or could overflow the int32 accumulators.
+
+    ...
+
+    Attributes
+    ----------
+    shape : tuple
+        (height, width) of the kernel.
+    column : numpy.ndarray
+        int32 column factor of a separable kernel, or None.
+    row : numpy.ndarray
+        int32 row factor of a separable kernel, or None.
+    weights : numpy.ndarray
+        int32 2-D weights of a kernel that is not separable, or None.
+    sums : numpy.ndarray
+        int64 2-D running sums of weights, padded with a leading row and column of zeros, or None.
+    '''
+
+    def __init__(self, kernel):
+        self.shape = kernel.shape
+        self.column = self.row = self.weights = self.sums = None
+
+        factors = get_separable_factors(kernel)
+        if factors is not None and factors[1].sum() > 0:
+            self.column = quantize_weights(factors[0], SEPARABLE_FRACTION_BITS)
+            self.row = quantize_weights(factors[1], SEPARABLE_FRACTION_BITS)
+            if 255 * int(np.abs(self.column).sum()) * int(np.abs(self.row).sum()) >= MAX_TOTAL:
+                raise ValueError('kernel weights are out of range')
+            return
+
+        self.weights = quantize_weights(kernel, KERNEL_FRACTION_BITS)
+        if 255 * int(np.abs(self.weights).sum()) >= MAX_TOTAL:
+            raise ValueError('kernel weights are out of range')
+        self.sums = np.zeros((self.shape[0] + 1, self.shape[1] + 1), dtype=np.int64)
+        self.sums[1:, 1:] = self.weights.cumsum(axis=0).cumsum(axis=1)
+
+def add_shifted(total, values, weight, shift, axis):
+    '''
+    Adds weight times values shifted by shift positions along axis to total, for positions where the shifted
+    value is in bounds
+
+        Parameters:
+            total (numpy.ndarray): int32 accumulator
+            values (numpy.ndarray): int32 array of the shape of total along axis
+            weight (int): Kernel weight
+            shift (int): Offset of the kernel weight from the kernel centre
+            axis (int): Axis to shift along
+        Returns:
+            None
+    '''
+    length = values.shape[axis]
+    target = [slice(None)] * values.ndim
+    source = [slice(None)] * values.ndim
+    target[axis] = slice(max(-shift, 0), length - max(shift, 0))
+    source[axis] = slice(max(shift, 0), length + min(shift, 0))
+    total[tuple(target)] += weight * values[tuple(source)]
+
+def convolve_band(pixels, row_start, row_end, kernel, out=None):
+    '''
+    Returns rows [row_start, row_end) of pixels convolved with kernel, as a band of shape (row_end-row_start, width, bands)
+
+    The kernel is centred on each pixel and applied to each channel independently. As in the mean filter,
+    only in-bounds neighbors are used, and the result is divided by the sum of their weights rather than by the
+    sum of the whole kernel. Results are rounded to the nearest integer and clipped to 0-255.
+    Separable kernels are applied as a horizontal and a vertical 1-D pass, other kernels as one 2-D pass.
+    Weights are quantized to fixed-point integers by QuantizedKernel, so all accumulation is done in int32.
+    Only the kernel_height//2 halo rows above and below the band are read from pixels.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 source array of shape (height, width, bands)
+            row_start (int): First row of the band to filter
+            row_end (int): Row after the last row of the band to filter
+            kernel (QuantizedKernel): Quantized kernel of odd height and width
+            out (numpy.ndarray): Optional uint8 destination array for the band - allocated if None
+        Returns:
+            out (numpy.ndarray): uint8 array holding the convolved band
+    '''
+    height, width, num_bands = pixels.shape
+    num_rows = row_end - row_start
+    if out is None:
+        out = np.empty((num_rows, width, num_bands), dtype=np.uint8)
+    if num_rows <= 0:
+        return out
+
+    kernel_height, kernel_width = kernel.shape
+    halo = kernel_height // 2
+    halo_start = max(row_start - halo, 0)
+    halo_end = min(row_end + halo, height)
+    band = pixels[halo_start:halo_end].astype(np.int32)
+    totals = np.zeros((num_rows, width, num_bands), dtype=np.int32)
+
+    if kernel.weights is None:
+        column, row = kernel.column, kernel.row
+        sums = np.zeros_like(band)
+        for index, weight in enumerate(row):
+            if weight:
+                add_shifted(sums, band, int(weight), index - kernel_width // 2, axis=1)
+
+        for index, weight in enumerate(column):
+            shift = index - halo
+            first = max(row_start, -shift)
+            last = min(row_end, height - shift)
+            if weight and first < last:
+                totals[first - row_start:last - row_start] += int(weight) * sums[first + shift - halo_start:last + shift - halo_start]
+
+        divisors = (get_in_bounds_weights(height, column)[row_start:row_end, None, None] *
+                    get_in_bounds_weights(width, row)[None, :, None])
+    else:
+        weights = kernel.weights
+        for row_index in range(kernel_height):
+            shift = row_index - halo
+            first = max(row_start, -shift)
+            last = min(row_end, height - shift)
+            if first >= last:
+                continue
+            rows = band[first + shift - halo_start:last + shift - halo_start]
+            for col_index, weight in enumerate(weights[row_index]):
+                if weight:
+                    add_shifted(totals[first - row_start:last - row_start], rows, int(weight), col_index - kernel_width // 2, axis=1)
+
+        # Sums of the in-bounds weights, from 2-D running sums of the kernel
+        sums = kernel.sums
+        first_rows, last_rows = get_kernel_bounds(height, kernel_height)
+        first_cols, last_cols = get_kernel_bounds(width, kernel_width)
+        first_rows, last_rows = first_rows[row_start:row_end, None], last_rows[row_start:row_end, None] + 1
+        last_cols = last_cols + 1
+        divisors = (sums[last_rows, last_cols] - sums[first_rows, last_cols] -
+                    sums[last_rows, first_cols] + sums[first_rows, first_cols])[:, :, None]
+
+    if (divisors <= 0).any():
+        raise ValueError('kernel weights must sum to a positive value over the in-bounds neighbors of every pixel')
+    divisors = divisors.astype(np.int32)
+    np.clip(np.floor_divide(totals + divisors // 2, divisors), 0, 255, out=out, casting='unsafe')
+    return out
+
+def convolve_array(pixels, kernel, executor=None, parallelism=1, rotation=0, check=None, out=None):
+    '''
+    Returns copy of pixels convolved with kernel, optionally rotated by rotation quarter turns in the same pass
+
+    The kernel is quantized once, before any row band is filtered.
+    See convolve_band for how the convolution is computed, and filter_array for how row bands are filtered in parallel.
+    Raises ValueError if the weights of kernel are invalid, see QuantizedKernel.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            kernel (numpy.ndarray): 2-D float kernel of odd height and width
+            executor (concurrent.futures.Executor): Optional thread pool to filter row bands in
+            parallelism (int): Number of row bands to filter concurrently
+            rotation (int): Number of quarter turns to rotate the convolved image by
+            check (function): Optional function called before each row band, that can raise to stop convolving early
+            out (numpy.ndarray): Optional uint8 destination array of the rotated shape of pixels - allocated if None
+        Returns:
+            out (numpy.ndarray): uint8 convolved array, of the rotated shape of pixels
+    '''
+    return filter_array(functools.partial(convolve_band, kernel=QuantizedKernel(kernel)), pixels, executor, parallelism, rotation, check, out)
+
+def get_rotated_view(pixels, rotation):
+    '''
+    Returns strided numpy view of pixels rotated by rotation quarter turns, without copying pixel data
+
+    Rotation values match the ImageRotateRequest.Rotation enum, so 1 is NINETY_DEG, 2 is ONE_EIGHTY_DEG,
+    and 3 is TWO_SEVENTY_DEG. Values outside 0-3 are taken modulo 4.
+    Leading axes are kept, so a stack of images of shape (count, height, width, bands) is rotated image by image.
+
+        Parameters:
+            pixels (numpy.ndarray): Array of shape (..., height, width, bands)
+            rotation (int): Number of quarter turns to rotate by
+        Returns:
+            (numpy.ndarray): View of pixels with shape (..., width, height, bands) for odd rotations,
+                             or (..., height, width, bands) otherwise
+    '''
+    rotation = rotation % 4
+    if rotation == 1:
+        return pixels[..., ::-1, :, :].swapaxes(-3, -2)
+    elif rotation == 2:
+        return pixels[..., ::-1, ::-1, :]
+    elif rotation == 3:
+        return pixels[..., :, ::-1, :].swapaxes(-3, -2)
+    else:
+        return pixels
+
+def rotate_array(pixels, rotation, out=None, tile_size=64, check=None):
+    '''
+    Returns copy of pixels rotated by rotation quarter turns
+
+    ONE_EIGHTY_DEG rotations are copied straight from a reversed view of pixels.
+    NINETY_DEG and TWO_SEVENTY_DEG rotations are transposes, which are copied in square tiles of
+    tile_size pixels so that reads from the source rows stay in cache on large images.
+    If check is given, it is called before each band of tile_size output rows, and can raise to stop copying early.
+
+        Parameters:
+            pixels (numpy.ndarray): Array of shape (height, width, bands)
+            rotation (int): Number of quarter turns to rotate by, matching ImageRotateRequest.Rotation values
+            out (numpy.ndarray): Optional destination array of the rotated shape - allocated if None
+            tile_size (int): Side length in pixels of the tiles used for transposing copies
+            check (function): Optional function called with no arguments before each band of tile_size rows
+        Returns:
+            out (numpy.ndarray): Rotated array
+    '''
+    view = get_rotated_view(pixels, rotation)
+    if out is None:
+        out = np.empty(view.shape, dtype=pixels.dtype)
+
+    height, width = view.shape[0], view.shape[1]
+    if rotation % 2 == 0 and check is None:
+        np.copyto(out, view)
+    elif rotation % 2 == 0:
+        for row in range(0, height, tile_size):
+            check()
+            np.copyto(out[row:row + tile_size], view[row:row + tile_size])
+    else:
+        for row in range(0, height, tile_size):
+            if check is not None:
+                check()
+            for col in range(0, width, tile_size):
+                out[row:row + tile_size, col:col + tile_size] = view[row:row + tile_size, col:col + tile_size]
+    return out
+
+def rotate_rows(pixels, rotation, row_start, row_end, out=None):
+    '''
+    Returns rows [row_start, row_end) of pixels rotated by rotation quarter turns, without rotating the rest of pixels
+
+    Only the source columns (odd rotations) or rows (ONE_EIGHTY_DEG) that land in the requested output rows are read,
+    so an image can be rotated and sent one output band at a time.
+
+        Parameters:
+            pixels (numpy.ndarray): Source array of shape (height, width, bands)
+            rotation (int): Number of quarter turns to rotate by, matching ImageRotateRequest.Rotation values
+            row_start (int): First row of the rotated image to return
+            row_end (int): Row after the last row of the rotated image to return
+            out (numpy.ndarray): Optional destination array for the rows - allocated if None
+        Returns:
+            out (numpy.ndarray): Rows of the rotated image
+    '''
+    height, width = pixels.shape[0], pixels.shape[1]
+    rotation = rotation % 4
+    if rotation == 1:
+        source = pixels[:, row_start:row_end]
+    elif rotation == 2:
+        source = pixels[height - row_end:height - row_start]
+    elif rotation == 3:
+        source = pixels[:, width - row_end:width - row_start]
+    else:
+        source = pixels[row_start:row_end]
+    return rotate_array(source, rotation, out=out)
+
+def rotate_band_into(band, rotation, out, row_start, height):
+    '''
+    Writes rotated copy of a band of source rows into its position in the rotated output array
+
+    Used to rotate images that arrive in row bands, so each band can be placed as soon as it is received.
+
+        Parameters:
+            band (numpy.ndarray): Source rows [row_start, row_start+len(band)) of shape (rows, width, bands)
+            rotation (int): Number of quarter turns to rotate by, matching ImageRotateRequest.Rotation values
+            out (numpy.ndarray): Destination array of the rotated shape of the full source image
+            row_start (int): Index of the first row of band in the source image
+            height (int): Height in pixels of the full source image
+        Returns:
+            None
+    '''
+    rotation = rotation % 4
+    row_end = row_start + band.shape[0]
+    if rotation == 1:
+        rotate_array(band, rotation, out=out[:, height - row_end:height - row_start])
+    elif rotation == 2:
+        rotate_array(band, rotation, out=out[height - row_end:height - row_start])
+    elif rotation == 3:
+        rotate_array(band, rotation, out=out[:, row_start:row_end])
+    else:
+        out[row_start:row_end] = band
+
+def mean_filter_stack(stack, rotation=0, radius=1):
+    '''
+    Returns mean filtered copy of a stack of same-shape images, rotated by rotation quarter turns
+
+    Each image is filtered independently, with the same result as mean_filter_array, but the shifted sums of a
+    radius of 1, or running sums of larger radii, are computed along the rows and columns of the whole stack at once.
+
+        Parameters:
+            stack (numpy.ndarray): uint8 array of shape (count, height, width, bands)
+            rotation (int): Number of quarter turns to rotate the filtered images by
+            radius (int): Number of neighbors either side of each pixel to average over
+        Returns:
+            (numpy.ndarray): uint8 array holding the filtered images
+    '''
+    _, height, width, _ = stack.shape
+    if radius == 1:
+        # Horizontal sums of each pixel and its west/east neighbors, then vertical sums of those for each row
+        values = stack.astype(np.uint16)
+        sums = values.copy()
+        sums[:, :, 1:] += values[:, :, :-1]
+        sums[:, :, :-1] += values[:, :, 1:]
+        totals = sums.copy()
+        totals[:, 1:] += sums[:, :-1]
+        totals[:, :-1] += sums[:, 1:]
+    else:
+        totals = get_window_sums(get_window_sums(stack, radius, axis=2), radius, axis=1)
+    divisors = get_neighbor_counts(height, radius)[None, :, None, None] * get_neighbor_counts(width, radius)[None, None, :, None]
+    out = np.empty(stack.shape, dtype=np.uint8)
+    np.floor_divide(totals, divisors, out=out, casting='unsafe')
+    return np.ascontiguousarray(get_rotated_view(out, rotation))
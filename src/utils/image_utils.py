@@ -4,25 +4,31 @@ from PIL import Image
 
 import image_pb2
 
-def is_valid_image(image):
+# Default max gRPC message size in bytes, which caps the size of Image.data in unary requests
+MAX_IMAGE_SIZE = 4194304
+
+def is_valid_image(image, max_size=MAX_IMAGE_SIZE):
     '''
     Returns True if Image is valid, False otherwise
 
     Will return False if image data has length 0, if image height or width is non-positive,
-    or if image is greater than max size of 4194304 bytes
+    if image is greater than max_size bytes (4194304 by default), or if image data does not hold 1, 3, or 4 bytes per pixel
 
         Parameters:
             image (Image): Image object
+            max_size (int): Max size in bytes of image data
 
         Returns:
             (bool): True or False representing Image validity
     '''
     if len(image.data) <= 0:
         return False
-    elif len(image.data) > 4194304:
+    elif len(image.data) > max_size:
         return False
     elif image.width <= 0 or image.height <= 0:
         return False
+    elif len(image.data) not in [image.width * image.height * num_bands for num_bands in [1, 3, 4]]:
+        return False
     else:
         return True
 
@@ -48,7 +54,7 @@ def pil_image_to_image(img):
     color = False if len(img.getbands()) == 1 else True
     data = img.tobytes()
 
-    if len(data) <= 4194304:
+    if len(data) <= MAX_IMAGE_SIZE:
         return image_pb2.Image(color=color, data=data, width=width, height=height)
     else:
         sys.exit('Error: Image greater than max size of 4194304 bytes')
@@ -95,6 +101,7 @@ def save_image(image, output):
 
     Calls image_to_pil_image method on image to construct Pillow Image object
     Saves this Image at output file path
+    If Image holds an encoded file, the file is written to output as-is without re-encoding it
 
         Parameters:
             image (Image): gRPC Image object of image to save
@@ -102,6 +109,10 @@ def save_image(image, output):
         Returns:
             None
     '''
+    if image.encoding != image_pb2.Image.Encoding.RAW:
+        with open(output, 'wb') as file:
+            file.write(image.data)
+        return
     img = image_to_pil_image(image)
     img.save(output)
 
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+
+import image_pb2
+
+# Max height and width of a convolution kernel, matching the 31x31 neighbourhood of the largest mean filter
+MAX_KERNEL_SIZE = 31
+
+# Number of standard deviations either side of the centre covered by a gaussian kernel
+GAUSSIAN_EXTENT = 3
+
+SHARPEN_KERNEL = [
+    [0, -1, 0],
+    [-1, 5, -1],
+    [0, -1, 0],
+]
+
+def get_gaussian_kernel(sigma):
+    '''
+    Returns 2-D gaussian kernel with standard deviation sigma, covering GAUSSIAN_EXTENT standard deviations
+    either side of its centre
+
+    Raises ValueError if sigma is not a positive finite value, or the kernel would be larger than MAX_KERNEL_SIZE.
+
+        Parameters:
+            sigma (float): Standard deviation of the gaussian in pixels
+        Returns:
+            (numpy.ndarray): float kernel of odd height and width
+    '''
+    if not math.isfinite(sigma) or sigma <= 0:
+        raise ValueError('sigma is not valid')
+    radius = math.ceil(GAUSSIAN_EXTENT * sigma)
+    if 2 * radius + 1 > MAX_KERNEL_SIZE:
+        raise ValueError('sigma is too large')
+
+    weights = np.exp(-np.arange(-radius, radius + 1) ** 2 / (2 * sigma ** 2))
+    return np.outer(weights, weights)
+
+def get_kernel(kernel):
+    '''
+    Returns 2-D float kernel described by a Kernel message
+
+    Raises ValueError if the Kernel is invalid.
+
+        Parameters:
+            kernel (Kernel): gRPC Kernel object
+        Returns:
+            (numpy.ndarray): float kernel of odd height and width
+    '''
+    if kernel.type == image_pb2.Kernel.Type.GAUSSIAN:
+        return get_gaussian_kernel(kernel.sigma)
+    elif kernel.type == image_pb2.Kernel.Type.SHARPEN:
+        return np.array(SHARPEN_KERNEL, dtype=np.float64)
+    elif kernel.type != image_pb2.Kernel.Type.CUSTOM:
+        raise ValueError('kernel type is not valid')
+
+    for size in [kernel.width, kernel.height]:
+        if size < 1 or size > MAX_KERNEL_SIZE or size % 2 == 0:
+            raise ValueError('kernel size is not valid')
+    if len(kernel.weights) != kernel.width * kernel.height:
+        raise ValueError('kernel weights do not match kernel size')
+
+    weights = np.array(kernel.weights, dtype=np.float64).reshape(kernel.height, kernel.width)
+    if not np.isfinite(weights).all() or weights.sum() <= 0:
+        raise ValueError('kernel weights must sum to a positive value')
+    return weights
@@ -0,0 +1,142 @@
+import random
+import threading
+
+import utils.benchmark_utils as benchmark_utils
+
+# Percentiles reported for each operation
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Upper bound in seconds of the first latency histogram bucket - each following bucket doubles the bound
+FIRST_BUCKET_SECONDS = 0.0005
+
+def parse_mix(items):
+    '''
+    Returns list of (name, weight) tuples parsed from 'name=weight' strings
+
+    Items without a weight have weight 1. Raises ValueError if a weight is not a positive number.
+
+        Parameters:
+            items (list): List of 'name' or 'name=weight' strings
+        Returns:
+            mix (list): List of (name, weight) tuples
+    '''
+    mix = []
+    for item in items:
+        name, _, weight = item.partition('=')
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError('weight of ' + name + ' is not a number')
+        if weight <= 0:
+            raise ValueError('weight of ' + name + ' is not positive')
+        mix.append((name, weight))
+    return mix
+
+def get_arrival_offsets(rate, duration, arrivals='constant', seed=0):
+    '''
+    Returns send times of an open-loop load, in seconds from the start of the run
+
+    The send times are fixed before the run starts and do not depend on when responses arrive,
+    so a slow server cannot slow down the load it is offered.
+
+        Parameters:
+            rate (float): Mean number of requests per second
+            duration (float): Length of the run in seconds
+            arrivals (str): 'constant' for evenly spaced requests, or 'poisson' for exponential gaps between requests
+            seed (int): Seed of the poisson gaps
+        Returns:
+            offsets (list): Sorted list of send times in seconds
+    '''
+    if arrivals == 'constant':
+        return [index / rate for index in range(int(rate * duration))]
+
+    rng = random.Random(seed)
+    offsets = []
+    offset = rng.expovariate(rate)
+    while offset < duration:
+        offsets.append(offset)
+        offset += rng.expovariate(rate)
+    return offsets
+
+def get_histogram(latencies, first_bucket=FIRST_BUCKET_SECONDS):
+    '''
+    Returns latency histogram with buckets whose upper bounds double, from first_bucket up to the max latency
+
+        Parameters:
+            latencies (list): List of latencies in seconds
+            first_bucket (float): Upper bound in seconds of the first bucket
+        Returns:
+            buckets (list): List of (upper bound, count) tuples, where count is the number of latencies above the
+                            previous bound and up to this one
+    '''
+    if not latencies:
+        return []
+    bounds = [first_bucket]
+    while bounds[-1] < max(latencies):
+        bounds.append(bounds[-1] * 2)
+
+    counts = [0] * len(bounds)
+    for latency in latencies:
+        index = 0
+        while latency > bounds[index]:
+            index += 1
+        counts[index] += 1
+    return list(zip(bounds, counts))
+
+def summarize(latencies):
+    '''
+    Returns dictionary of count, PERCENTILES, and max of a list of latencies in seconds
+
+    Percentiles are None if latencies is empty.
+    '''
+    summary = {'count': len(latencies), 'max': max(latencies) if latencies else None}
+    for percent in PERCENTILES:
+        summary['p' + str(percent)] = benchmark_utils.get_percentile(latencies, percent) if latencies else None
+    return summary
+
+class LatencyRecorder:
+    '''
+    Thread-safe record of the latency and outcome of each request of a load test, grouped by operation.
+
+    ...
+
+    Attributes
+    ----------
+    latencies : dict
+        Latencies in seconds of successful requests, keyed by operation name.
+    errors : dict
+        Number of failed requests, keyed by (operation name, status code name).
+
+    Methods
+    -------
+    record(operation, latency):
+        Records a successful request.
+    record_error(operation, code):
+        Records a failed request.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, operation, latency):
+        '''
+        Records latency in seconds of a successful request of operation.
+        '''
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(latency)
+
+    def record_error(self, operation, code):
+        '''
+        Records a request of operation that failed with the named status code.
+        '''
+        with self.lock:
+            self.errors[(operation, code)] = self.errors.get((operation, code), 0) + 1
+
+    def get_all_latencies(self):
+        '''
+        Returns latencies of successful requests of every operation, in one list.
+        '''
+        with self.lock:
+            return [latency for latencies in self.latencies.values() for latency in latencies]
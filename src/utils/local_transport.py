@@ -0,0 +1,331 @@
+import time
+import secrets
+import logging
+import threading
+import contextlib
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+import image_pb2
+
+# Prefix of the names of shared memory segments holding Image data, so the server only opens segments made for it
+SEGMENT_PREFIX = 'imgsvc-'
+
+# Default seconds a client has to open a response segment before the server unlinks it
+LEASE_SECONDS = 30.0
+
+# Seconds between passes of the reaper that unlinks response segments whose lease has expired
+REAP_INTERVAL = 1.0
+
+def is_shared(image):
+    '''
+    Returns True if Image refers to a shared memory segment instead of holding its data
+    '''
+    return image.HasField('shared_memory')
+
+def get_peer(context):
+    '''
+    Returns peer address of the request of a grpc context, or None if there is no context
+    '''
+    return context.peer() if context is not None else None
+
+def is_local_peer(peer):
+    '''
+    Returns True if a request with peer address peer was received over a Unix domain socket
+    '''
+    return peer is not None and peer.startswith('unix:')
+
+# Names of the segments created by this process that it has not unlinked yet, which stay registered with its
+# resource tracker so they are unlinked if it dies
+owned = set()
+
+def make_segment_name():
+    '''
+    Returns a new unguessable segment name starting with SEGMENT_PREFIX
+    '''
+    return SEGMENT_PREFIX + secrets.token_hex(16)
+
+def create_segment(size):
+    '''
+    Returns a new SharedMemory segment of size bytes, owned by this process until it unlinks it with unlink_segment
+    '''
+    segment = shared_memory.SharedMemory(name=make_segment_name(), create=True, size=size)
+    owned.add(segment.name)
+    return segment
+
+def unlink_segment(segment, attached=False):
+    '''
+    Unlinks a SharedMemory segment created by this process, or attached by it if attached is True, and unregisters
+    it from the resource tracker of this process.
+
+    Returns False if the segment had already been unlinked, by this or another process.
+    '''
+    was_owned = segment.name in owned
+    owned.discard(segment.name)
+    try:
+        segment.unlink()
+        return True
+    except FileNotFoundError:
+        if was_owned or attached:
+            resource_tracker.unregister('/' + segment.name, 'shared_memory')
+        return False
+
+def attach_segment(name, size):
+    '''
+    Returns SharedMemory attached to the segment called name, holding at least size bytes.
+
+    Attaching registers the segment with the resource tracker of this process, which would unlink it when this
+    process exits, so segments owned by another process must be detached with detach_segment.
+    Raises ValueError if name does not start with SEGMENT_PREFIX, the segment cannot be opened, or it is smaller
+    than size bytes.
+    '''
+    if not name.startswith(SEGMENT_PREFIX) or '/' in name:
+        raise ValueError('shared memory segment name is not valid')
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except OSError:
+        raise ValueError('shared memory segment ' + name + ' cannot be opened')
+    if size <= 0 or size > segment.size:
+        detach_segment(segment)
+        raise ValueError('shared memory segment size is not valid')
+    return segment
+
+def detach_segment(segment, *views):
+    '''
+    Closes a segment attached with attach_segment without unlinking it, and unregisters it from the resource tracker
+    of this process unless this process owns it. See close for views.
+    '''
+    close(segment, *views)
+    if segment.name not in owned:
+        resource_tracker.unregister('/' + segment.name, 'shared_memory')
+
+def close(segment, *views):
+    '''
+    Releases memoryviews of a SharedMemory segment, and closes it.
+
+    If numpy arrays still use the views or the segment, for example while a micro-batch they were stacked into
+    finishes, the segment stays mapped until the last of them is garbage collected.
+    '''
+    try:
+        for view in views:
+            view.release()
+        segment.close()
+    except BufferError:
+        pass
+
+class SharedImage:
+    '''
+    Read-only view of a request Image whose data is held in a shared memory segment.
+
+    Holds the fields of Image that request handling reads, with data a memoryview of the segment,
+    so it can be processed in place of the Image without copying its data, and the SegmentStore that its
+    result may be computed straight into, or None.
+    '''
+
+    def __init__(self, image, data, store=None):
+        self.color = image.color
+        self.data = data
+        self.width = image.width
+        self.height = image.height
+        self.encoding = image.encoding
+        self.response_encoding = image.response_encoding
+        self.response_quality = image.response_quality
+        self.store = store
+
+@contextlib.contextmanager
+def open_image(image, store=None):
+    '''
+    Context manager that attaches the segment a request Image refers to, and yields a SharedImage of a read-only
+    view of its data.
+
+    The segment stays owned by the client, so it is never unlinked by this process.
+    Raises ValueError if the segment cannot be attached, see attach_segment.
+
+        Parameters:
+            image (Image): gRPC Image object of the request, with shared_memory set
+            store (SegmentStore): Optional store that the result may be computed straight into a segment of
+        Yields:
+            (SharedImage): View of the data of Image in the segment
+    '''
+    segment = attach_segment(image.shared_memory.name, image.shared_memory.size)
+    view = segment.buf[:image.shared_memory.size]
+    data = view.toreadonly()
+    try:
+        yield SharedImage(image, data, store)
+    finally:
+        detach_segment(segment, data, view)
+
+@contextlib.contextmanager
+def share_image(image):
+    '''
+    Context manager that copies the data of Image into a new segment, and yields a copy of Image that refers to it.
+
+    The segment is unlinked when the block exits, or by the resource tracker of this process if it dies first.
+
+        Parameters:
+            image (Image): gRPC Image object holding its data
+        Yields:
+            (Image): Image object referring to the segment instead of holding its data
+    '''
+    size = len(image.data)
+    segment = create_segment(size)
+    try:
+        segment.buf[:size] = image.data
+        shared = image_pb2.Image()
+        shared.CopyFrom(image)
+        shared.ClearField('data')
+        shared.shared_memory.name = segment.name
+        shared.shared_memory.size = size
+        yield shared
+    finally:
+        close(segment)
+        unlink_segment(segment)
+
+def read_image(image):
+    '''
+    Returns Image holding the data of the segment a response Image refers to, and unlinks the segment.
+
+    Response Images that hold their data are returned as they are.
+    Raises ValueError if the segment cannot be read, for example because the server unlinked it when its lease expired.
+    '''
+    if not is_shared(image):
+        return image
+
+    segment = attach_segment(image.shared_memory.name, image.shared_memory.size)
+    try:
+        data = bytes(segment.buf[:image.shared_memory.size])
+    finally:
+        close(segment)
+    unlink_segment(segment, attached=True)
+    return image_pb2.Image(color=image.color, data=data, width=image.width, height=image.height, encoding=image.encoding)
+
+class SegmentStore:
+    '''
+    Shared memory segments created by the server to hold the responses of requests that referred to shared memory,
+    each leased to its client for lease_seconds.
+
+    Clients unlink a response segment as soon as they have read it. A reaper thread unlinks segments whose lease has
+    expired, so segments of clients that died or never read their response do not leak, and segments still there
+    when the server exits are unlinked by close(), or by the resource tracker of the server if it dies.
+
+    ...
+
+    Attributes
+    ----------
+    lease_seconds : float
+        Seconds a client has to open a response segment before it is unlinked.
+    metrics : ServerMetrics
+        Optional metrics that leased and reclaimed segments are recorded in.
+
+    Methods
+    -------
+    share(image):
+        Copies the data of a result Image into a new leased segment, and returns an Image that refers to it.
+    compute(shape, color, function):
+        Computes a result straight into a new leased segment, and returns an Image that refers to it.
+    reap(now=None):
+        Unlinks segments whose lease has expired.
+    start():
+        Starts the reaper thread.
+    close():
+        Stops the reaper thread, and unlinks every leased segment.
+    '''
+
+    def __init__(self, lease_seconds=LEASE_SECONDS, metrics=None):
+        self.lease_seconds = lease_seconds
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.leases = {}
+        self.stopped = threading.Event()
+
+    def lease(self, segment):
+        '''
+        Leases a closed segment to the client for lease_seconds.
+        '''
+        with self.lock:
+            self.leases[segment.name] = (segment, time.monotonic() + self.lease_seconds)
+        if self.metrics is not None:
+            self.metrics.shared_segments.inc()
+
+    def share(self, image):
+        '''
+        Copies the data of a result Image into a new segment leased to the client, and returns an Image referring to it.
+        '''
+        size = len(image.data)
+        segment = create_segment(size)
+        segment.buf[:size] = image.data
+        close(segment)
+        self.lease(segment)
+
+        return image_pb2.Image(color=image.color, width=image.width, height=image.height, encoding=image.encoding,
+                               shared_memory=image_pb2.SharedMemory(name=segment.name, size=size))
+
+    def compute(self, shape, color, function):
+        '''
+        Creates a new segment for a raw result of shape (height, width, bands), calls function with a uint8 ndarray
+        backed by the segment to compute the result into, and returns an Image referring to the segment, leased to
+        the client.
+
+        The result is written straight into the response, without being copied. If function raises, the segment
+        is unlinked and the exception is raised.
+        '''
+        size = shape[0] * shape[1] * shape[2]
+        segment = create_segment(size)
+        try:
+            function(np.ndarray(shape, dtype=np.uint8, buffer=segment.buf))
+        except BaseException:
+            close(segment)
+            unlink_segment(segment)
+            raise
+        close(segment)
+        self.lease(segment)
+
+        return image_pb2.Image(color=color, width=shape[1], height=shape[0],
+                               shared_memory=image_pb2.SharedMemory(name=segment.name, size=size))
+
+    def remove(self, segments):
+        '''
+        Unlinks segments whose leases have been removed, and records those the client had not unlinked as reclaimed.
+        '''
+        for segment in segments:
+            close(segment)
+            reclaimed = unlink_segment(segment)
+            if self.metrics is not None:
+                self.metrics.shared_segments.dec()
+                if reclaimed:
+                    self.metrics.shared_segments_reclaimed.inc()
+
+    def reap(self, now=None):
+        '''
+        Unlinks segments whose lease expired before now, which defaults to the current time.
+        '''
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            expired = [name for name, (_, expires) in self.leases.items() if expires <= now]
+            segments = [self.leases.pop(name)[0] for name in expired]
+        self.remove(segments)
+
+    def start(self):
+        '''
+        Starts a daemon thread that reaps expired segments every REAP_INTERVAL seconds until close() is called.
+        '''
+
+        def run():
+            while not self.stopped.wait(REAP_INTERVAL):
+                try:
+                    self.reap()
+                except Exception:
+                    logging.exception('Failed to reap shared memory segments')
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        '''
+        Stops the reaper thread, and unlinks every leased segment.
+        '''
+        self.stopped.set()
+        with self.lock:
+            segments = [segment for segment, _ in self.leases.values()]
+            self.leases.clear()
+        self.remove(segments)
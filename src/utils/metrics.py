@@ -0,0 +1,367 @@
+import time
+import bisect
+import threading
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default upper bounds in seconds of latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of micro-batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+def format_labels(label_names, label_values):
+    '''
+    Returns Prometheus text format label set, e.g. {method="MeanFilter",code="OK"}, or '' if there are no labels
+    '''
+    if not label_names:
+        return ''
+    escaped = [str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in label_values]
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in zip(label_names, escaped)) + '}'
+
+class Counter:
+    '''
+    Thread-safe monotonically increasing count, with one value per combination of label values.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+        Metric name.
+    help : str
+        Description of the metric.
+    label_names : tuple
+        Names of the labels of the metric.
+
+    Methods
+    -------
+    inc(*label_values, amount=1):
+        Increases the value of the given label values by amount.
+    get_values():
+        Returns a copy of the values of every combination of label values.
+    add_values(values):
+        Adds values returned by get_values of another copy of the metric.
+    render():
+        Returns the metric in Prometheus text format.
+    '''
+
+    type = 'counter'
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        '''
+        Increases the value of the given label values by amount.
+        '''
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        '''
+        Returns the value of the given label values.
+        '''
+        with self.lock:
+            return self.values.get(label_values, 0)
+
+    def get_values(self):
+        '''
+        Returns a copy of the values of every combination of label values, keyed by label values.
+        '''
+        with self.lock:
+            return dict(self.values)
+
+    def add_values(self, values):
+        '''
+        Adds values returned by get_values of another copy of the metric, such as one in another process.
+        '''
+        with self.lock:
+            for label_values, value in values.items():
+                self.values[label_values] = self.values.get(label_values, 0) + value
+
+    def get_samples(self):
+        '''
+        Returns list of (suffix, label names, label values, value) tuples of the metric.
+        '''
+        with self.lock:
+            return [('', self.label_names, labels, value) for labels, value in sorted(self.values.items())]
+
+    def render(self):
+        '''
+        Returns the metric in Prometheus text format, as a list of lines.
+        '''
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        for suffix, label_names, label_values, value in self.get_samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, format_labels(label_names, label_values), value))
+        return lines
+
+class Gauge(Counter):
+    '''
+    Thread-safe value that can go up and down, with one value per combination of label values.
+
+    See Counter for attributes. Adds dec(*label_values, amount=1), which decreases the value by amount.
+    '''
+
+    type = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        '''
+        Decreases the value of the given label values by amount.
+        '''
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(Counter):
+    '''
+    Thread-safe distribution of observed values in cumulative buckets, with one distribution per combination of label values.
+
+    See Counter for attributes. Adds buckets, the upper bounds of the buckets, and observe(value, *label_values),
+    which records one value.
+    '''
+
+    type = 'histogram'
+
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        '''
+        Records one value for the given label values, in the first bucket whose upper bound is at least value.
+        '''
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def get_values(self):
+        '''
+        Returns a copy of the bucket counts and sum of every combination of label values, keyed by label values.
+        '''
+        with self.lock:
+            return {label_values: list(counts) for label_values, counts in self.values.items()}
+
+    def add_values(self, values):
+        '''
+        Adds bucket counts and sums returned by get_values of another copy of the histogram with the same buckets.
+        '''
+        with self.lock:
+            for label_values, counts in values.items():
+                totals = self.values.get(label_values)
+                if totals is None:
+                    self.values[label_values] = list(counts)
+                else:
+                    self.values[label_values] = [total + count for total, count in zip(totals, counts)]
+
+    def get_count(self, *label_values):
+        '''
+        Returns the number of values recorded for the given label values.
+        '''
+        with self.lock:
+            counts = self.values.get(label_values)
+            return sum(counts[:-1]) if counts is not None else 0
+
+    def get_samples(self):
+        '''
+        Returns list of (suffix, label names, label values, value) tuples of the cumulative buckets, sum, and count.
+        '''
+        with self.lock:
+            values = [(labels, list(counts)) for labels, counts in sorted(self.values.items())]
+
+        samples = []
+        bucket_names = self.label_names + ('le',)
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts[:-1]):
+                total += count
+                samples.append(('_bucket', bucket_names, labels + (bound,), total))
+            samples.append(('_sum', self.label_names, labels, counts[-1]))
+            samples.append(('_count', self.label_names, labels, total))
+        return samples
+
+class ServerMetrics:
+    '''
+    Metrics of an ImageService server, rendered in Prometheus text format.
+
+    RPC metrics are recorded by the interceptors in interceptors.py, stage timings by ImageServiceServicer,
+    queue metrics by InstrumentedThreadPoolExecutor, and scheduler metrics by PriorityScheduler.
+    Each observation takes one lock and one bisect, so the metrics can be left enabled in production.
+
+    ...
+
+    Attributes
+    ----------
+    rpc_duration : Histogram
+        Latency in seconds of each RPC, by method.
+    rpcs : Counter
+        Number of completed RPCs, by method and status code.
+    in_flight : Gauge
+        Number of RPCs being handled, by method.
+    received_bytes : Counter
+        Serialized size of request messages, by method.
+    sent_bytes : Counter
+        Serialized size of response messages, by method.
+    stage_duration : Histogram
+        Time in seconds spent in each stage of request handling, by stage.
+    queue_depth : Gauge
+        Number of tasks waiting for a thread in instrumented executors.
+    admission_bytes : Gauge
+        Bytes of the memory budget held by admitted requests.
+    admission_waiting : Gauge
+        Number of requests waiting for memory.
+    admission_rejections : Counter
+        Number of requests rejected by admission control, by reason.
+    scheduler_queued : Gauge
+        Number of requests waiting for a compute slot, by priority class.
+    scheduler_wait : Histogram
+        Time in seconds requests waited for a compute slot, by priority class.
+    micro_batch_size : Histogram
+        Number of requests in each micro-batch.
+    worker_restarts : Counter
+        Number of worker processes restarted by the prefork supervisor.
+    shared_segments : Gauge
+        Number of shared memory segments holding responses leased to local clients.
+    shared_segments_reclaimed : Counter
+        Number of leased shared memory segments unlinked by the server because the client had not unlinked them.
+
+    Methods
+    -------
+    observe_stage(stage, seconds):
+        Records time spent in a stage of request handling.
+    get_snapshot():
+        Returns a copy of the values of all metrics, that can be sent to another process.
+    add_snapshot(snapshot):
+        Adds the values of a snapshot of another ServerMetrics.
+    render():
+        Returns all metrics in Prometheus text format.
+    '''
+
+    def __init__(self):
+        self.rpc_duration = Histogram('image_service_rpc_duration_seconds', 'Latency of ImageService RPCs.', ['method'])
+        self.rpcs = Counter('image_service_rpcs_total', 'Completed ImageService RPCs by status code.', ['method', 'code'])
+        self.in_flight = Gauge('image_service_rpcs_in_flight', 'ImageService RPCs being handled.', ['method'])
+        self.received_bytes = Counter('image_service_received_bytes_total', 'Serialized size of request messages.', ['method'])
+        self.sent_bytes = Counter('image_service_sent_bytes_total', 'Serialized size of response messages.', ['method'])
+        self.stage_duration = Histogram('image_service_stage_duration_seconds', 'Time spent in each stage of request handling.', ['stage'])
+        self.queue_depth = Gauge('image_service_queue_depth', 'Tasks waiting for a thread in the request executor.')
+        self.admission_bytes = Gauge('image_service_admission_bytes', 'Bytes of the memory budget held by admitted requests.')
+        self.admission_waiting = Gauge('image_service_admission_waiting', 'Requests waiting for memory.')
+        self.admission_rejections = Counter('image_service_admission_rejections_total', 'Requests rejected by admission control.', ['reason'])
+        self.scheduler_queued = Gauge('image_service_scheduler_queued', 'Requests waiting for a compute slot.', ['priority'])
+        self.scheduler_wait = Histogram('image_service_scheduler_wait_seconds', 'Time requests waited for a compute slot.', ['priority'])
+        self.micro_batch_size = Histogram('image_service_micro_batch_size', 'Requests run together in each micro-batch.', buckets=BATCH_SIZE_BUCKETS)
+        self.worker_restarts = Counter('image_service_worker_restarts_total', 'Worker processes restarted after exiting.')
+        self.shared_segments = Gauge('image_service_shared_memory_segments', 'Shared memory segments holding responses leased to local clients.')
+        self.shared_segments_reclaimed = Counter('image_service_shared_memory_reclaimed_total',
+                                                 'Leased shared memory segments unlinked by the server after their lease expired.')
+        self.metrics = [self.rpc_duration, self.rpcs, self.in_flight, self.received_bytes, self.sent_bytes,
+                        self.stage_duration, self.queue_depth, self.admission_bytes, self.admission_waiting,
+                        self.admission_rejections, self.scheduler_queued, self.scheduler_wait,
+                        self.micro_batch_size, self.worker_restarts, self.shared_segments, self.shared_segments_reclaimed]
+
+    def observe_stage(self, stage, seconds):
+        '''
+        Records seconds spent in a stage of request handling.
+        '''
+        self.stage_duration.observe(seconds, stage)
+
+    def get_snapshot(self):
+        '''
+        Returns a copy of the values of all metrics keyed by metric name, which can be pickled and sent to another process.
+        '''
+        return {metric.name: metric.get_values() for metric in self.metrics}
+
+    def add_snapshot(self, snapshot):
+        '''
+        Adds the values of a snapshot returned by get_snapshot of another ServerMetrics, such as one in a worker process.
+        Counts, sums, and gauges are added together, so in-flight and queue gauges give the total of all processes.
+        '''
+        for metric in self.metrics:
+            metric.add_values(snapshot.get(metric.name, {}))
+
+    def render(self):
+        '''
+        Returns all metrics in Prometheus text format.
+
+            Parameters:
+                None
+            Returns:
+                (str): Metrics in Prometheus text exposition format
+        '''
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+class InstrumentedThreadPoolExecutor(futures.ThreadPoolExecutor):
+    '''
+    ThreadPoolExecutor that records the number of tasks waiting for a thread, and the time each task waited,
+    as the 'queue' stage of a ServerMetrics.
+    '''
+
+    def __init__(self, metrics, max_workers=None):
+        super().__init__(max_workers=max_workers)
+        self.metrics = metrics
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+        Schedules fn(*args, **kwargs) to run in a worker thread, and returns a Future of its result.
+        '''
+        submitted = time.perf_counter()
+        started = False
+
+        def run():
+            nonlocal started
+            started = True
+            self.metrics.queue_depth.dec()
+            self.metrics.observe_stage('queue', time.perf_counter() - submitted)
+            return fn(*args, **kwargs)
+
+        def on_done(future):
+            if not started:
+                self.metrics.queue_depth.dec()
+
+        self.metrics.queue_depth.inc()
+        future = super().submit(run)
+        future.add_done_callback(on_done)
+        return future
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP request handler that serves the metrics of the server's ServerMetrics at /metrics.
+    '''
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(metrics, host, port):
+    '''
+    Starts an HTTP server on a daemon thread that serves metrics in Prometheus text format at /metrics.
+
+        Parameters:
+            metrics (ServerMetrics): Metrics to serve, or any object with a render() method such as prefork.Supervisor
+            host (str): Host name to listen on
+            port (int): Port to listen on, or 0 to pick a free port
+        Returns:
+            server (ThreadingHTTPServer): Running HTTP server - call shutdown() to stop it
+    '''
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
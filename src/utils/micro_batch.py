@@ -0,0 +1,129 @@
+import time
+import threading
+
+import numpy as np
+
+import utils.pipeline as pipeline
+
+# Default max number of requests stacked into one batch
+DEFAULT_MAX_BATCH = 16
+
+# Default max seconds the first request of a batch waits for more requests to join it
+DEFAULT_MAX_WAIT = 0.002
+
+# Default max number of pixels of an image for its request to be batched, 64x64 icons
+DEFAULT_MAX_PIXELS = 4096
+
+class Batch:
+    '''
+    Requests with the same image shape and stages that are run together, and their results.
+    '''
+
+    def __init__(self):
+        self.images = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+class MicroBatcher:
+    '''
+    Collects concurrent small requests with the same image shape and planned stages, and runs them as one stack,
+    so their per-request numpy overhead is paid once per batch.
+
+    The first request for a shape and stages becomes the leader of a batch. It waits up to max_wait seconds,
+    or until max_batch requests have joined, then stacks the images, runs the stages over the stack on its own thread,
+    and hands each waiting request its slice of the result. No extra threads are used, and a request waits at most
+    max_wait seconds plus the time of one batch, which bounds the latency added to the requests that are batched.
+    Only images of at most max_pixels pixels, and stages that pipeline.can_stack runs, are batched.
+
+    ...
+
+    Attributes
+    ----------
+    max_batch : int
+        Max number of requests in a batch.
+    max_wait : float
+        Max seconds the leader of a batch waits for more requests.
+    max_pixels : int
+        Max number of pixels of an image for its request to be batched.
+    batches : int
+        Number of batches run.
+    batched : int
+        Number of requests run in batches.
+
+    Methods
+    -------
+    accepts(pixels, stages):
+        Returns True if a request can be batched.
+    run(pixels, stages):
+        Returns the result of running stages on pixels, as part of a batch.
+    '''
+
+    def __init__(self, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT, max_pixels=DEFAULT_MAX_PIXELS, metrics=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pixels = max_pixels
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.batches = 0
+        self.batched = 0
+
+    def accepts(self, pixels, stages):
+        '''
+        Returns True if running stages on pixels, an array of shape (height, width, bands), can be batched.
+        '''
+        return pixels.shape[0] * pixels.shape[1] <= self.max_pixels and pipeline.can_stack(stages)
+
+    def run(self, pixels, stages):
+        '''
+        Returns the result of running planned stages on pixels, computed in a batch with concurrent requests
+        with the same shape and stages.
+
+        Exceptions raised while running the batch are raised in every request of the batch.
+        The time the leader waits for the batch to fill is recorded in metrics as the micro_batch stage,
+        and the number of requests of each batch in the micro_batch_size histogram.
+
+            Parameters:
+                pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+                stages (list): List of (type, rotation, parameter) tuples, as returned by pipeline.plan_operations
+            Returns:
+                (numpy.ndarray): uint8 array holding the processed image
+        '''
+        key = (pixels.shape, tuple(stages))
+        with self.lock:
+            batch = self.pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = self.pending[key] = Batch()
+            index = len(batch.images)
+            batch.images.append(pixels)
+            if len(batch.images) >= self.max_batch:
+                del self.pending[key]
+                batch.full.set()
+
+        if is_leader:
+            started = time.perf_counter()
+            batch.full.wait(self.max_wait)
+            with self.lock:
+                if self.pending.get(key) is batch:
+                    del self.pending[key]
+                self.batches += 1
+                self.batched += len(batch.images)
+            if self.metrics is not None:
+                self.metrics.observe_stage('micro_batch', time.perf_counter() - started)
+                self.metrics.micro_batch_size.observe(len(batch.images))
+
+            try:
+                batch.results = pipeline.run_stack_stages(np.stack(batch.images), stages)
+            except BaseException as ex:
+                batch.error = ex
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
@@ -0,0 +1,136 @@
+import numpy as np
+
+import image_pb2
+import utils.image_ops as image_ops
+import utils.kernels as kernels
+
+# Max radius of a mean filter, giving a 31x31 neighbourhood
+MAX_RADIUS = 15
+
+def plan_operations(operations):
+    '''
+    Returns list of fused stages that apply operations in order
+
+    Each stage is a tuple (type, rotation, parameter), where type is an Operation.Type, rotation is the number of
+    quarter turns to rotate the output of that stage by in the same pass, and parameter is the radius of a mean filter
+    stage, the kernel of a convolution stage as a tuple of rows of weights, or 0 for rotation stages.
+    An Operation radius of 0 is the default radius of 1.
+    Consecutive rotations are collapsed into a single rotation. The mean filter averages a symmetric neighbourhood,
+    so it gives the same result before or after a quarter turn, and pending rotations are moved past it and
+    fused into the last filter stage. Convolving a rotated image gives the rotated result of convolving the
+    image with the kernel rotated back, so pending rotations are also moved past convolutions by rotating their kernel.
+    A stage of type ROTATE is only planned when there is no filter to fuse the rotation into,
+    and rotations that add up to a full turn are dropped.
+    Raises ValueError if any Operation is invalid.
+
+        Parameters:
+            operations (list): List of Operation objects in the order they are to be applied
+        Returns:
+            stages (list): List of (type, rotation, parameter) tuples in the order they are to be run
+    '''
+    stages = []
+    rotation = 0
+
+    for operation in operations:
+        if operation.type == image_pb2.Operation.Type.ROTATE:
+            if operation.rotation not in image_pb2.ImageRotateRequest.Rotation.values():
+                raise ValueError('rotation string is not valid')
+            rotation = (rotation + operation.rotation) % 4
+        elif operation.type == image_pb2.Operation.Type.MEAN_FILTER:
+            if operation.radius < 0 or operation.radius > MAX_RADIUS:
+                raise ValueError('radius is not valid')
+            stages.append((image_pb2.Operation.Type.MEAN_FILTER, 0, operation.radius or 1))
+        elif operation.type == image_pb2.Operation.Type.CONVOLVE:
+            kernel = np.rot90(kernels.get_kernel(operation.kernel), rotation)
+            stages.append((image_pb2.Operation.Type.CONVOLVE, 0, tuple(map(tuple, kernel.tolist()))))
+        else:
+            raise ValueError('operation type is not valid')
+
+    if rotation:
+        if stages:
+            stages[-1] = (stages[-1][0], rotation, stages[-1][2])
+        else:
+            stages.append((image_pb2.Operation.Type.ROTATE, rotation, 0))
+
+    return stages
+
+def get_output_shape(shape, stages):
+    '''
+    Returns shape of the array produced by running stages on an array of shape
+
+        Parameters:
+            shape (tuple): Shape (height, width, bands) of the input array
+            stages (list): List of (type, rotation, parameter) tuples, as returned by plan_operations
+        Returns:
+            (tuple): Shape (height, width, bands) of the output array
+    '''
+    height, width, num_bands = shape
+    if sum(rotation for _, rotation, _ in stages) % 2:
+        height, width = width, height
+    return (height, width, num_bands)
+
+def run_stages(pixels, stages, executor=None, parallelism=1, check=None, out=None):
+    '''
+    Runs planned stages on pixels in order, and returns the resulting array
+
+    Mean filter and convolution stages write their rotation straight to the output of the filter pass.
+    If an executor is given, filter stages are split into parallelism row bands filtered in the executor.
+    If out is given, the last stage writes its output straight into it.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            stages (list): List of (type, rotation, parameter) tuples, as returned by plan_operations
+            executor (concurrent.futures.Executor): Optional thread pool to filter row bands in
+            parallelism (int): Number of row bands to filter concurrently
+            check (function): Optional function called before each row band of each stage, that can raise to stop early
+            out (numpy.ndarray): Optional uint8 destination array of the shape given by get_output_shape
+        Returns:
+            pixels (numpy.ndarray): uint8 array holding the processed image
+    '''
+    for index, (operation_type, rotation, parameter) in enumerate(stages):
+        stage_out = out if index == len(stages) - 1 else None
+        if operation_type == image_pb2.Operation.Type.MEAN_FILTER:
+            pixels = image_ops.mean_filter_array(pixels, executor, parallelism, rotation, parameter, check, stage_out)
+        elif operation_type == image_pb2.Operation.Type.CONVOLVE:
+            pixels = image_ops.convolve_array(pixels, np.array(parameter), executor, parallelism, rotation, check, stage_out)
+        else:
+            pixels = image_ops.rotate_array(pixels, rotation, stage_out, check=check)
+    return pixels
+
+# Stage types that run_stack_stages can run on a stack of images
+STACK_STAGE_TYPES = (image_pb2.Operation.Type.ROTATE, image_pb2.Operation.Type.MEAN_FILTER)
+
+# Max number of values in each sub-stack that run_stack_stages runs at a time, so the intermediate sums stay in cache
+STACK_CHUNK_VALUES = 65536
+
+def can_stack(stages):
+    '''
+    Returns True if every planned stage can be run on a stack of images by run_stack_stages
+    '''
+    return all(operation_type in STACK_STAGE_TYPES for operation_type, _, _ in stages)
+
+def run_stack_stages(stack, stages):
+    '''
+    Runs planned stages on each image of a stack of same-shape images, and returns the resulting stack
+
+    Each stage is run over a sub-stack of up to STACK_CHUNK_VALUES values with one set of numpy calls, so small images
+    share the per-call overhead that dominates their processing time. Rotations are copied straight into the output. Only the stage types in STACK_STAGE_TYPES are
+    supported, see can_stack.
+
+        Parameters:
+            stack (numpy.ndarray): uint8 array of shape (count, height, width, bands)
+            stages (list): List of (type, rotation, parameter) tuples, as returned by plan_operations
+        Returns:
+            out (numpy.ndarray): uint8 array holding the processed images
+    '''
+    out = np.empty((len(stack),) + get_output_shape(stack.shape[1:], stages), dtype=np.uint8)
+    chunk = max(STACK_CHUNK_VALUES // stack[0].size, 1)
+    for start in range(0, len(stack), chunk):
+        pixels = stack[start:start + chunk]
+        for operation_type, rotation, parameter in stages:
+            if operation_type == image_pb2.Operation.Type.MEAN_FILTER:
+                pixels = image_ops.mean_filter_stack(pixels, rotation, parameter)
+            else:
+                pixels = image_ops.get_rotated_view(pixels, rotation)
+        out[start:start + chunk] = pixels
+    return out
@@ -0,0 +1,242 @@
+import os
+import time
+import signal
+import logging
+import threading
+import itertools
+import multiprocessing
+
+import utils.metrics as metrics
+
+# Default seconds workers are given to finish requests in flight after SIGTERM before they are stopped
+DRAIN_SECONDS = 30.0
+
+# Seconds between checks of whether worker processes are still running
+POLL_SECONDS = 0.5
+
+# Workers that exit within this many seconds of starting are restarted after a backoff, doubling up to MAX_BACKOFF,
+# so a worker that crashes on startup does not restart in a tight loop
+MIN_UPTIME_SECONDS = 5.0
+MAX_BACKOFF_SECONDS = 30.0
+
+# Seconds the supervisor waits for a worker to answer a request for its metrics
+SNAPSHOT_TIMEOUT = 2.0
+
+def serve_snapshots(connection, server_metrics=None):
+    '''
+    Starts a daemon thread that answers requests for snapshots of server_metrics sent by the supervisor over connection,
+    and stops the worker once the supervisor has gone.
+
+    Each request is a sequence number, and is answered with (sequence number, ServerMetrics.get_snapshot()),
+    so the supervisor can discard answers to requests it has given up on.
+    The pipe is closed when the supervisor exits, even if it is killed without stopping its workers, and the worker
+    then sends itself SIGTERM, so it drains requests in flight and exits instead of outliving the supervisor.
+
+        Parameters:
+            connection (multiprocessing.connection.Connection): Worker end of the pipe to the supervisor
+            server_metrics (ServerMetrics): Metrics of the worker, or None if metrics are disabled
+        Returns:
+            None
+    '''
+
+    def answer():
+        try:
+            while True:
+                sequence = connection.recv()
+                connection.send((sequence, server_metrics.get_snapshot() if server_metrics is not None else None))
+        except (EOFError, OSError):
+            logging.info('Supervisor has exited, stopping worker with pid %d', os.getpid())
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=answer, daemon=True).start()
+
+class Worker:
+    '''
+    Worker process of a Supervisor, and the supervisor end of the pipe its metrics are requested over.
+    '''
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+class Supervisor:
+    '''
+    Runs a fixed number of server worker processes that share one listening port, so request handling
+    is not limited by the GIL of a single process.
+
+    Each worker runs target(*args, connection) in a spawned process, which starts its own gRPC server on the
+    same address with SO_REUSEPORT so the kernel spreads connections across workers. Workers that exit are restarted,
+    after a backoff if they exited soon after starting. stop() sends every worker SIGTERM, which lets it finish
+    requests in flight for up to drain_seconds, and kills workers that are still running after that.
+    The metrics of all workers are gathered over their pipes and added together by render().
+
+    ...
+
+    Attributes
+    ----------
+    target : function
+        Function that runs a server in a worker process, called with args followed by the worker's pipe connection.
+    args : tuple
+        Arguments target is called with.
+    num_workers : int
+        Number of worker processes.
+    drain_seconds : float
+        Seconds workers are given to finish requests in flight after SIGTERM.
+    metrics : ServerMetrics
+        Metrics of the supervisor itself, counting worker restarts.
+    workers : list
+        Worker of each worker slot, or None before it is started.
+
+    Methods
+    -------
+    start():
+        Starts every worker process.
+    check_workers():
+        Restarts worker processes that have exited.
+    stop():
+        Stops every worker process, letting them drain requests in flight.
+    run():
+        Starts the workers, restarts them until SIGTERM or SIGINT, and stops them.
+    render():
+        Returns the metrics of all workers added together, in Prometheus text format.
+    '''
+
+    def __init__(self, target, args, num_workers, drain_seconds=DRAIN_SECONDS):
+        self.target = target
+        self.args = args
+        self.num_workers = num_workers
+        self.drain_seconds = drain_seconds
+        self.metrics = metrics.ServerMetrics()
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [None] * num_workers
+        self.backoff = [0.0] * num_workers
+        self.restart_at = [None] * num_workers
+        self.sequence = itertools.count()
+        self.stopping = False
+
+    def start_worker(self, index):
+        '''
+        Starts the worker process of slot index.
+        '''
+        connection, worker_connection = self.context.Pipe()
+        process = self.context.Process(target=self.target, args=self.args + (worker_connection,), name='server-worker-' + str(index))
+        process.start()
+        worker_connection.close()
+        self.workers[index] = Worker(process, connection)
+        logging.info('Started worker %d with pid %d', index, process.pid)
+
+    def start(self):
+        '''
+        Starts every worker process.
+        '''
+        for index in range(self.num_workers):
+            self.start_worker(index)
+
+    def check_workers(self):
+        '''
+        Restarts worker processes that have exited, unless the supervisor is stopping.
+
+        Workers that ran for less than MIN_UPTIME_SECONDS are restarted after a backoff that doubles with each
+        such exit, up to MAX_BACKOFF_SECONDS.
+        '''
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if self.stopping or worker.process.is_alive():
+                continue
+
+            if self.restart_at[index] is None:
+                if now - worker.started < MIN_UPTIME_SECONDS:
+                    self.backoff[index] = min(max(self.backoff[index] * 2, POLL_SECONDS), MAX_BACKOFF_SECONDS)
+                else:
+                    self.backoff[index] = 0.0
+                self.restart_at[index] = now + self.backoff[index]
+                logging.error('Worker %d with pid %d exited with code %s, restarting in %.1f s',
+                              index, worker.process.pid, worker.process.exitcode, self.backoff[index])
+
+            if now >= self.restart_at[index]:
+                self.restart_at[index] = None
+                with worker.lock:
+                    worker.connection.close()
+                self.metrics.worker_restarts.inc()
+                self.start_worker(index)
+
+    def stop(self):
+        '''
+        Sends every worker process SIGTERM, waits up to drain_seconds plus POLL_SECONDS for them to finish requests
+        in flight and exit, and kills any that are still running.
+        '''
+        self.stopping = True
+        for worker in self.workers:
+            if worker is not None and worker.process.is_alive():
+                worker.process.terminate()
+
+        deadline = time.monotonic() + self.drain_seconds + POLL_SECONDS
+        for index, worker in enumerate(self.workers):
+            if worker is None:
+                continue
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logging.error('Worker %d with pid %d did not drain in time, killing it', index, worker.process.pid)
+                worker.process.kill()
+                worker.process.join()
+            with worker.lock:
+                worker.connection.close()
+
+    def request_stop(self, signum, frame):
+        self.stopping = True
+
+    def forward_signal(self, signum, frame):
+        for worker in self.workers:
+            if worker is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, signum)
+
+    def run(self):
+        '''
+        Starts the workers, and restarts them as they exit until the supervisor receives SIGTERM or SIGINT,
+        then stops them. SIGUSR1 is forwarded to every worker, so it arms their request profilers.
+        Must be called from the main thread.
+        '''
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.forward_signal)
+
+        self.start()
+        while not self.stopping:
+            time.sleep(POLL_SECONDS)
+            self.check_workers()
+        self.stop()
+
+    def get_snapshot(self, worker):
+        '''
+        Returns the metrics snapshot of a worker, or None if it does not answer within SNAPSHOT_TIMEOUT seconds.
+        '''
+        with worker.lock:
+            sequence = next(self.sequence)
+            try:
+                worker.connection.send(sequence)
+                deadline = time.monotonic() + SNAPSHOT_TIMEOUT
+                while worker.connection.poll(max(deadline - time.monotonic(), 0)):
+                    answer, snapshot = worker.connection.recv()
+                    if answer == sequence:
+                        return snapshot
+            except (EOFError, OSError):
+                pass
+        return None
+
+    def render(self):
+        '''
+        Returns the metrics of the supervisor and all workers that answered, added together in Prometheus text format.
+
+        Metrics of workers that have restarted only count requests since their restart.
+        '''
+        aggregate = metrics.ServerMetrics()
+        aggregate.add_snapshot(self.metrics.get_snapshot())
+        for worker in list(self.workers):
+            if worker is not None and worker.process.is_alive():
+                snapshot = self.get_snapshot(worker)
+                if snapshot is not None:
+                    aggregate.add_snapshot(snapshot)
+        return aggregate.render()
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import itertools
+
+import image_pb2
+
+# Number of requests captured when the profiler is armed without a request or time limit
+DEFAULT_REQUESTS = 10
+
+# Default seconds between stack samples in 'sample' mode
+SAMPLE_INTERVAL = 0.001
+
+# File extension of the profiles written in each mode
+PROFILE_EXTENSIONS = {'cprofile': 'pstats', 'sample': 'collapsed'}
+
+def get_image_mode(image):
+    '''
+    Returns 'L', 'RGB', or 'RGBA' mode of Image, its encoding name if it holds an encoded file,
+    or 'unknown' if its dimensions are not valid
+    '''
+    if image.encoding in image_pb2.Image.Encoding.values() and image.encoding != image_pb2.Image.Encoding.RAW:
+        return image_pb2.Image.Encoding.Name(image.encoding)
+    if image.width <= 0 or image.height <= 0:
+        return 'unknown'
+    num_bands = len(image.data) // (image.width * image.height)
+    return {1: 'L', 3: 'RGB', 4: 'RGBA'}.get(num_bands, 'unknown')
+
+def get_frame_name(frame):
+    '''
+    Returns name of a stack frame in collapsed-stack format, e.g. 'mean_filter_band (image_ops.py:87)'
+    '''
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+class StackSampler:
+    '''
+    Samples the call stack of one thread at a fixed interval from a background thread,
+    and counts how often each stack is seen.
+
+    ...
+
+    Attributes
+    ----------
+    thread_id : int
+        Identifier of the thread whose stack is sampled.
+    interval : float
+        Seconds between samples.
+    counts : dict
+        Number of samples of each stack, keyed by tuple of frame names from the outermost frame.
+
+    Methods
+    -------
+    start():
+        Starts sampling.
+    stop():
+        Stops sampling and waits for the sampling thread to exit.
+    get_collapsed():
+        Returns the samples in collapsed-stack format.
+    '''
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(get_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        '''
+        Starts sampling the stack of thread_id.
+        '''
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops sampling and waits for the sampling thread to exit.
+        '''
+        self.stopped.set()
+        self.thread.join()
+
+    def get_collapsed(self):
+        '''
+        Returns the samples in collapsed-stack format, one 'outer;...;inner count' line per stack,
+        as read by flamegraph.pl and speedscope.
+        '''
+        return ''.join('{} {}\n'.format(';'.join(stack), count) for stack, count in sorted(self.counts.items()))
+
+class RequestProfiler:
+    '''
+    Captures profiles of live requests on demand, without restarting the server.
+
+    The profiler starts disarmed, and arm() makes it capture the next requests until a request count or time limit
+    is reached. Each captured request is profiled on the thread that handles it, either with cProfile ('cprofile'
+    mode, written as pstats) or by sampling its call stack ('sample' mode, written as collapsed stacks).
+    Work the request hands to other threads, such as parallel mean filter row bands, is not included.
+    Each profile is written to output_dir next to a JSON file of the method, image size and mode, and duration
+    of the request. While disarmed, the only cost to a request is reading the armed attribute.
+
+    ...
+
+    Attributes
+    ----------
+    mode : str
+        'cprofile' or 'sample'.
+    output_dir : str
+        Directory that profiles are written to.
+    interval : float
+        Seconds between stack samples in 'sample' mode.
+    armed : bool
+        True while requests are being captured.
+
+    Methods
+    -------
+    arm(requests=None, seconds=None):
+        Captures the next requests, up to a count or until a time limit.
+    disarm():
+        Stops capturing requests.
+    run(method, image, function, *args):
+        Runs function with args, capturing a profile of it if the profiler is armed.
+    '''
+
+    def __init__(self, mode='cprofile', output_dir='profiles', interval=SAMPLE_INTERVAL):
+        if mode not in PROFILE_EXTENSIONS:
+            raise ValueError('profile mode is not valid')
+        self.mode = mode
+        self.output_dir = output_dir
+        self.interval = interval
+        self.armed = False
+        self.lock = threading.Lock()
+        # cProfile profilers cannot run concurrently on newer Pythons, so cProfile captures one request at a time
+        self.capture_lock = threading.Lock()
+        self.remaining = None
+        self.deadline = None
+        self.sequence = itertools.count(1)
+
+    def arm(self, requests=None, seconds=None):
+        '''
+        Captures the next requests, until requests requests have been captured or seconds seconds have passed,
+        whichever comes first. Captures DEFAULT_REQUESTS requests if neither limit is given.
+        '''
+        if requests is None and seconds is None:
+            requests = DEFAULT_REQUESTS
+        with self.lock:
+            self.remaining = requests
+            self.deadline = time.monotonic() + seconds if seconds is not None else None
+            self.armed = True
+
+    def disarm(self):
+        '''
+        Stops capturing requests.
+        '''
+        with self.lock:
+            self.armed = False
+
+    def claim(self):
+        '''
+        Returns True if the calling request should be captured, and counts it towards the request limit.
+        '''
+        with self.lock:
+            if not self.armed:
+                return False
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.armed = False
+                return False
+            if self.remaining is not None:
+                self.remaining -= 1
+                if self.remaining <= 0:
+                    self.armed = False
+            return True
+
+    def run(self, method, image, function, *args):
+        '''
+        Runs function with args and returns its result, capturing a profile of it if the profiler is armed.
+
+        Exceptions raised by function are re-raised after its profile is written.
+
+            Parameters:
+                method (str): Name of the RPC being handled, used in the profile file name
+                image (Image): gRPC Image object of the request, whose size and mode are recorded with the profile
+                function (function): Function that handles the request
+                args: Arguments to pass to function
+            Returns:
+                Result of function
+        '''
+        if not self.armed:
+            return function(*args)
+
+        if self.mode == 'cprofile':
+            if not self.capture_lock.acquire(blocking=False):
+                return function(*args)
+            try:
+                if not self.claim():
+                    return function(*args)
+                profile = cProfile.Profile()
+                started = time.perf_counter()
+                try:
+                    return profile.runcall(function, *args)
+                finally:
+                    seconds = time.perf_counter() - started
+                    self.write(method, image, seconds, lambda path: profile.dump_stats(path))
+            finally:
+                self.capture_lock.release()
+
+        if not self.claim():
+            return function(*args)
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            return function(*args)
+        finally:
+            sampler.stop()
+            seconds = time.perf_counter() - started
+            self.write(method, image, seconds, lambda path: self.write_text(path, sampler.get_collapsed()))
+
+    def write_text(self, path, text):
+        with open(path, 'w') as file:
+            file.write(text)
+
+    def write(self, method, image, seconds, dump):
+        '''
+        Writes a profile with dump(path), and a JSON file describing the request next to it.
+        '''
+        os.makedirs(self.output_dir, exist_ok=True)
+        mode = get_image_mode(image)
+        name = '{}-{:04d}-{}-{}x{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), next(self.sequence), method,
+                                                image.width, image.height, mode)
+        path = os.path.join(self.output_dir, name)
+        dump(path + '.' + PROFILE_EXTENSIONS[self.mode])
+        info = {'method': method, 'width': image.width, 'height': image.height, 'mode': mode, 'seconds': seconds,
+                'profile_mode': self.mode}
+        self.write_text(path + '.json', json.dumps(info, indent=2))
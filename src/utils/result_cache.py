@@ -0,0 +1,271 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import image_pb2
+
+def make_key(image, stages):
+    '''
+    Returns content hash identifying the result of running stages on Image
+
+    Hashes the planned stages together with the width, height, color, and data of Image using BLAKE2b,
+    so requests for the same operations on the same pixels map to the same key.
+
+        Parameters:
+            image (Image): gRPC Image object the stages are run on
+            stages (list): List of (type, rotation, parameter) tuples, as returned by pipeline.plan_operations
+        Returns:
+            (str): Hex digest of the hash
+    '''
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((stages, image.width, image.height, image.color)).encode())
+    digest.update(image.data)
+    return digest.hexdigest()
+
+class ResultCache:
+    '''
+    Thread-safe cache of processed Images, keyed by content hash and evicted in least recently used order.
+
+    The in-memory tier is bounded by the total size in bytes of the cached Image data, rather than the number of entries.
+    If disk_dir is given, Images evicted from memory are written to an on-disk second tier bounded by disk_max_bytes,
+    and are moved back into memory the next time they are requested. Files are read, written, and deleted
+    outside the lock, so lookups never wait on disk I/O other than their own.
+
+    ...
+
+    Attributes
+    ----------
+    max_bytes : int
+        Max total size in bytes of Image data held in memory.
+    disk_dir : str
+        Optional directory of the on-disk tier.
+    disk_max_bytes : int
+        Max total size in bytes of the files in the on-disk tier.
+    hits : int
+        Number of lookups answered from memory.
+    disk_hits : int
+        Number of lookups answered from disk.
+    misses : int
+        Number of lookups not found in either tier.
+    evictions : int
+        Number of entries evicted from memory.
+
+    Methods
+    -------
+    get(key):
+        Returns cached Image for key, or None.
+    put(key, image):
+        Adds Image to the cache under key.
+    stats():
+        Returns dictionary of cache counters and sizes.
+    '''
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        '''
+        Creates an empty cache, indexing any entries already in disk_dir from oldest to newest.
+        '''
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.lock = threading.Lock()
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk_entries = OrderedDict()
+        self.disk_size = 0
+        self.writing = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            paths = [os.path.join(disk_dir, name) for name in os.listdir(disk_dir) if name.endswith('.bin')]
+            for path in sorted(paths, key=os.path.getmtime):
+                self.disk_entries[os.path.basename(path)[:-len('.bin')]] = os.path.getsize(path)
+                self.disk_size += os.path.getsize(path)
+            self.delete_files(self.trim_disk())
+
+    def get_disk_path(self, key):
+        '''
+        Returns path of the file holding key in the on-disk tier.
+        '''
+        return os.path.join(self.disk_dir, key + '.bin')
+
+    def get(self, key):
+        '''
+        Returns cached Image for key, marking it as most recently used, or None if key is not cached.
+
+        Images found on disk are read outside the lock, so lookups of other keys do not wait on file I/O.
+
+            Parameters:
+                key (str): Key returned by make_key
+            Returns:
+                (Image): Cached gRPC Image object, or None
+        '''
+        with self.lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return image
+
+            image = self.writing.pop(key, None)
+            if image is not None:
+                self.hits += 1
+                evicted = self.add_to_memory(key, image)
+            elif key in self.disk_entries:
+                self.disk_size -= self.disk_entries.pop(key)
+            else:
+                self.misses += 1
+                return None
+
+        if image is not None:
+            self.write_to_disk(evicted)
+            return image
+
+        path = self.get_disk_path(key)
+        try:
+            with open(path, 'rb') as file:
+                image = image_pb2.Image.FromString(file.read())
+        except OSError:
+            image = None
+        self.delete_files([path])
+
+        with self.lock:
+            if image is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            evicted = self.add_to_memory(key, image) if key not in self.entries else []
+        self.write_to_disk(evicted)
+        return image
+
+    def put(self, key, image):
+        '''
+        Adds Image to the cache under key as the most recently used entry, evicting least recently used entries
+        until the cache is within max_bytes. Images larger than max_bytes are not cached.
+
+            Parameters:
+                key (str): Key returned by make_key
+                image (Image): gRPC Image object to cache
+            Returns:
+                None
+        '''
+        if len(image.data) > self.max_bytes:
+            return
+
+        paths = []
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            self.writing.pop(key, None)
+            if key in self.disk_entries:
+                self.disk_size -= self.disk_entries.pop(key)
+                paths.append(self.get_disk_path(key))
+            evicted = self.add_to_memory(key, image)
+        self.delete_files(paths)
+        self.write_to_disk(evicted)
+
+    def add_to_memory(self, key, image):
+        '''
+        Adds Image to the in-memory tier, evicting least recently used entries, and returns list of (key, Image)
+        of the evicted entries to write to disk with write_to_disk, which is empty if there is no on-disk tier.
+        Must be called with lock held.
+        '''
+        self.entries[key] = image
+        self.size += len(image.data)
+
+        evicted = []
+        while self.size > self.max_bytes:
+            evicted_key, evicted_image = self.entries.popitem(last=False)
+            self.size -= len(evicted_image.data)
+            self.evictions += 1
+            if self.disk_dir is not None:
+                self.writing[evicted_key] = evicted_image
+                evicted.append((evicted_key, evicted_image))
+        return evicted
+
+    def write_to_disk(self, evicted):
+        '''
+        Writes each evicted (key, Image) to the on-disk tier, deleting least recently used files to stay within
+        disk_max_bytes. Must be called without lock held.
+
+        Entries are readable from memory while they are written. Entries requested or put again before their write
+        finishes are not added to the on-disk tier. If a file cannot be written, for example because disk_dir is full
+        or read-only, the error is logged and the entry is dropped.
+        '''
+        for key, image in evicted:
+            data = image.SerializeToString()
+            temp_path = self.get_disk_path(key) + '.' + str(threading.get_ident()) + '.tmp'
+            written = False
+            if len(data) <= self.disk_max_bytes:
+                try:
+                    with open(temp_path, 'wb') as file:
+                        file.write(data)
+                    written = True
+                except OSError as ex:
+                    logging.error('Failed to write result cache file ' + temp_path + ' - ' + str(ex))
+                    self.delete_files([temp_path])
+
+            paths = [temp_path] if written else []
+            with self.lock:
+                if self.writing.get(key) is image:
+                    del self.writing[key]
+                    if written:
+                        try:
+                            os.replace(temp_path, self.get_disk_path(key))
+                            self.disk_entries[key] = len(data)
+                            self.disk_size += len(data)
+                            paths = self.trim_disk()
+                        except OSError as ex:
+                            logging.error('Failed to write result cache file ' + self.get_disk_path(key) + ' - ' + str(ex))
+            self.delete_files(paths)
+
+    def delete_files(self, paths):
+        '''
+        Deletes files of the on-disk tier, ignoring files that are already gone. Must be called without lock held.
+        '''
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def trim_disk(self):
+        '''
+        Removes least recently used entries until the on-disk tier is within disk_max_bytes, and returns list of
+        the paths of their files to delete with delete_files. Must be called with lock held.
+        '''
+        paths = []
+        while self.disk_size > self.disk_max_bytes:
+            key, size = self.disk_entries.popitem(last=False)
+            self.disk_size -= size
+            paths.append(self.get_disk_path(key))
+        return paths
+
+    def stats(self):
+        '''
+        Returns dictionary of cache counters and sizes.
+
+            Parameters:
+                None
+            Returns:
+                (dict): Dictionary of hits, disk_hits, misses, evictions, entries, bytes, disk_entries, and disk_bytes
+        '''
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'disk_entries': len(self.disk_entries),
+                'disk_bytes': self.disk_size,
+            }
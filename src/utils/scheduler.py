@@ -0,0 +1,235 @@
+import math
+import time
+import heapq
+import threading
+import itertools
+import contextlib
+
+import utils.cancellation as cancellation
+
+# Priority classes, in the order they are scheduled
+PRIORITIES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+
+# Request metadata key that clients set the priority class of a request with
+PRIORITY_METADATA_KEY = 'priority'
+
+# Seconds a request waits before it is scheduled as if it were one priority class higher
+AGING_SECONDS = 1.0
+
+# Requests without a deadline, or with a later one, are ordered shortest job first among themselves, and against
+# requests with deadlines as if their deadline was this many seconds after they arrived, so they are not starved
+# by a stream of requests with near deadlines
+MAX_DEADLINE_SECONDS = 30.0
+
+# Deadlines within the same slot of this many seconds are treated as equal, and ordered shortest job first
+DEADLINE_SLOT_SECONDS = 0.05
+
+# Seconds between checks of whether a request waiting for a slot has been stopped
+POLL_SECONDS = 0.05
+
+# Seconds of queueing that each estimated second of compute is weighted as when ordering shortest job first,
+# so a long job is only passed by shorter jobs that arrive within this multiple of its own cost
+SJF_WEIGHT = 10.0
+
+def get_priority(metadata):
+    '''
+    Returns priority class that a request sets in its invocation metadata, or DEFAULT_PRIORITY if it does not set one
+
+    The value is not validated here, so invalid priorities are rejected by validate_priority where requests
+    are aborted with INVALID_ARGUMENT.
+
+        Parameters:
+            metadata (iterable): Metadata of the request, as (key, value) pairs, or None
+        Returns:
+            (str): Priority class
+    '''
+    for key, value in metadata or ():
+        if key == PRIORITY_METADATA_KEY:
+            return value
+    return DEFAULT_PRIORITY
+
+def validate_priority(priority):
+    '''
+    Raises ValueError if priority is not one of PRIORITIES
+    '''
+    if priority not in PRIORITIES:
+        raise ValueError('priority must be one of ' + ', '.join(PRIORITIES))
+
+def get_context_priority(context):
+    '''
+    Returns priority class of the request of a grpc context, or DEFAULT_PRIORITY if there is no context
+    '''
+    return get_priority(context.invocation_metadata() if context is not None else None)
+
+class PriorityScheduler:
+    '''
+    Gives a fixed number of compute slots to waiting requests in order of priority class, then earliest deadline,
+    then shortest estimated job first, so bursts of large low-priority jobs do not hold up small interactive ones.
+
+    Requests that find a free slot and no other request waiting start immediately. Otherwise they wait, and each
+    slot that is released is handed straight to the best waiting request. Waiting requests that are cancelled
+    or pass their deadline leave the queue without taking a slot. Starvation is bounded in three ways:
+    a request is scheduled one priority class higher for every aging_seconds it has waited, requests without a deadline
+    are scheduled as if it was MAX_DEADLINE_SECONDS after they arrived, and shortest job first only lets shorter jobs
+    pass a long job for SJF_WEIGHT times its estimated cost.
+
+    ...
+
+    Attributes
+    ----------
+    slots : int
+        Number of requests that may run at once.
+    aging_seconds : float
+        Seconds of waiting that raise a request by one priority class.
+    running : int
+        Number of slots held by running requests.
+
+    Methods
+    -------
+    acquire(priority, deadline=None, cost=0.0, check=None):
+        Waits for a compute slot, and holds it.
+    release():
+        Hands the slot to the best waiting request, or frees it.
+    slot(priority, deadline=None, cost=0.0, check=None):
+        Context manager that holds a compute slot while its block runs.
+    get_waiting(priority=None):
+        Returns the number of requests waiting for a slot.
+    '''
+
+    def __init__(self, slots, aging_seconds=AGING_SECONDS, metrics=None):
+        self.slots = slots
+        self.aging_seconds = aging_seconds
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.queues = {priority: ([], []) for priority in PRIORITIES}
+        self.sequence = itertools.count()
+        self.running = 0
+
+    def push(self, priority, arrived, deadline, cost, ready):
+        '''
+        Adds a waiting request to the queues of its priority class. Must hold lock.
+
+        Requests with a deadline are kept in order of deadline slot, then aged shortest job first, and the others
+        in aged shortest job first order, which lets a request be passed by later ones for SJF_WEIGHT times its cost.
+        '''
+        deadlines, others = self.queues[priority]
+        aged_cost = arrived + cost * SJF_WEIGHT
+        if deadline is not None and deadline < arrived + MAX_DEADLINE_SECONDS:
+            heapq.heappush(deadlines, ((math.floor(deadline / DEADLINE_SLOT_SECONDS), aged_cost), next(self.sequence), arrived, deadline, ready))
+        else:
+            heapq.heappush(others, (aged_cost, next(self.sequence), arrived, arrived + MAX_DEADLINE_SECONDS, ready))
+
+    def remove(self, priority, ready):
+        '''
+        Removes the waiting request with Event ready from the queues of its priority class. Must hold lock.
+
+        Returns False if the request is no longer waiting, because it has just been handed a slot.
+        '''
+        for queue in self.queues[priority]:
+            for index, entry in enumerate(queue):
+                if entry[-1] is ready:
+                    queue[index] = queue[-1]
+                    queue.pop()
+                    heapq.heapify(queue)
+                    return True
+        return False
+
+    def pop_next(self, now):
+        '''
+        Removes and returns the Event of the best waiting request, or None if no request is waiting. Must hold lock.
+
+        Only the first request of each queue is compared, by its priority class raised by the time it has waited,
+        then by its deadline.
+        '''
+        best = None
+        for rank, priority in enumerate(PRIORITIES):
+            for queue in self.queues[priority]:
+                if queue:
+                    _, _, arrived, deadline, _ = queue[0]
+                    order = (max(rank - int((now - arrived) / self.aging_seconds), 0), deadline)
+                    if best is None or order < best[0]:
+                        best = (order, queue)
+        if best is None:
+            return None
+        return heapq.heappop(best[1])[-1]
+
+    def acquire(self, priority, deadline=None, cost=0.0, check=None):
+        '''
+        Waits until the request is given a compute slot, and holds it.
+
+        Raises ValueError if priority is not one of PRIORITIES.
+        While it waits, the request checks every POLL_SECONDS whether it has passed its deadline, raising
+        DeadlineExceededError, and calls check, which can raise to stop waiting. A request that stops waiting
+        is removed from the queue, and never takes a slot.
+        The time spent waiting is recorded in metrics by priority class.
+
+            Parameters:
+                priority (str): Priority class of the request, one of PRIORITIES
+                deadline (float): time.monotonic() value the request must finish by, or None
+                cost (float): Estimated seconds of compute of the request
+                check (function): Optional function called while the request waits, that can raise to stop waiting
+            Returns:
+                None
+        '''
+        validate_priority(priority)
+
+        arrived = time.monotonic()
+        with self.lock:
+            if self.running < self.slots and not any(queue for queues in self.queues.values() for queue in queues):
+                self.running += 1
+                ready = None
+            else:
+                ready = threading.Event()
+                self.push(priority, arrived, deadline, cost, ready)
+                if self.metrics is not None:
+                    self.metrics.scheduler_queued.inc(priority)
+
+        if ready is not None:
+            try:
+                while not ready.wait(POLL_SECONDS):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise cancellation.DeadlineExceededError('deadline passed while waiting for a compute slot')
+                    if check is not None:
+                        check()
+            except BaseException:
+                with self.lock:
+                    removed = self.remove(priority, ready)
+                if not removed:
+                    self.release()
+                raise
+            finally:
+                if self.metrics is not None:
+                    self.metrics.scheduler_queued.dec(priority)
+        if self.metrics is not None:
+            self.metrics.scheduler_wait.observe(time.monotonic() - arrived, priority)
+
+    def release(self):
+        '''
+        Hands the slot of a finished request to the best waiting request, or frees it if no request is waiting.
+        '''
+        with self.lock:
+            ready = self.pop_next(time.monotonic())
+            if ready is None:
+                self.running -= 1
+                return
+        ready.set()
+
+    @contextlib.contextmanager
+    def slot(self, priority, deadline=None, cost=0.0, check=None):
+        '''
+        Context manager that acquires a compute slot, and releases it when its block exits.
+        '''
+        self.acquire(priority, deadline, cost, check)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_waiting(self, priority=None):
+        '''
+        Returns the number of requests waiting for a slot, in one priority class or in all of them.
+        '''
+        with self.lock:
+            priorities = [priority] if priority is not None else PRIORITIES
+            return sum(len(queue) for priority in priorities for queue in self.queues[priority])
@@ -0,0 +1,99 @@
+import threading
+from concurrent import futures
+
+# Seconds between checks of whether a call waiting for the result of another call should stop waiting
+POLL_SECONDS = 0.05
+
+class SingleFlight:
+    '''
+    Deduplicates concurrent calls that share a key, so only one of them runs and all of them receive its result.
+
+    The first caller for a key becomes the leader and runs the function on its own thread. Callers arriving with the
+    same key while the leader is running wait for its result instead of running the function again. The leader runs
+    the function to completion whether or not its own client is still waiting, so its waiters are always answered.
+    Waiters can stop waiting early, and are then no longer counted by get_waiters, so the function can check
+    get_waiters to stop once nobody is waiting for its result.
+
+    ...
+
+    Attributes
+    ----------
+    leaders : int
+        Number of calls that ran the function.
+    shared : int
+        Number of calls that received the result of another call.
+
+    Methods
+    -------
+    do(key, function, *args, check=None):
+        Returns result of function(*args), sharing it with concurrent calls for the same key.
+    get_waiters(key):
+        Returns number of calls waiting for the in-flight call of key.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.waiters = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, function, *args, check=None):
+        '''
+        Returns result of function(*args), or of the in-flight call with the same key if there is one.
+
+        Exceptions raised by function are raised in the leader and in every waiter. A waiter calls check every
+        POLL_SECONDS while it waits, and stops waiting if check raises, letting the exception propagate.
+
+            Parameters:
+                key (str): Key identifying calls that produce the same result
+                function (function): Function to call
+                args: Arguments to call function with
+                check (function): Optional function a waiting call calls to find out whether to stop waiting
+            Returns:
+                Result of function(*args)
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = futures.Future()
+                self.calls[key] = call
+                self.waiters[key] = 0
+                self.leaders += 1
+                is_leader = True
+            else:
+                self.waiters[key] += 1
+                self.shared += 1
+                is_leader = False
+
+        if is_leader:
+            try:
+                call.set_result(function(*args))
+            except BaseException as ex:
+                call.set_exception(ex)
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                    del self.waiters[key]
+            return call.result()
+
+        try:
+            while check is not None and not futures.wait([call], POLL_SECONDS).done:
+                check()
+            return call.result()
+        finally:
+            with self.lock:
+                if self.calls.get(key) is call:
+                    self.waiters[key] -= 1
+
+    def get_waiters(self, key):
+        '''
+        Returns number of calls still waiting for the in-flight call of key, not counting the leader.
+
+            Parameters:
+                key (str): Key identifying calls that produce the same result
+            Returns:
+                (int): Number of waiting calls, or 0 if no call for key is in flight
+        '''
+        with self.lock:
+            return self.waiters.get(key, 0)
@@ -0,0 +1,373 @@
+import numpy as np
+
+import image_pb2
+import utils.image_ops as image_ops
+
+# Target size in bytes of the row band sent in each ImageChunk, well below the max gRPC message size
+CHUNK_SIZE = 1048576
+
+# Size in bytes of Image.data above which the client sends images as chunked streams
+# Leaves headroom below image_utils.MAX_IMAGE_SIZE for the other fields of the request message
+STREAM_THRESHOLD = 4128768
+
+# Target size in bytes of the row bands of MeanFilterBands and RotateImageBands responses
+# Smaller than CHUNK_SIZE, so the first band is computed and sent sooner
+BAND_SIZE = 262144
+
+# Max size in bytes of an image sent as a chunked stream
+MAX_STREAM_IMAGE_SIZE = 268435456
+
+def get_rows_per_chunk(width, num_bands, chunk_size=CHUNK_SIZE):
+    '''
+    Returns number of whole rows that fit in one chunk of chunk_size bytes, with a minimum of one row
+
+        Parameters:
+            width (int): Width in pixels of the image
+            num_bands (int): Number of channels per pixel
+            chunk_size (int): Target size in bytes of each chunk
+        Returns:
+            (int): Number of rows to send in each ImageChunk
+    '''
+    return max(1, chunk_size // (width * num_bands))
+
+def is_valid_header(header):
+    '''
+    Returns True if ImageHeader describes a valid image, False otherwise
+
+    Will return False if width or height is non-positive, if bands is not 1 for a grayscale image or 3 or 4 for a
+    color image, or if the image is greater than max stream size of 268435456 bytes
+
+        Parameters:
+            header (ImageHeader): ImageHeader object from the first message of a stream
+        Returns:
+            (bool): True or False representing ImageHeader validity
+    '''
+    if header.width <= 0 or header.height <= 0:
+        return False
+    elif header.bands not in ([3, 4] if header.color else [1]):
+        return False
+    elif header.width * header.height * header.bands > MAX_STREAM_IMAGE_SIZE:
+        return False
+    else:
+        return True
+
+def band_to_chunk(band, row_start):
+    '''
+    Returns ImageChunk holding a band of rows
+
+        Parameters:
+            band (numpy.ndarray): uint8 array of shape (rows, width, bands)
+            row_start (int): Index of the first row of band in the full image
+        Returns:
+            (ImageChunk): ImageChunk with data, row_start, and row_count set
+    '''
+    return image_pb2.ImageChunk(data=band.tobytes(), row_start=row_start, row_count=band.shape[0])
+
+def image_to_chunks(image, rotation=image_pb2.ImageRotateRequest.Rotation.NONE, chunk_size=CHUNK_SIZE):
+    '''
+    Generator that splits Image into an ImageHeader chunk followed by row band chunks
+
+        Parameters:
+            image (Image): gRPC Image object to split
+            rotation (str or int): ImageRotateRequest.Rotation to set in the header, used by RotateImageStream
+            chunk_size (int): Target size in bytes of each row band
+        Yields:
+            (ImageChunk): Header chunk, then row band chunks in order from the top row down
+    '''
+    num_bands = len(image.data) // (image.width * image.height)
+    header = image_pb2.ImageHeader(color=image.color, width=image.width, height=image.height, bands=num_bands, rotation=rotation)
+    yield image_pb2.ImageChunk(header=header)
+
+    data = memoryview(image.data)
+    row_bytes = image.width * num_bands
+    rows_per_chunk = get_rows_per_chunk(image.width, num_bands, chunk_size)
+    for row_start in range(0, image.height, rows_per_chunk):
+        row_count = min(rows_per_chunk, image.height - row_start)
+        band = bytes(data[row_start * row_bytes:(row_start + row_count) * row_bytes])
+        yield image_pb2.ImageChunk(data=band, row_start=row_start, row_count=row_count)
+
+def array_to_chunks(pixels, color, chunk_size=CHUNK_SIZE):
+    '''
+    Generator that splits a pixel array into an ImageHeader chunk followed by row band chunks
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            color (bool): Value of the color field of the header
+            chunk_size (int): Target size in bytes of each row band
+        Yields:
+            (ImageChunk): Header chunk, then row band chunks in order from the top row down
+    '''
+    height, width, num_bands = pixels.shape
+    header = image_pb2.ImageHeader(color=color, width=width, height=height, bands=num_bands)
+    yield image_pb2.ImageChunk(header=header)
+
+    rows_per_chunk = get_rows_per_chunk(width, num_bands, chunk_size)
+    for row_start in range(0, height, rows_per_chunk):
+        yield band_to_chunk(pixels[row_start:row_start + rows_per_chunk], row_start)
+
+def mean_filter_bands(pixels, color, radius=1, chunk_size=BAND_SIZE, check=None):
+    '''
+    Generator that mean filters a pixel array one row band at a time, yielding an ImageChunk header followed by
+    row band chunks as each band is computed
+
+    Each band only reads its own rows and the radius rows above and below it, and only one output band is held in
+    memory at a time, so the full filtered image is never allocated.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            color (bool): Value of the color field of the header
+            radius (int): Number of neighbors either side of each pixel to average over
+            chunk_size (int): Target size in bytes of each row band
+            check (function): Optional function called before each row band, that can raise to stop early
+        Yields:
+            (ImageChunk): Header chunk, then row band chunks in order from the top row down
+    '''
+    height, width, num_bands = pixels.shape
+    yield image_pb2.ImageChunk(header=image_pb2.ImageHeader(color=color, width=width, height=height, bands=num_bands))
+
+    rows_per_chunk = get_rows_per_chunk(width, num_bands, chunk_size)
+    for row_start in range(0, height, rows_per_chunk):
+        if check is not None:
+            check()
+        row_end = min(row_start + rows_per_chunk, height)
+        yield band_to_chunk(image_ops.mean_filter_band(pixels, row_start, row_end, radius=radius), row_start)
+
+def rotate_bands(pixels, color, rotation, chunk_size=BAND_SIZE, check=None):
+    '''
+    Generator that rotates a pixel array one output row band at a time, yielding an ImageChunk header followed by
+    row band chunks of the rotated image as each band is computed
+
+    Only one output band is held in memory at a time, so the full rotated image is never allocated.
+
+        Parameters:
+            pixels (numpy.ndarray): uint8 array of shape (height, width, bands)
+            color (bool): Value of the color field of the header
+            rotation (int): Number of quarter turns to rotate by, matching ImageRotateRequest.Rotation values
+            chunk_size (int): Target size in bytes of each row band
+            check (function): Optional function called before each row band, that can raise to stop early
+        Yields:
+            (ImageChunk): Header chunk, then row band chunks of the rotated image in order from the top row down
+    '''
+    height, width, num_bands = pixels.shape
+    if rotation % 2:
+        height, width = width, height
+    yield image_pb2.ImageChunk(header=image_pb2.ImageHeader(color=color, width=width, height=height, bands=num_bands))
+
+    rows_per_chunk = get_rows_per_chunk(width, num_bands, chunk_size)
+    for row_start in range(0, height, rows_per_chunk):
+        if check is not None:
+            check()
+        row_end = min(row_start + rows_per_chunk, height)
+        yield band_to_chunk(image_ops.rotate_rows(pixels, rotation, row_start, row_end), row_start)
+
+def get_header(chunk):
+    '''
+    Returns the ImageHeader held by the first message of a chunked image stream
+
+    Raises ValueError if the message is missing or does not hold a valid header
+
+        Parameters:
+            chunk (ImageChunk): First ImageChunk of the stream, or None if the stream is empty
+        Returns:
+            (ImageHeader): Validated ImageHeader of the stream
+    '''
+    if chunk is None or chunk.WhichOneof('content') != 'header':
+        raise ValueError('Image stream must start with a header')
+    if not is_valid_header(chunk.header):
+        raise ValueError('Image stream header does not represent a valid image')
+    return chunk.header
+
+def get_row_band(chunk, header, next_row):
+    '''
+    Returns the row band held by a message of a chunked image stream
+
+    Raises ValueError if the message does not hold the next whole rows of the image
+
+        Parameters:
+            chunk (ImageChunk): ImageChunk following the header of the stream
+            header (ImageHeader): Header of the stream, as returned by get_header
+            next_row (int): Index of the first row that has not been received yet
+        Returns:
+            (numpy.ndarray): Read-only uint8 array of shape (rows, width, bands) starting at row next_row
+    '''
+    if chunk.WhichOneof('content') != 'data':
+        raise ValueError('Image stream must only contain row bands after the header')
+    if chunk.row_start != next_row or chunk.row_count <= 0 or next_row + chunk.row_count > header.height:
+        raise ValueError('Image stream row band is out of order or out of bounds')
+    if len(chunk.data) != chunk.row_count * header.width * header.bands:
+        raise ValueError('Image stream row band does not hold whole rows')
+    return np.frombuffer(chunk.data, dtype=np.uint8).reshape(chunk.row_count, header.width, header.bands)
+
+def read_header(chunks):
+    '''
+    Reads and returns the ImageHeader from the first message of a chunked image stream
+
+    Raises ValueError if the stream is empty, does not start with a header, or the header is invalid
+
+        Parameters:
+            chunks (iterator): Iterator of ImageChunk messages
+        Returns:
+            (ImageHeader): Validated ImageHeader of the stream
+    '''
+    return get_header(next(chunks, None))
+
+def read_row_bands(chunks, header):
+    '''
+    Generator that yields the row bands of a chunked image stream as they arrive
+
+    Raises ValueError if a chunk does not hold the next whole rows of the image,
+    or if the stream ends before all rows have been received
+
+        Parameters:
+            chunks (iterator): Iterator of ImageChunk messages, positioned after the header
+            header (ImageHeader): Header of the stream, as returned by read_header
+        Yields:
+            (tuple): (row_start, band) where band is a read-only uint8 array of shape (rows, width, bands)
+    '''
+    next_row = 0
+    for chunk in chunks:
+        band = get_row_band(chunk, header, next_row)
+        yield next_row, band
+        next_row += band.shape[0]
+
+    if next_row != header.height:
+        raise ValueError('Image stream ended before all rows were received')
+
+def chunks_to_image(chunks):
+    '''
+    Assembles Image from a chunked image stream
+
+        Parameters:
+            chunks (iterable): Iterable of ImageChunk messages, starting with the header
+        Returns:
+            (Image): gRPC Image object holding all rows of the stream
+    '''
+    chunks = iter(chunks)
+    header = read_header(chunks)
+    pixels = np.empty((header.height, header.width, header.bands), dtype=np.uint8)
+    for row_start, band in read_row_bands(chunks, header):
+        pixels[row_start:row_start + band.shape[0]] = band
+    return image_pb2.Image(color=header.color, data=pixels.tobytes(), width=header.width, height=header.height)
+
+class RotateStreamProcessor:
+    '''
+    Rotates an image received as row bands of a chunked image stream.
+
+    ...
+
+    Methods
+    -------
+    start():
+        Returns the ImageChunks that are ready to send before any row band has arrived.
+    process(row_start, band):
+        Writes band to its rotated position, and returns the ImageChunks that are ready to send.
+    finish():
+        Returns the remaining ImageChunks of the rotated image.
+    '''
+
+    def __init__(self, header, check=None):
+        '''
+        Allocates the rotated output buffer for the image described by header.
+
+        Raises ValueError if the rotation of header is invalid.
+        If check is given, it is called before each row band is processed and before the result is sent,
+        and can raise to stop early.
+        '''
+        if header.rotation not in image_pb2.ImageRotateRequest.Rotation.values():
+            raise ValueError('rotation string is not valid')
+
+        self.header = header
+        self.check = check
+        height, width = header.height, header.width
+        if header.rotation % 2:
+            height, width = width, height
+        self.rotated = np.empty((height, width, header.bands), dtype=np.uint8)
+
+    def start(self):
+        '''
+        Returns an empty list, since the rotated image is sent once the last band has arrived.
+        '''
+        return []
+
+    def process(self, row_start, band):
+        '''
+        Writes band to its rotated position in the output buffer.
+
+        Returns an empty list, since no output rows are complete until the last band has arrived.
+        '''
+        if self.check is not None:
+            self.check()
+        image_ops.rotate_band_into(band, self.header.rotation, self.rotated, row_start, self.header.height)
+        return []
+
+    def finish(self):
+        '''
+        Returns list of ImageChunks holding the header of the rotated image followed by its row bands.
+        '''
+        if self.check is not None:
+            self.check()
+        return list(array_to_chunks(self.rotated, self.header.color))
+
+class MeanFilterStreamProcessor:
+    '''
+    Applies mean filter to an image received as row bands of a chunked image stream.
+
+    ...
+
+    Methods
+    -------
+    start():
+        Returns the header ImageChunk of the filtered image.
+    process(row_start, band):
+        Stores band, and returns ImageChunks of the output rows that can now be filtered.
+    finish():
+        Returns the remaining ImageChunks of the filtered image.
+    '''
+
+    def __init__(self, header, check=None):
+        '''
+        Allocates the input buffer for the image described by header.
+
+        If check is given, it is called before each row band is processed and when the stream ends,
+        and can raise to stop early.
+        '''
+        self.header = header
+        self.check = check
+        self.pixels = np.empty((header.height, header.width, header.bands), dtype=np.uint8)
+        self.rows_filtered = 0
+
+    def start(self):
+        '''
+        Returns list holding the header ImageChunk of the filtered image, which has the same dimensions as the input.
+        '''
+        header = image_pb2.ImageHeader(color=self.header.color, width=self.header.width, height=self.header.height, bands=self.header.bands)
+        return [image_pb2.ImageChunk(header=header)]
+
+    def process(self, row_start, band):
+        '''
+        Stores band in the input buffer, and returns list holding an ImageChunk of the newly filtered rows.
+
+        The last received row can only be filtered once the row below it has arrived,
+        so the list is empty if no new rows are ready.
+        '''
+        if self.check is not None:
+            self.check()
+        rows_received = row_start + band.shape[0]
+        self.pixels[row_start:rows_received] = band
+
+        rows_ready = rows_received if rows_received == self.header.height else rows_received - 1
+        if rows_ready <= self.rows_filtered:
+            return []
+
+        filtered = image_ops.mean_filter_band(self.pixels, self.rows_filtered, rows_ready)
+        chunk = band_to_chunk(filtered, self.rows_filtered)
+        self.rows_filtered = rows_ready
+        return [chunk]
+
+    def finish(self):
+        '''
+        Returns an empty list, since every row has been returned by process once the last band has arrived.
+        '''
+        if self.check is not None:
+            self.check()
+        return []